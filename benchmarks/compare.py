@@ -0,0 +1,81 @@
+# This Python file uses the following encoding: utf-8
+# Compare two scan_storm.py result files, ie the last release against the current code
+#
+#   python benchmarks/compare.py benchmarks/results/old.json benchmarks/results/new.json
+#
+# Prints each number side by side with the change, and exits with 1 if anything got worse by more
+# than --threshold percent so it can be used as a check before a release.
+
+import argparse
+import json
+import sys
+
+
+# (name, where it is in the results, True if bigger is better, multiplier for the printed unit)
+MEASURES = [
+    ("load ms", ("load_seconds",), False, 1000),
+    ("scans/s", ("scans_per_second",), True, 1),
+    ("scans/s to disk", ("scans_per_second_to_disk",), True, 1),
+    ("latency p50 ms", ("latency_ms", "p50"), False, 1),
+    ("latency p95 ms", ("latency_ms", "p95"), False, 1),
+    ("latency p99 ms", ("latency_ms", "p99"), False, 1),
+    ("bytes/scan", ("bytes_per_scan",), False, 1),
+    ("write bytes/scan", ("write_bytes_per_scan",), False, 1),
+    ("peak RSS MB", ("peak_rss_mb",), False, 1),
+]
+
+
+def value(results, keys):
+    for key in keys:
+        if not isinstance(results, dict) or results.get(key) is None:
+            return None
+        results = results[key]
+    return results
+
+
+def compare(old, new, threshold):
+    rows = []
+    for name, keys, bigger_is_better, scale in MEASURES:
+        rows.append((name, value(old, keys), value(new, keys), bigger_is_better, scale))
+    for stage in sorted(set(old.get("stages", {})) | set(new.get("stages", {}))):
+        rows.append((stage + " p95 ms", value(old, ("stages", stage, "p95_ms")),
+                     value(new, ("stages", stage, "p95_ms")), False, 1))
+
+    worse = []
+    print("{:<20} {:>12} {:>12} {:>9}".format("", "old", "new", "change"))
+    for name, old_value, new_value, bigger_is_better, scale in rows:
+        if old_value is None or new_value is None:
+            print("{:<20} {:>12} {:>12}".format(name, str(old_value), str(new_value)))
+            continue
+        old_value, new_value = old_value * scale, new_value * scale
+        change = (new_value - old_value) / old_value * 100 if old_value else 0.0
+        got_worse = -change > threshold if bigger_is_better else change > threshold
+        print("{:<20} {:>12.3f} {:>12.3f} {:>8.1f}%{}".format(name, old_value, new_value, change,
+                                                             "  worse" if got_worse else ""))
+        if got_worse:
+            worse.append(name)
+    return worse
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two scan_storm.py result files")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent worse that counts as a regression")
+    args = parser.parse_args()
+    with open(args.old) as old_file, open(args.new) as new_file:
+        old, new = json.load(old_file), json.load(new_file)
+    if old.get("params") != new.get("params"):
+        print("Warning: The runs used different settings, old: " + json.dumps(old.get("params")) + " new: " +
+              json.dumps(new.get("params")))
+    print("old: " + str(old.get("commit")) + " " + str(old.get("time")) + "   new: " + str(new.get("commit")) + " " +
+          str(new.get("time")))
+    worse = compare(old, new, args.threshold)
+    if worse:
+        print(str(len(worse)) + " got worse by more than " + str(args.threshold) + "%: " + ", ".join(worse))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,50 @@
+# This Python file uses the following encoding: utf-8
+# A SerialReader that plays back badges instead of opening a port
+#
+# The bytes go through the same framing as real reads. The PN532 and RDM6300 sketches print the number
+# without a line ending, so those styles end each badge with a gap (an empty read). "line" ends each
+# badge with \r\n. Every badge is split into two chunks because that is how it tends to come off a
+# USB serial adapter.
+
+import time
+
+from timeclock.id_reader import SerialReader
+
+
+STYLES = ("rdm6300", "pn532", "line")
+
+
+def badge_chunks(badge, style):
+    data = str(badge).encode('ascii')
+    if style == "line":
+        data += b"\r\n"
+    middle = len(data) // 2
+    return [data[:middle], data[middle:]]
+
+
+class FakeSerialReader(SerialReader):
+    def __init__(self, port, badges=(), style="rdm6300", rate=0.0, **kwargs):
+        super().__init__(port, **kwargs)
+        self.badges = list(badges)
+        self.style = style
+        self.rate = rate        # badges per second, 0 sends them as fast as they can be framed
+        self.sent = 0
+
+    def run(self):
+        self.status("Port connected: " + str(self.port))
+        interval = 1.0 / self.rate if self.rate else 0.0
+        next_send = time.perf_counter()
+        for badge in self.badges:
+            if self._stop_event.is_set():
+                break
+            if interval:
+                delay = next_send - time.perf_counter()
+                if delay > 0:
+                    self._stop_event.wait(delay)
+                next_send += interval
+            for chunk in badge_chunks(badge, self.style):
+                self.frame(chunk)
+            if self.style != "line":
+                # The gap after the badge, like a serial read timing out
+                self.frame(b"")
+            self.sent += 1
@@ -0,0 +1,100 @@
+# This Python file uses the following encoding: utf-8
+# Made up people and attendance files for the benchmarks
+#
+#   python benchmarks/generate.py people people.csv --rows 10000
+#   python benchmarks/generate.py attendance 20210611_attendance.csv --rows 50000 --people people.csv
+#
+# The same seed always gives the same files, so benchmark runs can be compared with each other.
+
+import argparse
+import csv
+import random
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from timeclock.records import RECORD_COLUMNS, TIME_FORMAT  # noqa: E402
+
+
+PEOPLE_COLUMNS = ["ID", "First_Name", "Last_Name", "Student?", "Badge"]
+FIRST_NAMES = ["Andy", "Bob", "Bill", "Sam", "Henry", "Trish", "Billy", "Matt", "Jane", "Maria", "Wei", "Priya",
+               "Omar", "Lena", "Kofi", "Ana", "Yuki", "Noah", "Emma", "Liam"]
+LAST_NAMES = ["Hegemann", "Smith", "Winters", "Hunter", "Baker", "Willams", "Jones", "Garcia", "Nguyen", "Patel",
+              "Kim", "Okafor", "Rossi", "Muller", "Silva", "Cohen", "Ivanova", "Tanaka", "Brown", "Lopez"]
+
+
+# Badge numbers like the readers print them, the RDM6300 gives 10 digits and the PN532 a 32 bit number
+def badge_numbers(count, style="rdm6300", seed=1):
+    rng = random.Random(seed)
+    low, high = (1000000000, 9999999999) if style == "rdm6300" else (1, 2 ** 32 - 1)
+    badges = set()
+    while len(badges) < count:
+        badges.add(rng.randint(low, high))
+    badges = sorted(badges)
+    rng.shuffle(badges)
+    return [str(badge) for badge in badges]
+
+
+# [ID, First_Name, Last_Name, Student?, Badge] rows
+def people_rows(count, style="rdm6300", seed=1):
+    rng = random.Random(seed)
+    return [[str(id), rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), rng.choice(("Yes", "Yes", "Yes", "No")), badge]
+            for id, badge in enumerate(badge_numbers(count, style, seed), start=1)]
+
+
+def write_people(path, count, style="rdm6300", seed=1):
+    rows = people_rows(count, style, seed)
+    with open(path, 'w', newline='', encoding='utf-8') as people_file:
+        writer = csv.writer(people_file)
+        writer.writerow(PEOPLE_COLUMNS)
+        writer.writerows(rows)
+    return rows
+
+
+# An attendance file of count finished sessions spread over the day, the people come from people_rows
+def write_attendance(path, count, people, day=None, seed=1):
+    rng = random.Random(seed)
+    day = datetime.combine((day or datetime.now()).date(), datetime.min.time()) + timedelta(hours=8)
+    with open(path, 'w', newline='', encoding='utf-8') as attendance_file:
+        writer = csv.writer(attendance_file)
+        writer.writerow(RECORD_COLUMNS)
+        for _ in range(count):
+            id, first_name, last_name = rng.choice(people)[:3]
+            time_in = day + timedelta(seconds=rng.randrange(12 * 3600))
+            time_out = time_in + timedelta(seconds=rng.randrange(60, 4 * 3600))
+            writer.writerow([id, first_name, last_name, time_in.strftime(TIME_FORMAT), time_out.strftime(TIME_FORMAT),
+                             rng.choice(("Home", "Home", "Work", "Other")),
+                             round((time_out - time_in).total_seconds() / 3600, 2)])
+
+
+def read_people(path):
+    with open(path, newline='', encoding='utf-8') as people_file:
+        reader = csv.reader(people_file)
+        next(reader)
+        return list(reader)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Make up people and attendance files for benchmarking")
+    parser.add_argument("kind", choices=("people", "attendance"))
+    parser.add_argument("path")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--style", choices=("rdm6300", "pn532"), default="rdm6300", help="badge number style")
+    parser.add_argument("--people", help="people file the attendance is made from (made up if not given)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    if args.kind == "people":
+        write_people(args.path, args.rows, args.style, args.seed)
+    else:
+        people = read_people(args.people) if args.people else people_rows(max(args.rows // 10, 10), args.style,
+                                                                          args.seed)
+        write_attendance(args.path, args.rows, people, seed=args.seed)
+    print("Wrote " + str(args.rows) + " rows to " + args.path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+# This Python file uses the following encoding: utf-8
+# Throughput of badge scans through the headless engine, with made up people and fake badge readers
+#
+#   python benchmarks/scan_storm.py                                     1000 people, 10000 scans, 2 readers
+#   python benchmarks/scan_storm.py --people 100000 --attendance 50000 --scans 50000 --readers 4
+#   python benchmarks/scan_storm.py --rate 20 --style line              20 badges a second from each reader
+#
+# Everything runs in a temporary folder: a people file and optionally a day's attendance file are made
+# with generate.py, then the fake readers play back random badges through the same framing, reader
+# manager, engine and writer thread the command line service uses. The results are printed and saved
+# as json (benchmarks/results/ by default) so runs from different versions can be compared with
+# compare.py.
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.fake_serial import STYLES, FakeSerialReader  # noqa: E402
+from benchmarks.generate import write_attendance, write_people  # noqa: E402
+
+
+# Peak resident memory of this process in MB, or None if it can't be found out
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    try:
+        import psutil
+    except ImportError:
+        return None
+    memory = psutil.Process().memory_info()
+    return round(getattr(memory, "peak_wset", memory.rss) / (1024 * 1024), 1)
+
+
+# Bytes this process has handed to write() so far (Linux only), this counts the sqlite database too
+def written_bytes():
+    try:
+        with open("/proc/self/io") as io:
+            for line in io:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=str(ROOT), capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def storm(args, folder):
+    from timeclock.engine import TimeClockEngine, attendance_file_name
+    from timeclock.id_reader import ReaderManager
+    from timeclock.metrics import Metrics
+    from timeclock.persistence import PersistenceWorker
+
+    import numpy as np
+
+    people = write_people(folder / "people.csv", args.people, "pn532" if args.style == "pn532" else "rdm6300",
+                          args.seed)
+    export_file_name = attendance_file_name()
+    if args.attendance:
+        write_attendance(folder / export_file_name, args.attendance, people, seed=args.seed)
+
+    started = time.perf_counter()
+    metrics = Metrics(window=max(args.scans, 2048))
+    writer = PersistenceWorker(on_error=print, metrics=metrics)
+    writer.start()
+    engine = TimeClockEngine(writer=writer, use_database=args.sqlite, metrics=metrics)
+    engine.load_people(folder / "people.csv")
+    engine.set_paths(folder, export_file_name, datetime.now().date())
+    engine.load()
+    writer.flush()
+    load_seconds = time.perf_counter() - started
+
+    rng = random.Random(args.seed)
+    badges = [rng.choice(people)[4] for _ in range(args.scans)]
+    scanned = threading.Event()
+    manager = ReaderManager(on_scan=lambda event: scanned.set(), reader_factory=FakeSerialReader,
+                            metrics=metrics)
+    latencies = []
+    signed_in = 0
+    bytes_before = writer.bytes_written
+    written_before = written_bytes()
+
+    started = time.perf_counter()
+    for reader in range(args.readers):
+        manager.open("Reader " + str(reader + 1), "fake" + str(reader), badges=badges[reader::args.readers],
+                     style=args.style, rate=args.rate)
+    while len(latencies) < args.scans:
+        if not scanned.wait(10.0):
+            print("Stopped waiting for scans after " + str(len(latencies)) + " of " + str(args.scans))
+            break
+        scanned.clear()
+        for event in manager.drain():
+            metrics.observe("dispatch", time.monotonic() - event.time)
+            with metrics.span("scan"):
+                if engine.toggle_badge(event.badge_id)[1]:
+                    signed_in += 1
+            latencies.append(time.monotonic() - event.time)
+        engine.tick()
+    scan_seconds = time.perf_counter() - started
+    writer.flush()
+    drain_seconds = time.perf_counter() - started
+    bytes_written = writer.bytes_written - bytes_before
+    written_after = written_bytes()
+    all_bytes = written_after - written_before if written_before is not None else None
+    manager.close_all()
+    engine.close()
+    writer.stop()
+
+    scans = len(latencies)
+    p50, p95, p99 = np.percentile(latencies, (50, 95, 99)).tolist() if latencies else (0.0, 0.0, 0.0)
+    return {
+        "load_seconds": round(load_seconds, 4),
+        "scans": scans,
+        "signed_in": signed_in,
+        "signed_out": scans - signed_in,
+        "scan_seconds": round(scan_seconds, 4),
+        "scans_per_second": round(scans / scan_seconds, 1) if scan_seconds else None,
+        "scans_per_second_to_disk": round(scans / drain_seconds, 1) if drain_seconds else None,
+        "latency_ms": {"p50": round(p50 * 1000, 3), "p95": round(p95 * 1000, 3), "p99": round(p99 * 1000, 3),
+                       "max": round(max(latencies, default=0.0) * 1000, 3)},
+        "bytes_written": bytes_written,
+        "bytes_per_scan": round(bytes_written / scans, 1) if scans else None,
+        "write_bytes_per_scan": round(all_bytes / scans, 1) if scans and all_bytes is not None else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": json.loads(metrics.to_json())["stages"],
+    }
+
+
+def report(results):
+    print("{} people, {} attendance rows, {} scans from {} {} readers".format(
+        results["params"]["people"], results["params"]["attendance"], results["scans"], results["params"]["readers"],
+        results["params"]["style"]))
+    print("  load            {:9.1f} ms".format(results["load_seconds"] * 1000))
+    print("  scans/s         {:9.1f}   ({:.1f} until written to disk)".format(results["scans_per_second"] or 0,
+                                                                            results["scans_per_second_to_disk"] or 0))
+    latency = results["latency_ms"]
+    print("  latency         p50 {p50:.3f} ms   p95 {p95:.3f} ms   p99 {p99:.3f} ms   max {max:.3f} ms".format(
+        **latency))
+    print("  bytes/scan      {:9.1f}   ({} bytes to the csv and journal files, {} a scan to write() in total)".format(
+        results["bytes_per_scan"] or 0, results["bytes_written"], results["write_bytes_per_scan"]))
+    print("  peak RSS        {} MB".format(results["peak_rss_mb"]))
+    print("  stage           count      p50 ms    p95 ms    p99 ms    max ms")
+    for name, stage in sorted(results["stages"].items()):
+        print("  {:<14} {:>6} {p50_ms:9.3f} {p95_ms:9.3f} {p99_ms:9.3f} {max_ms:9.3f}".format(name, stage["count"],
+                                                                                          **stage))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Badge scan throughput with fake readers")
+    parser.add_argument("--people", type=int, default=1000, help="rows in the made up people file")
+    parser.add_argument("--attendance", type=int, default=0,
+                        help="rows already in the day's attendance file before the scans start")
+    parser.add_argument("--scans", type=int, default=10000)
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--style", choices=STYLES, default="rdm6300",
+                        help="how the fake readers send badges, rdm6300 and pn532 end them with a gap")
+    parser.add_argument("--rate", type=float, default=0.0,
+                        help="badges a second from each reader, 0 sends them as fast as possible")
+    parser.add_argument("--sqlite", action="store_true", help="also keep attendance in attendance.sqlite3")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="json file for the results (default: benchmarks/results/)")
+    parser.add_argument("--keep", action="store_true", help="print and keep the temporary folder")
+    args = parser.parse_args()
+
+    params = {name: getattr(args, name) for name in ("people", "attendance", "scans", "readers", "style", "rate",
+                                                     "sqlite", "seed")}
+    folder = Path(tempfile.mkdtemp(prefix="timeclock_storm_"))
+    try:
+        results = storm(args, folder)
+    finally:
+        if args.keep:
+            print("Files kept in: " + str(folder))
+        else:
+            import shutil
+            shutil.rmtree(folder, ignore_errors=True)
+
+    results = {"benchmark": "scan_storm", "time": datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+               "commit": git_commit(), "python": platform.python_version(), "platform": platform.platform(),
+               "params": params, **results}
+    report(results)
+    output = Path(args.output) if args.output else \
+        ROOT / "benchmarks" / "results" / ("scan_storm_" + datetime.now().strftime("%Y%m%d_%H%M%S") + ".json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2) + "\n")
+    print("Results saved to: " + str(output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# This Python file uses the following encoding: utf-8
+# Startup time of the GUI, from a fresh python process to the window being painted and the files loaded
+#
+#   python benchmarks/startup.py                 5 runs with ui_form.py if there is one and 5 with form.ui
+#   python benchmarks/startup.py --runs 10 --offscreen
+#
+# Each run is its own process so the imports are cold (apart from the OS file cache), and it uses the
+# saved settings, people file and export folder like the real program does.
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+# One startup, prints the times of each step in seconds as json
+def child(compiled):
+    started = time.perf_counter()
+    sys.path.insert(0, str(ROOT))
+    import main
+    from PySide2.QtCore import QObject, QEvent
+    from PySide2.QtWidgets import QApplication
+    imported = time.perf_counter()
+
+    app = QApplication([])
+    main.app = app
+    window = main.Widget(compiled_ui=compiled)
+    window.installEventFilter(window)
+    constructed = time.perf_counter()
+
+    times = {}
+
+    class FirstPaint(QObject):
+        def eventFilter(self, watched, event):
+            if event.type() == QEvent.Paint and "painted" not in times:
+                times["painted"] = time.perf_counter()
+            return False
+    first_paint = FirstPaint()
+    window.installEventFilter(first_paint)
+    window.showMaximized()
+    while not window.started or "painted" not in times:
+        app.processEvents()
+        if time.perf_counter() - started > 60:
+            break
+    ready = time.perf_counter()
+    print(json.dumps({"compiled": type(window.ui).__module__ == "ui_form",
+                      "import": imported - started, "construct": constructed - imported,
+                      "first_paint": times.get("painted", ready) - started, "ready": ready - started}))
+    window.close()
+
+
+def run(compiled, offscreen):
+    env = dict(os.environ)
+    if offscreen:
+        env["QT_QPA_PLATFORM"] = "offscreen"
+    launched = time.perf_counter()
+    output = subprocess.run([sys.executable, __file__, "--child"] + ([] if compiled else ["--uiloader"]),
+                            env=env, cwd=str(ROOT), capture_output=True, text=True, check=True).stdout
+    total = time.perf_counter() - launched
+    result = json.loads(output.strip().splitlines()[-1])
+    result["process"] = total
+    return result
+
+
+def report(name, results):
+    print(name)
+    for step in ("import", "construct", "first_paint", "ready", "process"):
+        values = [result[step] for result in results]
+        print("  {:<12} median {:7.1f} ms   min {:7.1f} ms".format(step, statistics.median(values) * 1000,
+                                                                     min(values) * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--offscreen", action="store_true", help="don't open a real window")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--uiloader", action="store_true", help="only time loading form.ui at runtime")
+    args = parser.parse_args()
+    if args.child:
+        child(not args.uiloader)
+        return
+
+    modes = [False] if args.uiloader else [True, False]
+    for compiled in modes:
+        results = [run(compiled, args.offscreen) for _ in range(args.runs)]
+        if compiled and not results[0]["compiled"]:
+            print("ui_form.py not found or older than form.ui, compile it with: pyside2-uic form.ui -o ui_form.py")
+            continue
+        report("ui_form.py (pyside2-uic)" if compiled else "form.ui (QUiLoader)", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,49 +2,288 @@
 # Uses a subclassed UiLoader from https://gist.github.com/cpbotha/1b42a20c8f3eb9bb7cb8
 # pip install PySide2 pandas PySerial
 
+import json
 import os
 from pathlib import Path
+import socket
 import sys
+import time
 
-from PySide2.QtWidgets import QApplication, QWidget, QFileDialog, QMainWindow, QVBoxLayout, QTableWidgetItem, QPushButton
-from PySide2.QtCore import QFile, QRegularExpression, QAbstractTableModel, QAbstractListModel, Qt
-from PySide2.QtCore import Slot, QMetaObject, QModelIndex, QSettings, QTimer, QDateTime, QTime, QEvent
-from PySide2.QtUiTools import QUiLoader
+from PySide2.QtWidgets import QApplication, QWidget, QFileDialog
+from PySide2.QtWidgets import QInputDialog, QStyledItemDelegate, QStyleOptionButton, QStyle, QHeaderView
+from PySide2.QtCore import QRegularExpression, QAbstractTableModel, QAbstractListModel, Qt
+from PySide2.QtCore import QModelIndex, QSettings, QTimer, QDateTime, QTime, QEvent
+from PySide2.QtCore import QObject, Signal
 from PySide2.QtGui import QRegularExpressionValidator as QRegExpValidator
 from PySide2.QtGui import QIcon
 from PySide2 import QtGui
-import pandas as pd
-import serial.tools.list_ports
-import serial
-import re
+import bisect
+
+from timeclock.engine import TimeClockEngine, ACTIVE_USERS_COLUMNS, FORCED_DESTINATION, is_guest
+from timeclock.records import RECORD_COLUMNS
+from timeclock.persistence import PersistenceWorker
+from timeclock.fileio import write_atomic
+from timeclock.id_reader import ReaderManager
+from timeclock.ports import PortScanner, port_label, port_identity, find_port, follow_readers
+from timeclock.debounce import ScanDebouncer
+from timeclock.metrics import Metrics, ScanProfiler
+from timeclock.eventlog import EventLog, LEVELS, LOG_NAME
+from timeclock.roster import read_roster, roster_text, parse_filter, row_matches
 
 
 # Main widget that is shown
 class Widget(QWidget):
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, compiled_ui=True):
         super(Widget, self).__init__(parent)
-        self.load_ui()
-        self.id_reader_clock = QTimer(self)
-        self.id_reader_clock.timeout.connect(self.read_id)
+        self.started = False
+        self.load_ui(compiled_ui)
+        self.load_log()
+        self.load_metrics()
+        self.load_id_reader()
+        self.load_writer()
+        self.load_engine()
+        self.load_sync()
         self.load_timers()
         self.load_settings()
-        self.load_data_frames()
+        self.load_models()
         self.load_id_input()
         self.load_guest_name_input()
         self.load_btns()
         self.icon_path = resource_path('4418.png')
         self.setWindowIcon(QIcon(self.icon_path))
 
-    # Load in the ui file created in Qt Designer
-    def load_ui(self):
+        # The people and attendance files and the serial ports are loaded once the window has been painted,
+        # or after a second if it is never shown
+        QTimer.singleShot(1000, self.finish_startup)
+
+    # Load in the ui file created in Qt Designer, the copy compiled with pyside2-uic is used when there is one
+    # since it skips parsing the xml
+    def load_ui(self, compiled=True):
         self.ui_path = resource_path('form.ui')
-        self.ui = loadUi(os.path.join(os.path.dirname(os.path.abspath(__file__)),
-                                      self.ui_path), self)
+        form = compiled_form(self.ui_path) if compiled else None
+        if form is not None:
+            self.ui = form()
+            self.ui.setupUi(self)
+        else:
+            from uiloader import loadUi
+            self.ui = loadUi(self.ui_path, self)
         self.setWindowTitle('Time Tracker')
         self.ui.tableView.setSortingEnabled(True)
-        self.tableWidget_guests.setColumnCount(2)
 
-    # Methods for repeating actions, like updating the clock and polling the id reader
+        # The sign out buttons in the guest table are painted by a delegate instead of being a widget per row
+        self.guest_signout_delegate = ButtonDelegate("Sign Out", self.ui.tableView_guests)
+        self.guest_signout_delegate.clicked.connect(self.handle_btn_guest_signout)
+        self.ui.tableView_guests.setItemDelegateForColumn(1, self.guest_signout_delegate)
+
+    # All of the file writes go through a background thread, it reports back through signals
+    def load_writer(self):
+        self.writer_signals = PersistenceSignals()
+        self.writer_signals.written.connect(self.log_message)
+        self.writer_signals.failed.connect(self.log_message)
+        self.writer = PersistenceWorker(on_written=self.writer_signals.written.emit,
+                                        on_error=self.writer_signals.failed.emit, metrics=self.metrics)
+        self.writer.start()
+
+    # The messages for the two log boxes go through one bounded log that also writes them to timeclock.log in the
+    # export folder, the boxes are updated at most once a frame and only keep the last thousand lines
+    def load_log(self):
+        self.event_log = EventLog()
+        self.main_log = LogConsole(self.event_log, "Sign In", self.ui.textEdit)
+        self.com_log = LogConsole(self.event_log, "ID Reader", self.ui.textEdit_com)
+        self.log_view_count = -1
+        self.ui.comboBox_log_source.addItems(["Everything", "Sign In", "ID Reader"])
+        self.ui.comboBox_log_level.addItems(["Info and up", "Warnings and errors", "Errors only"])
+
+    def log_message(self, message, level=None):
+        self.main_log.append(message, level)
+
+    # Write the log to the export folder, it rolls over to timeclock.log.1 to .5 every megabyte
+    def open_log_file(self):
+        path = Path(self.savepath) / LOG_NAME
+        if self.event_log.path == path:
+            return
+        try:
+            self.event_log.open_file(path)
+            self.ui.label_log_file.setText("The log is also saved to: " + str(path))
+        except Exception as e:
+            self.log_message("Error: Unable to open the log file: " + str(e))
+
+    # The lines kept in the log filtered by the selections on the diagnostics tab
+    def update_log_view(self, force=False):
+        if not force and self.log_view_count == self.event_log.count:
+            return
+        self.log_view_count = self.event_log.count
+        source = self.ui.comboBox_log_source.currentText()
+        lines = self.event_log.filtered(LEVELS[max(self.ui.comboBox_log_level.currentIndex(), 0)],
+                                        self.ui.lineEdit_log_filter.text(),
+                                        None if source in ("", "Everything") else source)
+        self.ui.textEdit_log.setPlainText("\n".join(time.strftime("%H:%M:%S", time.localtime(line.time)) + "  " +
+                                                    line.source + "  " + line.text for line in lines))
+        self.ui.textEdit_log.moveCursor(QtGui.QTextCursor.End)
+
+    # The records, people signed in and journal live in the engine, the GUI only shows them
+    def load_engine(self):
+        self.engine = TimeClockEngine(writer=self.writer, on_message=self.log_message,
+                                      on_user_added=self.active_user_added,
+                                      on_user_removed=self.active_user_removed,
+                                      on_users_reset=self.active_users_reset, metrics=self.metrics)
+
+    # Timings of each stage of a scan, shown on the diagnostics tab and written to the export folder every minute
+    def load_metrics(self):
+        self.metrics = Metrics()
+        self.profiler = ScanProfiler()
+        self.model_metrics = MetricsModel()
+        self.ui.tableView_metrics.setModel(self.model_metrics)
+        self.ui.tableView_metrics.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        timer_metrics = QTimer(self)
+        timer_metrics.timeout.connect(self.dump_metrics)
+        timer_metrics.start(60000)
+
+    def update_metrics_table(self):
+        self.model_metrics.set_rows(self.metrics.summary())
+
+    def dump_metrics(self):
+        if not self.metrics.changed:
+            return
+        json_path = Path(self.savepath) / "timeclock_metrics.json"
+        self.metrics.dump(json_path, Path(self.savepath) / "timeclock_metrics.prom", self.writer)
+        self.ui.label_metrics_file.setText("Timings saved every minute to: " + str(json_path) + " and timeclock_metrics.prom")
+
+    def reset_metrics(self):
+        self.metrics.reset()
+        self.update_metrics_table()
+
+    # cProfile everything done on the GUI thread between the two presses, ie while a line of people sign in
+    def toggle_profiler(self, checked):
+        if checked:
+            self.profiler.start()
+            self.ui.btn_profile.setText("Stop Profiling Scans")
+            self.ui.textEdit_profile.setPlainText("Profiling, scan some badges and press the button again")
+            return
+        self.ui.btn_profile.setText("Start Profiling Scans")
+        path = Path(self.savepath) / ("scan_profile_" + QDateTime.currentDateTime().toString('yyyyMMdd_hhmmss') + ".prof")
+        try:
+            self.ui.textEdit_profile.setPlainText("Profile saved to: " + str(path) + "\n" + self.profiler.stop(path))
+        except Exception as e:
+            self.ui.textEdit_profile.setPlainText("Error: Unable to save the profile: " + str(e))
+
+    # Sign ins/outs are shared with the other kiosks when a sync server is set on the settings page, the client
+    # runs on its own thread and signals the GUI thread when there is something from the other kiosks
+    def load_sync(self):
+        self.sync_client = None
+        self.sync_signals = SyncSignals()
+        self.sync_signals.received.connect(self.read_sync)
+        self.sync_signals.status.connect(self.log_message)
+
+    def set_sync_server(self):
+        self.settings.setValue("sync_server", self.ui.lineEdit_sync_server.text().strip())
+        self.settings.setValue("kiosk_name", self.ui.lineEdit_kiosk_name.text().strip())
+        if self.started:
+            self.start_sync()
+
+    # Connect to the sync server again if it, the kiosk name or the export folder (where the events waiting to be
+    # sent are kept) changed
+    def start_sync(self):
+        address = self.ui.lineEdit_sync_server.text().strip()
+        kiosk = self.ui.lineEdit_kiosk_name.text().strip() or socket.gethostname()
+        folder = Path(self.savepath)
+        client = self.sync_client
+        if client is not None and (client.address, client.kiosk, client.outbox_path.parent) == (address, kiosk, folder):
+            return
+        self.stop_sync()
+        if not address:
+            return
+        from timeclock.sync import SyncClient
+
+        try:
+            self.sync_client = SyncClient(address, kiosk, folder, on_remote=self.sync_signals.received.emit,
+                                          on_status=self.sync_signals.status.emit)
+        except ValueError:
+            self.log_message("Error: The sync server should look like host:port")
+            return
+        self.engine.on_event = self.sync_client.record
+        self.sync_client.start()
+
+    def stop_sync(self):
+        self.engine.on_event = None
+        if self.sync_client is not None:
+            self.sync_client.stop()
+            self.sync_client = None
+
+    # Called on the GUI thread with sign ins/outs from the other kiosks, only the ones that changed something here
+    # are shown
+    def read_sync(self):
+        if self.sync_client is None:
+            return
+        for event, person, signed_in in self.engine.apply_remote_events(self.sync_client.drain()):
+            name = ("Guest: " if is_guest(person.id) else "") + str(person.first_name) + " " + str(person.last_name)
+            if signed_in:
+                self.log_message("[" + str(event.get("kiosk")) + "] " + name + " signed in at: " +
+                                 event['time_in'][11:])
+            else:
+                self.log_message("[" + str(event.get("kiosk")) + "] " + name + " signed out at: " +
+                                 event['time_out'][11:] + ", Destination: " + str(event['destination']))
+        self.update_table_views()
+
+    @property
+    def people(self):
+        return self.engine.people
+
+    @property
+    def records(self):
+        return self.engine.records
+
+    @property
+    def active_users(self):
+        return self.engine.active_users
+
+    @property
+    def guest_users(self):
+        return self.engine.guest_users
+
+    @property
+    def journal(self):
+        return self.engine.journal
+
+    @property
+    def journal_attendance_path(self):
+        return self.engine.journal_attendance_path
+
+    @property
+    def active_users_savepath(self):
+        return self.engine.active_users_savepath
+
+    # Every ID reader runs on its own thread, the manager merges their scans into one ordered stream and
+    # signals the GUI thread when there is something to read
+    def load_id_reader(self):
+        self.id_reader_enabled = False
+        self.id_reader_signals = ReaderSignals()
+        self.id_reader_signals.scanned.connect(self.read_scans)
+        self.id_reader_signals.status.connect(self.com_message)
+        self.id_readers = ReaderManager(on_scan=lambda event: self.id_reader_signals.scanned.emit(),
+                                        on_status=self.id_reader_signals.status.emit, metrics=self.metrics)
+        self.scan_debouncer = ScanDebouncer()
+        # The cooldowns are saved every few seconds rather than on every scan, a registry write per scan
+        # slowed down a busy reader
+        timer_cooldowns = QTimer(self)
+        timer_cooldowns.timeout.connect(self.save_scan_cooldowns)
+        timer_cooldowns.start(2000)
+
+        # The serial ports are listed on a background thread and the selector is filled from the last list
+        self.ports = []
+        self.reader_ports = {}          # reader name -> identity of its port, for finding it again after a replug
+        self.selected_port = None       # identity of the port picked in the selector
+        self.old_com_index = None       # selector index saved by older versions, turned into an identity later
+        self.readers_restored = False
+        self.port_signals = PortSignals()
+        self.port_signals.changed.connect(self.ports_changed)
+        self.port_scanner = PortScanner(on_change=self.port_signals.changed.emit,
+                                        on_status=self.id_reader_signals.status.emit)
+
+    def com_message(self, message, level=None):
+        self.com_log.append(message, level)
+
+    # Methods for repeating actions, like updating the clock
     def load_timers(self):
         self.current_date_time = QDateTime.currentDateTime()
 
@@ -52,51 +291,151 @@ class Widget(QWidget):
         # is started after midnight the start date should be the previous day,
         # we check if the program is started after the cutoff time to determine which day to use
         self.current_time = QTime.currentTime()
-        self.start_date = self.current_date_time
-        if self.current_time.secsTo(self.ui.timeEdit.time()) > 0 and self.current_time.secsTo(QTime(0,0,0)) < 0:
-            # Use previous day if after midnight and before cutoff
-            self.start_date = self.start_date.addDays(-1)
+        self.cutoff_time = self.ui.timeEdit.time()      # cutoff of the meeting going on, edits wait for the next one
+        self.start_date = self.meeting_date(self.current_date_time)
 
         timer_clock = QTimer(self)
         timer_clock.timeout.connect(self.update_clock)
         timer_clock.start(1000)     # 1Hz
 
         if self.ui.checkBox_enable_reader.checkState():
-            self.enable_id_reader_timer(1)
+            self.enable_id_reader_thread(1)
         else:
-            self.enable_id_reader_timer(0)
+            self.enable_id_reader_thread(0)
         self.update_clock()
 
+    def paintEvent(self, event):
+        super(Widget, self).paintEvent(event)
+        if not self.started:
+            QTimer.singleShot(0, self.finish_startup)
+
+    # The slow parts of starting up, it is safe to call more than once so anything that needs the files
+    # can call it first
+    def finish_startup(self):
+        if self.started:
+            return
+        self.started = True
+        try:
+            self.select_file(True)
+        except:
+            pass
+        self.open_log_file()
+        self.load_data_frames()
+        self.load_id_readers()
+        self.start_sync()
+
     def update_clock(self):
         self.current_date_time = QDateTime.currentDateTime()
         self.ui.lineEdit_clock.setText(self.current_date_time.toString('M/d/yyyy hh:mm:ss'))
         self.ui.lineEdit_clock_2.setText(self.current_date_time.toString('M/d/yyyy hh:mm:ss'))
 
-    def read_id(self):
+        if self.ui.tabGroup.currentWidget() is self.ui.tabDiagnostics:
+            self.update_metrics_table()
+            self.update_log_view()
+
+        # Start the next attendance file once the cutoff time has passed, never an older one if the clock goes back
+        if self.started and self.meeting_date(self.current_date_time).date() > self.start_date.date():
+            self.roll_over()
+
+        # Make sure the last few scans hit the disk and fold the journal into the csv files now and then
+        self.engine.tick()
+
+    # Use previous day if after midnight and before cutoff
+    def meeting_date(self, date_time):
+        if date_time.time() < self.cutoff_time:
+            return date_time.addDays(-1)
+        return date_time
+
+    # Seal the attendance file at the cutoff time and start the one for the new day, the people still signed
+    # in are either signed out or carried over to the new file
+    def roll_over(self):
+        old_file_name = self.export_file_name
+        self.start_date = self.meeting_date(self.current_date_time)
+        cutoff = QDateTime(self.start_date.date(), self.cutoff_time)
+        if cutoff > self.current_date_time:
+            # The clock went backwards, there is no cutoff to split at
+            cutoff = self.current_date_time
+        self.export_file_name = self.start_date.toString(self.ui.lineEdit_export_prefix_format.text()) + self.ui.lineEdit_export_suffix.text() + ".csv"
+        carry_over = self.ui.checkBox_rollover_carry_over.isChecked()
         try:
-            self.badge_id = self.arduino.readline()
-            if self.badge_id:
-                # Convert to a string, pull the number out and convert to an int
-                self.badge_id = str(self.badge_id)
-                self.badge_id = self.badge_id.split("'")[1]
-                self.ui.textEdit_com.append("Badge ID Scanned: " + self.badge_id)
-                self.ui.textEdit_com.moveCursor(QtGui.QTextCursor.End)
-                try:
-                    self.sign_inout(False, self.badge_id)
-                except:
-                    self.ui.textEdit_com.append("Error: Associated ID not found")
-                    self.ui.textEdit_com.moveCursor(QtGui.QTextCursor.End)
-                    pass
-        except:
-            pass
+            signed_out, missing = self.engine.roll_over(self.export_file_name, carry_over,
+                                                        cutoff.toString('yyyy-MM-dd_hh:mm:ss'))
+        except Exception as e:
+            self.log_message("Error: Unable to start the new attendance file: " + str(e))
+            return
+        self.ui.lineEdit_export_location.setText(str(self.savepath / self.export_file_name))
+        self.log_message("New day, " + old_file_name + " is finished and the export file will be saved to: " +
+                         str(self.savepath / self.export_file_name))
+        if carry_over:
+            self.log_message(str(len(signed_out)) + " people carried over to the new file at " +
+                             cutoff.toString('hh:mm:ss'))
+        else:
+            for person, worked in signed_out:
+                self.log_message(("Guest: " if is_guest(person.id) else "") + str(person.first_name) + " " +
+                                 str(person.last_name) + " signed out at: " + cutoff.toString('hh:mm:ss') +
+                                 ", worked: " + str(worked) + "hours, Destination: " + FORCED_DESTINATION)
+        for person in missing:
+            self.log_message("Error: Can't find sign in record for " + str(person.first_name) + " " +
+                             str(person.last_name) + ", removing from active user list")
+        # An edited cutoff time starts with the new meeting
+        if self.ui.timeEdit.time() != self.cutoff_time:
+            self.cutoff_time = self.ui.timeEdit.time()
+            self.log_message("The cutoff time is now " + self.cutoff_time.toString('hh:mm:ss'))
+        self.update_table_views()
+
+    # The meeting going on keeps the cutoff it started with, changing it in the middle of a meeting would
+    # move the meeting to another day
+    def set_cutoff_time(self, cutoff):
+        self.settings.setValue("cutoff_time", cutoff.toString('hh:mm:ss'))
+        if self.started and cutoff != self.cutoff_time:
+            self.log_message("The cutoff time will change to " + cutoff.toString('hh:mm:ss') +
+                             " after the next cutoff at " + self.cutoff_time.toString('hh:mm:ss'))
+
+    def set_rollover_carry_over(self, enabled):
+        self.settings.setValue("rollover_carry_over", bool(enabled))
+
+    # Called on the GUI thread when any of the readers has framed a badge ID, one signal can stand for
+    # several scans so everything waiting is handled in the order it came in
+    def read_scans(self):
+        for event in self.id_readers.drain():
+            self.metrics.observe("dispatch", time.monotonic() - event.time)
+            self.read_id(event.badge_id, event.reader)
+
+    def read_id(self, badge_id, reader=None):
+        if not self.id_reader_enabled:
+            return
+        self.badge_id = badge_id
+        if reader is None:
+            self.com_message("Badge ID Scanned: " + self.badge_id)
+        else:
+            self.com_message("Badge ID Scanned at " + str(reader) + ": " + self.badge_id)
+
+        # A card held on the antenna is read over and over, only the first read signs the person in or out
+        if not self.scan_debouncer.accept(self.badge_id):
+            self.com_message("Repeat scan ignored")
+            return
+        try:
+            with self.metrics.span("scan"):
+                self.sign_inout(False, self.badge_id)
+        except KeyError:
+            if "Badge" not in self.people.columns:
+                self.com_message("Error: The people file has no Badge column")
+            else:
+                self.com_message("Error: Associated ID not found")
+        except Exception as e:
+            self.com_message("Error: Unable to sign in or out: " + str(e))
 
     # Method for retreiving and initializing saved settings
     def load_settings(self):
         self.settings = QSettings('Team Impulse', 'Sign In App')
-        try:
-            self.select_file(True)
-        except:
-            pass
+        if self.settings.contains("cutoff_time"):
+            cutoff = QTime.fromString(str(self.settings.value("cutoff_time")), 'hh:mm:ss')
+            if cutoff.isValid():
+                self.ui.timeEdit.setTime(cutoff)
+                self.cutoff_time = cutoff
+                self.start_date = self.meeting_date(self.current_date_time)
+        self.ui.checkBox_rollover_carry_over.setChecked(str(self.settings.value("rollover_carry_over")).lower() == "true")
+
         if self.settings.contains("suffix"):
             self.ui.lineEdit_export_suffix.setText(str(self.settings.value("suffix")))
         else:
@@ -119,64 +458,160 @@ class Widget(QWidget):
             self.savepath = Path.cwd()
             self.export_file_path_update()
 
-        self.update_com()
-        if self.settings.contains("com_index"):
+        self.id_reader_com_port = "Select Port"
+        self.ui.checkBox_sqlite.setChecked(self.settings.value("storage_backend") == "sqlite")
+
+        if self.settings.contains("debounce_seconds"):
             try:
-                self.ui.com_selector.setCurrentIndex(self.settings.value("com_index"))
-                self.id_reader_com_port = self.ui.com_selector.currentText()
-                self.open_com()
+                self.ui.doubleSpinBox_debounce.setValue(float(self.settings.value("debounce_seconds")))
             except:
                 pass
+        self.scan_debouncer.window = self.ui.doubleSpinBox_debounce.value()
+
+        if self.settings.contains("sync_server"):
+            self.ui.lineEdit_sync_server.setText(str(self.settings.value("sync_server")))
+        if self.settings.contains("kiosk_name") and str(self.settings.value("kiosk_name")):
+            self.ui.lineEdit_kiosk_name.setText(str(self.settings.value("kiosk_name")))
         else:
-            self.id_reader_com_port = "Select Port"
+            self.ui.lineEdit_kiosk_name.setText(socket.gethostname())
+        if self.settings.contains("scan_cooldowns"):
+            try:
+                self.scan_debouncer.load_state(self.settings.value("scan_cooldowns"))
+            except:
+                pass
+
+    # Start listing the serial ports, the readers that were open last time are opened once the first list is in
+    def load_id_readers(self):
+        if self.settings.contains("com_port"):
+            try:
+                self.selected_port = json.loads(str(self.settings.value("com_port")))
+            except:
+                pass
+        elif self.settings.contains("com_index"):
+            try:
+                self.old_com_index = int(self.settings.value("com_index"))
+            except:
+                pass
+        self.port_scanner.start()
+
+    # The index of the selected port meant a different port whenever they came up in another order. It is
+    # turned into the identity of the port at that index in the first list with any ports, which comes in the
+    # same order the old selector was filled in
+    def migrate_com_index(self):
+        if not self.ports:
+            return
+        index, self.old_com_index = self.old_com_index, None
+        if 0 < index <= len(self.ports):
+            self.selected_port = port_identity(self.ports[index - 1])
+            self.settings.setValue("com_port", json.dumps(self.selected_port))
+        self.settings.remove("com_index")
+
+    # Open the readers that were open last time, wherever their ports are now
+    def restore_readers(self):
+        readers = {}
+        if self.settings.contains("id_reader_ports"):
+            try:
+                readers = json.loads(str(self.settings.value("id_reader_ports")))
+            except:
+                pass
+        elif self.settings.contains("id_readers"):
+            # Settings from before the ports were remembered by more than their path
+            try:
+                readers = {str(name): {"device": str(port)} for name, port in dict(self.settings.value("id_readers")).items()}
+            except:
+                pass
+        for name, identity in readers.items():
+            info = find_port(identity, self.ports)
+            if info is not None:
+                identity = port_identity(info)
+            self.reader_ports[name] = identity
+            self.id_readers.open(name, identity["device"])
+        self.readers_restored = True
+
+    # Called on the GUI thread when the list of serial ports changed, readers whose port came back somewhere
+    # else are moved to it
+    def ports_changed(self, ports):
+        old_devices = {port.device for port in self.ports}
+        new_devices = {port.device for port in ports}
+        self.ports = ports
+        if self.old_com_index is not None:
+            self.migrate_com_index()
+        self.show_ports()
+        if not self.readers_restored:
+            self.restore_readers()
+            return
+        for port in ports:
+            if port.device not in old_devices:
+                self.com_message("Port plugged in: " + port_label(port))
+        for device in sorted(old_devices - new_devices):
+            self.com_message("Port unplugged: " + device)
+        for name, device in follow_readers(self.id_readers.readers, self.reader_ports, ports).items():
+            self.com_message("Reader " + name + " found again on " + device + ", reconnecting")
+            self.id_readers.open(name, device)
+        self.save_readers()
 
     def clear_settings(self):
         self.settings.clear()
 
-    # Method for initializing the pandas dataframes used to keep track of people
-    def load_data_frames(self):
-        # Setup dataframes
-        self.data_records_columns = ["ID", "First_Name", "Last_Name", "Time_In",
-                                    "Time_Out", "Destination", "Hours"]
-        self.active_users_columns = ["ID", "First_Name", "Last_Name"]
-        self.data_records = pd.DataFrame(columns=self.data_records_columns)
-        self.active_users = pd.DataFrame(columns=self.active_users_columns)
-        self.guest_users = pd.DataFrame(columns=self.active_users_columns)
-
-        self.model_active_users = ActiveUsersModel(users=self.active_users)
+    # The models stay on the views for good and are only told about the rows that change
+    def load_models(self):
+        self.data_records_columns = RECORD_COLUMNS
+        self.active_users_columns = ACTIVE_USERS_COLUMNS
+        self.model_active_users = ActiveUsersModel()
         self.ui.listView.setModel(self.model_active_users)
-        self.active_users_savepath = str(self.savepath / "active_users.csv")
+        self.model_guests = GuestsModel()
+        self.ui.tableView_guests.setModel(self.model_guests)
+        self.ui.tableView_guests.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
 
-        #Try to load csv files and fillout dataframes
-        try:
-            self.active_users = pd.read_csv(self.active_users_savepath, dtype=str)
-            self.model_active_users = ActiveUsersModel(users=self.active_users)
-            self.ui.listView.setModel(self.model_active_users)
-            self.ui.lineEdit_signed_in.setText(str(self.active_users.shape[0]))
-            try:
-                # Read through active users and grab everything with a "G" prefix and add it to the guest_users list
-                for index, row in self.active_users.iterrows():
-                    if "G" in str(row["ID"]):
-                        self.temp_id = str(row["ID"])
-                        self.temp_append = self.active_users.query('ID == @self.temp_id')[['ID', 'First_Name', 'Last_Name']]
-                        self.temp_append.reset_index(drop=True, inplace=True)
-                        self.guest_users = self.guest_users.append(self.temp_append)
-                        self.guest_users.reset_index(drop=True, inplace=True)
-                        self.update_guest_table()
-            except:
-                self.ui.textEdit.append("Error: Unable to parse guests from active_users file")
-                self.ui.textEdit.moveCursor(QtGui.QTextCursor.End)
+    # Method for initializing the record store and lists used to keep track of people
+    def load_data_frames(self):
+        # Load the csv files and replay anything that was journaled after they were last written
+        self.engine.use_database = self.ui.checkBox_sqlite.isChecked()
+        self.engine.set_paths(self.savepath, self.export_file_name, self.start_date.date().toPython())
+        self.engine.load()
+        self.update_table_views()
 
-        except:
-            self.ui.textEdit.append("Warning: No active_users file found or unable to open file")
-            self.ui.textEdit.moveCursor(QtGui.QTextCursor.End)
-            pass
-        try:
-            self.data_records = pd.read_csv(self.savepath / self.export_file_name, keep_default_na=False, dtype=str)
-        except:
-            self.ui.textEdit.append("Warning: No Data Records File found, must be a new day")
-            self.ui.textEdit.moveCursor(QtGui.QTextCursor.End)
-            pass
+    # Methods for keeping the models in step with the people signed in
+    def active_user_added(self, person, guest):
+        if guest:
+            self.model_guests.add(person)
+        self.model_active_users.add(person)
+
+    def active_user_removed(self, id):
+        self.model_guests.remove(id)
+        self.model_active_users.remove(id)
+
+    def active_users_reset(self):
+        self.model_active_users.reset(self.active_users.values())
+        self.update_guest_table()
+
+    # Methods for the attendance journal
+    def select_storage_backend(self, enabled):
+        self.settings.setValue("storage_backend", "sqlite" if enabled else "csv")
+        self.engine.set_use_database(enabled)
+
+    def import_people_to_database(self):
+        self.engine.import_people_to_database()
+
+    def compact_journal(self):
+        self.engine.compact_journal()
+
+    def compact_journal_if_due(self):
+        self.engine.compact_journal_if_due()
+
+    # Fold the journal into the csv files when the program is closed and wait for the writer to finish
+    def closeEvent(self, event):
+        self.port_scanner.stop()
+        self.id_readers.close_all()
+        self.save_scan_cooldowns()
+        self.stop_sync()
+        if self.profiler.running:
+            self.ui.btn_profile.setChecked(False)
+        self.dump_metrics()
+        self.engine.close()
+        self.writer.stop()
+        self.event_log.close_file()
+        super(Widget, self).closeEvent(event)
 
     # Setup the validator to only allow numbers in the id field and letters and spaces in the guest name field
     def load_id_input(self):
@@ -196,9 +631,12 @@ class Widget(QWidget):
         self.ui.btn_people_file_save.pressed.connect(self.save_file)
         self.ui.btn_people_file_add_row.pressed.connect(self.insert_above)
         self.ui.btn_people_file_remove_row.pressed.connect(self.remove_rows)
+        self.ui.lineEdit_people_filter.textChanged.connect(self.filter_people)
+        self.ui.btn_people_file_undo.pressed.connect(self.undo_people_edit)
         self.ui.btn_clear_settings.pressed.connect(self.clear_settings)
         self.ui.btn_export_location.pressed.connect(self.set_export_location)
         self.ui.btn_export_manual.pressed.connect(self.manual_export)
+        self.ui.btn_season_report.pressed.connect(self.season_report)
         self.ui.rbtn_other.clicked.connect(self.focus_other_text_field)
         self.ui.btn_force_signout.pressed.connect(self.force_signout)
         self.ui.btn_clear_temp_files.pressed.connect(self.clear_temp_files)
@@ -211,11 +649,22 @@ class Widget(QWidget):
         self.ui.lineEdit_destination_other.installEventFilter(self)
         self.ui.btn_open_com.pressed.connect(self.open_com)
         self.ui.btn_close_com.pressed.connect(self.close_com)
+        self.ui.doubleSpinBox_debounce.valueChanged.connect(self.set_debounce_window)
+        self.ui.checkBox_sqlite.toggled.connect(self.select_storage_backend)
+        self.ui.timeEdit.timeChanged.connect(self.set_cutoff_time)
+        self.ui.btn_metrics_reset.pressed.connect(self.reset_metrics)
+        self.ui.btn_profile.toggled.connect(self.toggle_profiler)
+        self.ui.checkBox_rollover_carry_over.toggled.connect(self.set_rollover_carry_over)
+        self.ui.lineEdit_sync_server.editingFinished.connect(self.set_sync_server)
+        self.ui.lineEdit_kiosk_name.editingFinished.connect(self.set_sync_server)
+        self.ui.comboBox_log_source.currentIndexChanged.connect(lambda index: self.update_log_view(True))
+        self.ui.comboBox_log_level.currentIndexChanged.connect(lambda index: self.update_log_view(True))
+        self.ui.lineEdit_log_filter.textChanged.connect(lambda text: self.update_log_view(True))
 
     # Methods for the ID reader
     def enable_id_reader(self):
         if self.ui.checkBox_enable_reader.checkState():
-            self.enable_id_reader_timer(1)
+            self.enable_id_reader_thread(1)
 
             self.ui.btn_update_com.setEnabled(1)
             self.ui.com_selector.setEnabled(1)
@@ -223,11 +672,12 @@ class Widget(QWidget):
             self.ui.btn_open_com.setEnabled(1)
             self.ui.btn_close_com.setEnabled(1)
             self.ui.label_8.setEnabled(1)
-            self.ui.textEdit_com.append("ID Reader Enabled")
-            self.ui.textEdit_com.moveCursor(QtGui.QTextCursor.End)
+            self.ui.label_debounce.setEnabled(1)
+            self.ui.doubleSpinBox_debounce.setEnabled(1)
+            self.com_message("ID Reader Enabled")
 
         else:
-            self.enable_id_reader_timer(0)
+            self.enable_id_reader_thread(0)
 
             self.ui.btn_update_com.setEnabled(0)
             self.ui.com_selector.setEnabled(0)
@@ -235,78 +685,109 @@ class Widget(QWidget):
             self.ui.btn_open_com.setEnabled(0)
             self.ui.btn_close_com.setEnabled(0)
             self.ui.label_8.setEnabled(0)
-            self.ui.textEdit_com.append("ID Reader Disabled")
-            self.ui.textEdit_com.moveCursor(QtGui.QTextCursor.End)
+            self.ui.label_debounce.setEnabled(0)
+            self.ui.doubleSpinBox_debounce.setEnabled(0)
+            self.com_message("ID Reader Disabled")
 
-            try:
-                self.arduino.close()
-                self.ui.textEdit_com.append("Closed Port: " + self.id_reader_com_port)
-                self.ui.textEdit_com.moveCursor(QtGui.QTextCursor.End)
-            except:
-                pass
+            for name in list(self.id_readers.readers):
+                port = self.id_readers.readers[name].port
+                self.id_readers.close(name)
+                self.com_message("Closed Port: " + port + " (" + name + ")")
 
-    def enable_id_reader_timer(self, enable):
-        if enable:
-            self.id_reader_clock.start(500)     # 2Hz scan rate
-        else:
-            self.id_reader_clock.stop()
+    def save_scan_cooldowns(self):
+        if self.scan_debouncer.changed:
+            self.settings.setValue("scan_cooldowns", self.scan_debouncer.state())
+
+    def set_debounce_window(self, seconds):
+        self.scan_debouncer.window = seconds
+        self.settings.setValue("debounce_seconds", seconds)
 
+    # Badges that come in while the reader is disabled are dropped
+    def enable_id_reader_thread(self, enable):
+        self.id_reader_enabled = bool(enable)
+
+    # Several readers can be open at once, so picking another port leaves the open ones alone. The port is
+    # remembered by its identity since the index and even the path can change
     def select_com(self):
-        self.close_com()
-        self.settings.setValue("com_index", self.ui.com_selector.currentIndex())
-        self.id_reader_com_port = self.ui.com_selector.currentText()
+        index = self.ui.com_selector.currentIndex()
+        if index <= 0 or index > len(self.ports):
+            self.id_reader_com_port = "Select Port"
+            return
+        info = self.ports[index - 1]
+        self.id_reader_com_port = info.device
+        self.selected_port = port_identity(info)
+        self.settings.setValue("com_port", json.dumps(self.selected_port))
 
+    # The list is refreshed in the background, this only asks for it to be done now
     def update_com(self):
+        self.port_scanner.refresh()
+
+    # Fill the selector from the last list of ports and keep the selected port selected
+    def show_ports(self):
+        self.ui.com_selector.blockSignals(True)
         self.ui.com_selector.clear()
         self.ui.com_selector.addItem("Select Port")
-        self.ports = serial.tools.list_ports.comports()
-        for p in self.ports:
-            self.ui.com_selector.addItem(p.device)
+        for port in self.ports:
+            self.ui.com_selector.addItem(port_label(port))
+        selected = find_port(self.selected_port, self.ports)
+        index = self.ports.index(selected) + 1 if selected is not None else 0
+        self.ui.com_selector.setCurrentIndex(index)
+        self.ui.com_selector.blockSignals(False)
+        self.id_reader_com_port = selected.device if selected is not None else "Select Port"
 
     def open_com(self):
         if self.id_reader_com_port == "Select Port":
-            self.ui.textEdit_com.append("Please select a port to open")
-            self.ui.textEdit_com.moveCursor(QtGui.QTextCursor.End)
+            self.com_message("Please select a port to open")
             return
-        try:
-            if self.arduino.is_open():
-                self.arduino.close()
-                self.ui.textEdit_com.append("Port already open, closing and reopening")
-                self.ui.textEdit_com.moveCursor(QtGui.QTextCursor.End)
-        except:
-            pass
-
-        try:
-            self.arduino = serial.Serial(port=self.id_reader_com_port, baudrate=115200, timeout=.1)
-            self.ui.textEdit_com.append("Port connected: " + self.id_reader_com_port)
-            self.ui.textEdit_com.moveCursor(QtGui.QTextCursor.End)
-        except:
-            self.ui.textEdit_com.append("Error: Can't open Serial Port: " + self.id_reader_com_port)
-            self.ui.textEdit_com.moveCursor(QtGui.QTextCursor.End)
+        # Each reader is tagged with the door or line it is at, the port name is used if none is given
+        name, ok = QInputDialog.getText(self, "Open ID Reader", "Door or line for the reader on "
+                                        + self.id_reader_com_port + ":", text=self.id_reader_com_port)
+        if not ok:
             return
-
-    def close_com(self):          
+        name = name.strip() or self.id_reader_com_port
+        self.open_reader(name, self.id_reader_com_port)
+
+    def open_reader(self, name, port):
+        for open_name in self.id_readers.names_for_port(port):
+            self.id_readers.close(open_name)
+            self.com_message("Port already open, closing and reopening")
+        if name in self.id_readers.readers:
+            self.com_message("Reader " + name + " moved to " + port)
+
+        # The reader reports "Port connected" itself and keeps trying to reconnect if the port drops
+        info = next((open_port for open_port in self.ports if open_port.device == port), None)
+        self.reader_ports[name] = port_identity(info) if info is not None else {"device": port}
+        self.id_readers.open(name, port)
+        self.save_readers()
+
+    # Remember which readers were open so they come back the next time the program is started
+    def save_readers(self):
+        self.settings.setValue("id_readers", {name: reader.port for name, reader in self.id_readers.readers.items()})
+        self.settings.setValue("id_reader_ports", json.dumps({name: self.reader_ports.get(name, {"device": reader.port})
+                                                               for name, reader in self.id_readers.readers.items()}))
+
+    def close_com(self):
         if self.id_reader_com_port == "Select Port" or self.id_reader_com_port == "":
-            #self.ui.textEdit_com.append("No Port Selected")
+            #self.com_message("No Port Selected")
             return
         try:
-            self.arduino.close()
-            self.ui.textEdit_com.append("Closed Port: " + self.id_reader_com_port)
-            self.ui.textEdit_com.moveCursor(QtGui.QTextCursor.End)
+            for name in self.id_readers.names_for_port(self.id_reader_com_port):
+                self.id_readers.close(name)
+                self.com_message("Closed Port: " + self.id_reader_com_port + " (" + name + ")")
+            self.save_readers()
         except:
-            self.ui.textEdit_com.append("Error: Unable to close Port: " + self.id_reader_com_port)
-            self.ui.textEdit_com.moveCursor(QtGui.QTextCursor.End)
+            self.com_message("Error: Unable to close Port: " + self.id_reader_com_port)
             pass
 
     # Main logic for time tracking
     def sign_inout(self, forced=False, badge_id=None):
+        self.finish_startup()
 
         # Check if a people database is selected
         try:
-            self.people_csv_data = self.people_csv_data
+            self.model_csv = self.model_csv
         except:
-            self.ui.textEdit.append("Error: No People File selected, please load a file")
-            self.ui.textEdit.moveCursor(QtGui.QTextCursor.End)
+            self.log_message("Error: No People File selected, please load a file")
             return
 
         # Set focus on ID field
@@ -314,54 +795,35 @@ class Widget(QWidget):
             self.ui.lineEdit_id_enter.setFocus()
             return
 
-        # Look for the ID associated with the passed Badge_ID or grab the ID from the ID field
-        if not badge_id == None:
+        # The engine looks up the person with the passed Badge_ID, or the ID from the ID field, and signs them in
+        # or out
+        time_now = self.current_date_time.toString('yyyy-MM-dd_hh:mm:ss')
+        destination = FORCED_DESTINATION if forced else self.selected_destination()
+        if badge_id is not None:
             self.badge_id = str(badge_id)
-            self.temp_data = self.people_csv_data.query('Badge == @self.badge_id')[['ID', 'First_Name', 'Last_Name']]
-            self.temp_data.reset_index(drop=True, inplace=True)
-            self.id = self.temp_data['ID'][0]
+            person, signed_in, signed_out = self.engine.toggle_badge(self.badge_id, destination, time_now, forced)
+            if person is None:
+                raise KeyError("No ID associated with badge " + self.badge_id)
         else:
-            self.id = self.ui.lineEdit_id_enter.text()
-            self.temp_data = self.people_csv_data.query('ID == @self.id')[['ID', 'First_Name', 'Last_Name']]
-            self.temp_data.reset_index(drop=True, inplace=True)
+            with self.metrics.span("lookup"):
+                person = self.people.find_id(self.ui.lineEdit_id_enter.text())
+            if person is not None:
+                signed_in, signed_out = self.engine.toggle(person, destination, time_now, forced)
         self.ui.lineEdit_id_enter.clear()
 
-        # Check if person is in active users and then sign in or out
-        if not self.temp_data.empty:
-            if self.active_users.query('ID == @self.id').empty:
-                # Sign in the person and add to active users list
-                self.sign_in(signin_data=self.temp_data)
-            else:
-                # Sign out the person and remove from active users list
-                self.sign_out(signout_data=self.temp_data, forced=forced)
+        if person is None:
+            self.log_message("Error: User Not Found")
+        elif signed_in:
+            with self.metrics.span("view"):
+                self.log_message(str(person.first_name) + " " + str(person.last_name) +
+                                 " signed in at: " + self.current_date_time.toString('hh:mm:ss'))
         else:
-            self.ui.textEdit.append("Error: User Not Found")
-            self.ui.textEdit.moveCursor(QtGui.QTextCursor.End)
-
-        self.update_table_views()
-
-    def sign_in(self, signin_data):
-        self.ui.textEdit.append(str(signin_data['First_Name'][0]) + " " + str(signin_data['Last_Name'][0]) +
-                                " signed in at: " + self.current_date_time.toString('hh:mm:ss'))
-        self.ui.textEdit.moveCursor(QtGui.QTextCursor.End)
-        self.active_users = self.active_users.append(signin_data)
-        self.active_users.reset_index(drop=True, inplace=True)
-
-        # Create entry in data_records for the login
-        self.temp_append_data = [(signin_data['ID'][0], signin_data['First_Name'][0],
-                                  signin_data['Last_Name'][0],
-                                  self.current_date_time.toString('yyyy-MM-dd_hh:mm:ss'), "", "", "")]
-        self.temp_append = pd.DataFrame(self.temp_append_data, columns=self.data_records_columns)
-        self.data_records = self.data_records.append(self.temp_append)
-        self.data_records.reset_index(drop=True, inplace=True)
-
-        # Save the active users and data_records data so that the program can be closed and opened whenever
-        self.active_users.to_csv(self.active_users_savepath, index=False)
-        self.data_records.to_csv(self.savepath / self.export_file_name, index=False)
+            self.signed_out(person, signed_out, destination)
 
         self.update_table_views()
 
     def guest_signin(self):
+        self.finish_startup()
         # Grab the name, split by spaces and then pull off only the first 2 non space strings
         self.new_guest_name = self.ui.lineEdit_guest_name.text()
         self.new_guest_name = self.new_guest_name.split(" ")
@@ -370,125 +832,65 @@ class Widget(QWidget):
         if len(self.new_guest_name) < 2:
             self.new_guest_name.append(" ")
 
-        # Assign an id to the person, the time ensures a unique id
-        self.new_guest_id = "G" + self.current_date_time.toString('yyyyMMddhhmmss')
-
         # Print out that someone signed in
-        self.ui.textEdit.append("Guest: " + str(self.new_guest_name[0]) + " " + str(self.new_guest_name[1]) +
-                                " signed in at: " + self.current_date_time.toString('hh:mm:ss'))
-        self.ui.textEdit.moveCursor(QtGui.QTextCursor.End)
-
-        # Add the person to the active users list and guest users list
-        self.temp_append_data = [(self.new_guest_id, self.new_guest_name[0], self.new_guest_name[1])]
-        self.temp_append = pd.DataFrame(self.temp_append_data, columns=self.active_users_columns)
-
-        self.active_users = self.active_users.append(self.temp_append)
-        self.active_users.reset_index(drop=True, inplace=True)
-        self.guest_users = self.guest_users.append(self.temp_append)
-        self.guest_users.reset_index(drop=True, inplace=True)
-
-        # Create entry in data_records for the login
-        self.temp_append_data = [(self.new_guest_id, self.new_guest_name[0],
-                                  self.new_guest_name[1],
-                                  self.current_date_time.toString('yyyy-MM-dd_hh:mm:ss'), "", "", "")]
-        self.temp_append = pd.DataFrame(self.temp_append_data, columns=self.data_records_columns)
-        self.data_records = self.data_records.append(self.temp_append)
-        self.data_records.reset_index(drop=True, inplace=True)
-
-        # Save the active users and data_records data so that the program can be closed and opened whenever
-        self.active_users.to_csv(self.active_users_savepath, index=False)
-        self.data_records.to_csv(self.savepath / self.export_file_name, index=False)
+        self.log_message("Guest: " + str(self.new_guest_name[0]) + " " + str(self.new_guest_name[1]) +
+                         " signed in at: " + self.current_date_time.toString('hh:mm:ss'))
+
+        # Add the person to the active users list and guest users list and create entry in the records for the
+        # login, the time ensures a unique id
+        self.time_in = self.current_date_time.toString('yyyy-MM-dd_hh:mm:ss')
+        self.new_guest_id = self.engine.guest_sign_in(self.new_guest_name[0], self.new_guest_name[1], self.time_in).id
 
         # Update the tables
-        self.update_guest_table()
         self.update_table_views()
 
-    def sign_out(self, signout_data, forced=None):
-        try:
-            self.data_records.loc[(self.data_records['ID'] == signout_data['ID'][0]) &
-                                                      (self.data_records['Time_Out'] == ""), 'Time_In']
-        except:
-            self.ui.textEdit.append("Error: Can't find sign in record for user, removing from active user list")
-            self.ui.textEdit.moveCursor(QtGui.QTextCursor.End)
-            if "G" in str(signout_data['ID'][0]):
-                self.guest_users = self.guest_users[self.guest_users.ID != signout_data['ID'][0]]
-                self.guest_users.reset_index(drop=True, inplace=True)
-            self.active_users = self.active_users[self.active_users.ID != signout_data['ID'][0]]
-            self.active_users.reset_index(drop=True, inplace=True)
-            return
+    # Sign out from the guest table
+    def sign_out(self, person):
+        destination = self.selected_destination()
+        signed_out = self.engine.sign_out(person, destination, self.current_date_time.toString('yyyy-MM-dd_hh:mm:ss'))
+        self.signed_out(person, signed_out, destination)
+        self.update_table_views()
 
-        # Remove person from users lists
-        if "G" in str(signout_data['ID'][0]):
-            self.guest_users = self.guest_users[self.guest_users.ID != signout_data['ID'][0]]
-            self.guest_users.reset_index(drop=True, inplace=True)
-        self.active_users = self.active_users[self.active_users.ID != signout_data['ID'][0]]
-        self.active_users.reset_index(drop=True, inplace=True)
-
-        # Calculate the hours signed in
-        self.data_records.reset_index(drop=True, inplace=True)
-        self.initial_time = self.data_records.loc[(self.data_records['ID'] == signout_data['ID'][0]) &
-                                                  (self.data_records['Time_Out'] == ""), 'Time_In']
-        self.initial_time.reset_index(drop=True, inplace=True)
-        self.hours = round(QDateTime.fromString(self.initial_time[0], 'yyyy-MM-dd_hh:mm:ss').secsTo(self.current_date_time) / 3600, 2)
-
-        # Get the destination from the buttons
-        if self.ui.rbtn_home.isChecked():
-            self.destination = "Home"
-        elif self.ui.rbtn_work.isChecked():
-            self.destination = "Work"
-        elif self.ui.rbtn_other.isChecked():
-            self.destination = str(self.ui.lineEdit_destination_other.text())
+    # Get the destination from the buttons
+    def selected_destination(self):
+        if self.ui.rbtn_work.isChecked():
+            return "Work"
+        if self.ui.rbtn_other.isChecked():
+            return str(self.ui.lineEdit_destination_other.text())
+        return "Home"
+
+    # Print out that the person signed out and put the destination buttons back
+    def signed_out(self, person, signed_out, destination):
+        if signed_out is None:
+            self.log_message("Error: Can't find sign in record for user, removing from active user list")
+            return
         self.ui.rbtn_home.setChecked(1)
         self.ui.lineEdit_destination_other.clear()
-
-        # Overwrite buttons if it is a force signout
-        if forced:
-            self.destination = "Forced Sign Out"
-
-        # Add "Time_Out", "Destination", "Hours" to the data records list
-        self.data_records.loc[(self.data_records['ID'] == signout_data['ID'][0]) &
-                              (self.data_records['Time_Out'] == ""), 'Destination'] = self.destination
-        self.data_records.loc[(self.data_records['ID'] == signout_data['ID'][0]) &
-                              (self.data_records['Time_Out'] == ""), 'Hours'] = self.hours
-        self.data_records.loc[(self.data_records['ID'] == signout_data['ID'][0]) &
-                              (self.data_records['Time_Out'] == ""), 'Time_Out'] = self.current_date_time.toString('yyyy-MM-dd_hh:mm:ss')
-
-        # Print out that the person signed out
-        if "G" in str(signout_data['ID'][0]):
-            self.ui.textEdit.append("Guest: " + str(signout_data['First_Name'][0]) + " " + str(signout_data['Last_Name'][0])
-                                    + " signed out at: " + self.current_date_time.toString('hh:mm:ss') +
-                                    ", worked: " + str(self.hours) + "hours, Destination: "
-                                    + str(self.destination))
-            self.ui.textEdit.moveCursor(QtGui.QTextCursor.End)
-        else:
-            self.ui.textEdit.append(str(signout_data['First_Name'][0]) + " " + str(signout_data['Last_Name'][0])
-                                    + " signed out at: " + self.current_date_time.toString('hh:mm:ss') +
-                                    ", worked: " + str(self.hours) + "hours, Destination: "
-                                    + str(self.destination))
-            self.ui.textEdit.moveCursor(QtGui.QTextCursor.End)
-
-        # Save the active users and data_records data so that the program can be closed and opened whenever
-        self.active_users.to_csv(self.active_users_savepath, index=False)
-        self.data_records.to_csv(self.savepath / self.export_file_name, index=False)
-
+        with self.metrics.span("view"):
+            self.log_message(("Guest: " if is_guest(person.id) else "") + str(person.first_name) + " " +
+                             str(person.last_name) + " signed out at: " +
+                             self.current_date_time.toString('hh:mm:ss') + ", worked: " + str(signed_out[1]) +
+                             "hours, Destination: " + str(destination))
+
+    # Close every open session in one pass over the records and journal them with a single write, the sign outs
+    # are only shared with the other kiosks when share is set
+    def force_signout(self, share=True):
+        self.finish_startup()
+        self.time_out = self.current_date_time.toString('yyyy-MM-dd_hh:mm:ss')
+        signed_out, missing = self.engine.force_signout(self.time_out, share=share)
+        for person in missing:
+            self.log_message("Error: Can't find sign in record for " + str(person.first_name) + " " +
+                             str(person.last_name) + ", removing from active user list")
+        for person, worked in signed_out:
+            self.log_message(("Guest: " if is_guest(person.id) else "") + str(person.first_name) + " " +
+                             str(person.last_name) + " signed out at: " +
+                             self.current_date_time.toString('hh:mm:ss') + ", worked: " + str(worked) +
+                             "hours, Destination: " + FORCED_DESTINATION)
         self.update_table_views()
 
-    def force_signout(self):
-        #need to loop through all of the active users, set the ID field and run signinout with a forced signout flag
-        while self.active_users.shape[0] > 0:
-            self.temp_data = [(self.active_users.iloc[0]['ID'],
-                                self.active_users.iloc[0]['First_Name'],
-                                self.active_users.iloc[0]['Last_Name'])]
-            self.temp = pd.DataFrame(self.temp_data, columns=self.active_users_columns)
-            self.sign_out(signout_data=self.temp, forced=True)
-        self.update_guest_table()
-        self.update_table_views
-
-    # Update the number of people signed in and update active users model and view
+    # Update the number of people signed in, the active users model updates itself as people come and go
     def update_table_views(self):
-        self.ui.lineEdit_signed_in.setText(str(self.active_users.shape[0]))
-        self.model_active_users = ActiveUsersModel(users=self.active_users)
-        self.ui.listView.setModel(self.model_active_users)
+        self.ui.lineEdit_signed_in.setText(str(len(self.active_users)))
 
     def select_other_dest(self):
         self.ui.rbtn_other.setDown(1)
@@ -499,6 +901,7 @@ class Widget(QWidget):
 
     # Methods for file handling
     def manual_export(self):
+        self.finish_startup()
         if self.settings.contains("export_location"):
             self.open_location = self.settings.value("export_location")
         else:
@@ -507,14 +910,38 @@ class Widget(QWidget):
         self.manual_savepath,_ = QFileDialog.getSaveFileName(self, 'Open file', str(self.open_location), ("CSV (*.csv)"))
         app.setQuitOnLastWindowClosed(True)
         if self.manual_savepath:
-            self.data_records.to_csv(self.manual_savepath, index=False)
+            records = self.records.snapshot()
+            self.writer.replace(self.manual_savepath, lambda: records.to_frame().to_csv(index=False),
+                                message="Attendance file exported to: " + str(self.manual_savepath))
+
+    # Total hours per person over every attendance file in the export folder, the days that were already
+    # read are kept in a cache file so only new days are parsed again
+    def season_report(self):
+        app.setQuitOnLastWindowClosed(False)
+        self.report_savepath,_ = QFileDialog.getSaveFileName(self, 'Save season report',
+                                                             str(self.savepath / "season_hours.csv"), ("CSV (*.csv)"))
+        app.setQuitOnLastWindowClosed(True)
+        if not self.report_savepath:
+            return
+        try:
+            from timeclock.reports import SeasonReport
+
+            self.compact_journal()
+            self.writer.flush()
+            report = SeasonReport(self.savepath, self.ui.lineEdit_export_suffix.text())
+            totals = report.per_person()
+            self.writer.replace(self.report_savepath, totals.to_csv(index=False),
+                                message="Season report saved to: " + str(self.report_savepath))
+            self.log_message("Season report: " + str(len(report.cache.entries)) + " days, " +
+                             str(len(totals)) + " people, " + str(round(totals["Hours"].sum(), 2)) + " hours")
+        except Exception as e:
+            self.log_message("Error: Unable to generate the season report: " + str(e))
 
     def export_file_path_update(self):
         self.settings.setValue("suffix", str(self.ui.lineEdit_export_suffix.text()))
         self.export_file_name = self.start_date.toString(self.ui.lineEdit_export_prefix_format.text()) + self.ui.lineEdit_export_suffix.text() + ".csv"
         self.ui.lineEdit_export_location.setText(str(self.savepath / self.export_file_name))
-        self.ui.textEdit.append("Export file will be saved to: " + str(self.savepath / self.export_file_name))
-        self.ui.textEdit.moveCursor(QtGui.QTextCursor.End)
+        self.log_message("Export file will be saved to: " + str(self.savepath / self.export_file_name))
         self.settings.setValue("export_location", self.savepath)
         self.settings.setValue("prefix_format", self.ui.lineEdit_export_prefix_format.text())
         try:
@@ -522,6 +949,9 @@ class Widget(QWidget):
             self.ui.lineEdit_export_location.setText(str(self.savepath / self.export_file_name))
         except:
             pass
+
+        # Finish off the journal of the old attendance file before switching to the new one
+        self.engine.switch_attendance_file(self.savepath, self.export_file_name, day=self.start_date.date().toPython())
         self.setFocus()
 
     def set_export_location(self):
@@ -536,51 +966,36 @@ class Widget(QWidget):
 
         if not str(self.savepath) == ".":
             #logout people before changing files or they wont be able to log out nicely
-            self.force_signout()
+            self.force_signout(share=False)
             self.export_file_path_update()
+            if self.started:
+                self.open_log_file()
+                self.start_sync()
         else:
-            self.ui.textEdit.append("Warning: No folder selected")
-            self.ui.textEdit.moveCursor(QtGui.QTextCursor.End)
+            self.log_message("Warning: No folder selected")
 
     # Deletes the active users file and clears the active users dataframe
     def clear_temp_files(self):
+        self.compact_journal()
+        self.writer.flush()
         try:
             os.remove(self.active_users_savepath)
-            self.ui.textEdit.append("Temp Files deleted, please check attendance file for errors and restart the program")
-            self.ui.textEdit.moveCursor(QtGui.QTextCursor.End)
+            self.log_message("Temp Files deleted, please check attendance file for errors and restart the program")
         except:
-            self.ui.textEdit.append("No Temp Files found")
-            self.ui.textEdit.moveCursor(QtGui.QTextCursor.End)
+            self.log_message("No Temp Files found")
 
     # Methods for Guest table
+    # Rebuild the whole guest table, single guests coming and going only touch their own row
     def update_guest_table(self):
-        # First reset the table and set the row count
-        self.ui.tableWidget_guests.clear()
-        self.ui.tableWidget_guests.setRowCount(self.guest_users.shape[0])
-
-        # Then loop through the guest list and add them to the table
-        for index, row in self.guest_users.iterrows():
-            self.name_item = QTableWidgetItem(str(row["First_Name"]) + " " + str(row["Last_Name"]) )
-            self.ui.tableWidget_guests.setItem(index, 0, self.name_item)
-
-            self.btn_guest_signout = QPushButton('Sign Out')
-            self.btn_guest_signout.clicked.connect(self.handle_btn_guest_signout)
-            self.ui.tableWidget_guests.setCellWidget(index,1,self.btn_guest_signout)
-
-    def handle_btn_guest_signout(self):
-        button = self.sender()
-        index = self.ui.tableWidget_guests.indexAt(button.pos())
-        if index.isValid():
-            self.temp_data = [(self.guest_users.iloc[int(index.row())]['ID'],
-                                        self.guest_users.iloc[int(index.row())]['First_Name'],
-                                        self.guest_users.iloc[int(index.row())]['Last_Name'])]
-            self.temp = pd.DataFrame(self.temp_data, columns=self.active_users_columns)
-            self.temp.reset_index(drop=True, inplace=True)
-#            print(self.temp)
-            self.sign_out(signout_data=self.temp)
-        self.guest_users = self.guest_users[self.guest_users.ID != self.temp['ID'][0]]
-        self.guest_users.reset_index(drop=True, inplace=True)
-        self.update_guest_table()
+        self.model_guests.reset(self.guest_users.values())
+
+    # The button hands over the row it was clicked on, the guest is looked up by the ID in that row
+    def handle_btn_guest_signout(self, index):
+        guest_id = self.model_guests.guest_id(index.row())
+        guest = self.guest_users.get(guest_id)
+        if guest is not None:
+            self.sign_out(person=guest)
+        self.update_table_views()
 
     # Methods for handling the people csv table
     def select_file(self, initial=False):
@@ -595,27 +1010,53 @@ class Widget(QWidget):
                 'CSV Files (*.csv) ;; All Files (*)')
             app.setQuitOnLastWindowClosed(True)
         if self.people_csv_filename:
-            self.people_csv_data = pd.read_csv(self.people_csv_filename, dtype=str)
-            self.model_csv = CsvTableModel(self.people_csv_data, self.people_csv_filename)
+            try:
+                columns, rows = read_roster(self.people_csv_filename)
+            except Exception as e:
+                self.log_message("Error: Unable to open the people file: " + str(e))
+                return
+            self.model_csv = CsvTableModel(columns, rows, self.people_csv_filename, self.people)
+            self.log_message("Loaded " + str(len(rows)) + " people from: " + str(self.people_csv_filename))
+            for problem in self.people.problems():
+                self.log_message("Warning: " + problem)
+            self.model_csv.set_filter(self.ui.lineEdit_people_filter.text())
             self.ui.tableView.setModel(self.model_csv)
+            self.import_people_to_database()
             self.ui.lineEdit_people_file.setText(str(self.people_csv_filename))
             self.settings.setValue("people_csv_filename", self.people_csv_filename)
 
+    # The file is written from the table as it is, there is nothing to read back in afterwards
     def save_file(self):
         if self.model_csv:
-            self.model_csv.save_data()
-            self.select_file(1)
+            if not self.model_csv.is_dirty():
+                self.log_message("No changes to save in the people file")
+                return
+            self.model_csv.save_data(self.writer)
+            self.import_people_to_database()
 
+    def filter_people(self, text):
+        try:
+            self.model_csv.set_filter(text)
+        except AttributeError:
+            pass
+
+    # Adds as many empty rows as there are rows selected, above the first selected row
     def insert_above(self):
-        selected = self.ui.tableView.selectedIndexes()
-        row = selected[0].row() if selected else 0
-        self.model_csv.insertRows(row, 1, None)
+        rows = set(index.row() for index in self.ui.tableView.selectedIndexes())
+        row = min(rows) if rows else 0
+        self.model_csv.insertRows(row, max(len(rows), 1), None)
 
+    # The selected rows don't have to be next to each other, they are all removed in one go
     def remove_rows(self):
-        selected = self.ui.tableView.selectedIndexes()
-        num_rows = len(set(index.row() for index in selected))
-        if selected:
-            self.model_csv.removeRows(selected[0].row(), num_rows, None)
+        rows = set(index.row() for index in self.ui.tableView.selectedIndexes())
+        if rows:
+            self.model_csv.remove_rows(rows)
+
+    def undo_people_edit(self):
+        try:
+            self.model_csv.undo()
+        except AttributeError:
+            pass
 
     def eventFilter(self, object, event):
         if object == self.ui.lineEdit_destination_other and event.type() == QEvent.FocusIn:
@@ -624,150 +1065,519 @@ class Widget(QWidget):
         return False
 
 
+# Timings of each stage of a scan for the diagnostics tab, there are only a few rows so they are all replaced
+# on each refresh
+class MetricsModel(QAbstractTableModel):
+    def __init__(self, *args, **kwargs):
+        super(MetricsModel, self).__init__(*args, **kwargs)
+        self.rows = []
+
+    def data(self, index, role):
+        if role == Qt.DisplayRole:
+            return self.rows[index.row()][index.column()]
+        if role == Qt.TextAlignmentRole and index.column() > 0:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+
+    def rowCount(self, index=QModelIndex()):
+        if index.isValid():
+            return 0
+        return len(self.rows)
+
+    def columnCount(self, index=QModelIndex()):
+        if index.isValid():
+            return 0
+        return 6
+
+    def headerData(self, section, orientation, role):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return ("Stage", "Count", "p50 ms", "p95 ms", "p99 ms", "Max ms")[section]
+
+    def set_rows(self, summary):
+        self.beginResetModel()
+        self.rows = [(name, str(count)) + tuple("{:.3f}".format(value) for value in times)
+                     for name, count, *times in summary]
+        self.endResetModel()
+
+
+# Signals for passing the results of background file writes back to the GUI thread
+class PersistenceSignals(QObject):
+    written = Signal(str)
+    failed = Signal(str)
+
+
+# Signals for passing badges from the ID reader thread to the GUI thread
+class ReaderSignals(QObject):
+    scanned = Signal()
+    status = Signal(str)
+
+
+# Shows the lines of one source of the EventLog in a text box. Lines that come in together are added in one go
+# at most once a frame instead of one at a time, and the box drops the oldest lines past max_lines
+class LogConsole(QObject):
+    def __init__(self, event_log, source, text_edit, max_lines=1000, interval=16):
+        super(LogConsole, self).__init__(text_edit)
+        self.event_log = event_log
+        self.source = source
+        self.text_edit = text_edit
+        self.text_edit.document().setMaximumBlockCount(max_lines)
+        self.pending = []
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self.flush)
+
+    def append(self, message, level=None):
+        line = self.event_log.add(message, self.source, level)
+        self.pending.append(line.text)
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def flush(self):
+        if not self.pending:
+            return
+        lines, self.pending = self.pending, []
+        cursor = QtGui.QTextCursor(self.text_edit.document())
+        cursor.movePosition(QtGui.QTextCursor.End)
+        if not self.text_edit.document().isEmpty():
+            cursor.insertBlock()
+        cursor.insertText("\n".join(lines))
+        self.text_edit.moveCursor(QtGui.QTextCursor.End)
+
+
+# Signals for passing the list of serial ports from the port scanner thread to the GUI thread
+class PortSignals(QObject):
+    changed = Signal(object)
+
+
+# Signals for passing sign ins/outs from the other kiosks from the sync thread to the GUI thread
+class SyncSignals(QObject):
+    received = Signal()
+    status = Signal(str)
+
+
+# List of the people signed in, the display text of each row is worked out once when they sign in
 class ActiveUsersModel(QAbstractListModel):
     def __init__(self, *args, users=None, **kwargs):
         super(ActiveUsersModel, self).__init__(*args, **kwargs)
-        self.users = users
+        self.ids = []
+        self.texts = []
+        for person in users or []:
+            self.ids.append(person.id)
+            self.texts.append(self.display_text(person))
+
+    @staticmethod
+    def display_text(person):
+        return str(person.first_name) + " " + str(person.last_name)
 
     def data(self, index, role):
         if role == Qt.DisplayRole:
-            text = str(self.users['First_Name'][index.row()]) + " " + str(self.users['Last_Name'][index.row()])
-            return text
+            return self.texts[index.row()]
 
-    def rowCount(self, index):
-        return len(self.users)
+    def rowCount(self, index=QModelIndex()):
+        if index.isValid():
+            return 0
+        return len(self.ids)
+
+    # Methods for changing the rows, only the rows that change are sent to the view
+    def add(self, person):
+        if person.id in self.ids:
+            row = self.ids.index(person.id)
+            self.texts[row] = self.display_text(person)
+            self.dataChanged.emit(self.index(row), self.index(row))
+            return
+        row = len(self.ids)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.ids.append(person.id)
+        self.texts.append(self.display_text(person))
+        self.endInsertRows()
+
+    def remove(self, id):
+        if id not in self.ids:
+            return
+        row = self.ids.index(id)
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.ids[row]
+        del self.texts[row]
+        self.endRemoveRows()
+
+    def reset(self, users):
+        self.beginResetModel()
+        self.ids = []
+        self.texts = []
+        for person in users:
+            self.ids.append(person.id)
+            self.texts.append(self.display_text(person))
+        self.endResetModel()
+
+
+# Table of the guests signed in with their name and a sign out button, painted by ButtonDelegate
+class GuestsModel(QAbstractTableModel):
+    def __init__(self, *args, users=None, **kwargs):
+        super(GuestsModel, self).__init__(*args, **kwargs)
+        self.ids = []
+        self.texts = []
+        self.reset(users or [])
 
+    def data(self, index, role):
+        if role == Qt.DisplayRole:
+            if index.column() == 0:
+                return self.texts[index.row()]
+            return "Sign Out"
+
+    def rowCount(self, index=QModelIndex()):
+        if index.isValid():
+            return 0
+        return len(self.ids)
+
+    def columnCount(self, index=QModelIndex()):
+        if index.isValid():
+            return 0
+        return 2
 
+    def headerData(self, section, orientation, role):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return ("Guest", "")[section]
+
+    def guest_id(self, row):
+        if 0 <= row < len(self.ids):
+            return self.ids[row]
+        return None
+
+    # Methods for changing the rows, only the rows that change are sent to the view
+    def add(self, person):
+        if person.id in self.ids:
+            row = self.ids.index(person.id)
+            self.texts[row] = ActiveUsersModel.display_text(person)
+            self.dataChanged.emit(self.index(row, 0), self.index(row, 0))
+            return
+        row = len(self.ids)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.ids.append(person.id)
+        self.texts.append(ActiveUsersModel.display_text(person))
+        self.endInsertRows()
+
+    def remove(self, id):
+        if id not in self.ids:
+            return
+        row = self.ids.index(id)
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.ids[row]
+        del self.texts[row]
+        self.endRemoveRows()
+
+    def reset(self, users):
+        self.beginResetModel()
+        self.ids = []
+        self.texts = []
+        for person in users:
+            self.ids.append(person.id)
+            self.texts.append(ActiveUsersModel.display_text(person))
+        self.endResetModel()
+
+
+# Paints a push button in every cell of a column and emits clicked with the index of the cell
+class ButtonDelegate(QStyledItemDelegate):
+    clicked = Signal(QModelIndex)
+
+    def __init__(self, text, parent=None):
+        super(ButtonDelegate, self).__init__(parent)
+        self.text = text
+        self.pressed = None
+
+    def paint(self, painter, option, index):
+        button = QStyleOptionButton()
+        button.rect = option.rect.adjusted(2, 2, -2, -2)
+        button.text = self.text
+        button.state = QStyle.State_Enabled | (QStyle.State_Sunken if self.pressed == index else QStyle.State_Raised)
+        widget = option.widget
+        style = widget.style() if widget is not None else QApplication.style()
+        style.drawControl(QStyle.CE_PushButton, button, painter, widget)
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.MouseButtonPress and event.button() == Qt.LeftButton:
+            self.pressed = QModelIndex(index)
+            return True
+        if event.type() == QEvent.MouseButtonRelease and event.button() == Qt.LeftButton:
+            pressed, self.pressed = self.pressed, None
+            if pressed == index and option.rect.contains(event.pos()):
+                self.clicked.emit(QModelIndex(index))
+            return True
+        return False
+
+
+# Table of the people file. The rows are lists of the cell strings straight from the csv, the view is
+# handed them a chunk at a time as it scrolls, and sorting and filtering only reorder a list of row
+# numbers (order) instead of moving the rows themselves. Edits are kept on an undo stack as small diffs
 class CsvTableModel(QAbstractTableModel):
-    def __init__(self, data, csv_file):
+    # (dirty rows, dirty columns) of a save that couldn't be written, emitted from the writer thread
+    save_failed = Signal(object)
+
+    def __init__(self, columns, rows, csv_file, registry=None, chunk_size=500):
         super().__init__()
         self.filename = csv_file
-        self._data = data
+        self.columns = list(columns)
+        self.rows = rows
+        self.keys = list(range(len(rows)))      # stable key of every row, the registry is keyed on them
+        self.next_key = len(rows)
+        self.registry = registry    # badge/ID indexes kept in step with edits
+        self.chunk_size = chunk_size
+        self.sort_column = None
+        self.sort_order = Qt.AscendingOrder
+        self.filter_column, self.filter_text = None, ""
+        self.order = list(range(len(rows)))     # view row -> row in self.rows
+        self.loaded = min(self.chunk_size, len(self.order))
+        self.undo_stack = []
+        self.undo_limit = 200
+        self.clear_dirty()
+        self.save_failed.connect(self.restore_dirty)
+        if self.registry is not None:
+            self.registry.rebuild(self.columns, zip(self.keys, self.rows))
 
     # Minimum necessary methods:
-    def rowCount(self, parent):
-        return self._data.shape[0]
+    def rowCount(self, parent=None):
+        if parent is not None and parent.isValid():
+            return 0
+        return self.loaded
 
-    def columnCount(self, parent):
-        return self._data.shape[1]
+    def columnCount(self, parent=None):
+        if parent is not None and parent.isValid():
+            return 0
+        return len(self.columns)
 
     def data(self, index, role):
         if role in (Qt.DisplayRole, Qt.EditRole):
-            return str(self._data.iloc[index.row(), index.column()])
+            return self.rows[self.order[index.row()]][index.column()]
+
+    # Rows are handed to the view in chunks as it scrolls down
+    def canFetchMore(self, parent):
+        return not parent.isValid() and self.loaded < len(self.order)
+
+    def fetchMore(self, parent):
+        if parent.isValid():
+            return
+        count = min(self.chunk_size, len(self.order) - self.loaded)
+        if count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self.loaded, self.loaded + count - 1)
+        self.loaded += count
+        self.endInsertRows()
 
     # Additional features methods:
     def headerData(self, section, orientation, role):
         if orientation == Qt.Horizontal and role == Qt.DisplayRole:
-            return str(self._data.columns[section])
+            return str(self.columns[section])
         else:
             return super().headerData(section, orientation, role)
 
     def sort(self, column, order):
+        self.sort_column, self.sort_order = column, order
         self.layoutAboutToBeChanged.emit()  # needs to be emitted before a sort
-        self._data.sort_values(self._data.columns[column], ascending=True, inplace=True)
-        if order == Qt.DescendingOrder:
-            self._data.sort_values(self._data.columns[column], ascending=False, inplace=True)
+        self.order = self.ordered_rows()
         self.layoutChanged.emit()  # needs to be emitted after a sort
 
+    # Only look at the rows matching the filter, see parse_filter for the "Column: text" form
+    def set_filter(self, text):
+        self.filter_column, self.filter_text = parse_filter(text, self.columns)
+        self.beginResetModel()
+        self.order = self.ordered_rows()
+        self.loaded = min(self.chunk_size, len(self.order))
+        self.endResetModel()
+
+    # The rows to show, sorted with one stable sort of the row numbers and filtered
+    def ordered_rows(self):
+        order = range(len(self.rows))
+        if self.sort_column is not None and self.sort_column < len(self.columns):
+            column = self.sort_column
+            order = sorted(order, key=lambda row: self.rows[row][column],
+                           reverse=self.sort_order == Qt.DescendingOrder)
+        if self.filter_text:
+            return [row for row in order if row_matches(self.rows[row], self.filter_column, self.filter_text)]
+        return list(order)
+
     # Methods for Read/Write
     def flags(self, index):
         return super().flags(index) | Qt.ItemIsEditable
 
     def setData(self, index, value, role):
         if index.isValid() and role == Qt.EditRole:
-            self._data.iloc[index.row(), index.column()] = value
+            row = self.order[index.row()]
+            value = "" if value is None else str(value)
+            self.push_undo(("edit", self.keys[row], index.column(), self.rows[row][index.column()]))
+            self.rows[row][index.column()] = value
+            self.mark_dirty(self.keys[row], column=index.column())
             self.dataChanged.emit(index, index, [role])
             return True
         else:
             return False
 
-    # Methods for inserting or deleting
+    # Methods for inserting or deleting, positions are view rows
     def insertRows(self, position, rows, parent):
+        position = max(0, min(position, self.loaded))
+        if rows <= 0:
+            return False
         self.beginInsertRows(
             parent or QModelIndex(),
             position,
             position + rows - 1)
 
-        for i in range(rows):
-            self._data = pd.concat([self._data, pd.DataFrame([[''] * self._data.shape[1]],
-                                    columns=self._data.columns)], ignore_index=True)
+        # New rows go into the file in front of the row they were inserted above
+        at = self.order[position] if position < len(self.order) else len(self.rows)
+        keys = list(range(self.next_key, self.next_key + rows))
+        self.next_key += rows
+        self.rows[at:at] = [[""] * len(self.columns) for i in range(rows)]
+        self.keys[at:at] = keys
+        self.order = [row + rows if row >= at else row for row in self.order]
+        self.order[position:position] = range(at, at + rows)
+        self.loaded += rows
         self.endInsertRows()
+        self.push_undo(("insert", keys))
+        self.mark_dirty(*keys)
+        return True
 
     def removeRows(self, position, rows, parent):
-        self.beginRemoveRows(
-            parent or QModelIndex(),
-            position,
-            position + rows - 1)
-
-        for i in range(rows):
-            self._data = self._data.drop(labels=position, axis=0)
-
-    def save_data(self):
-        self._data.to_csv(self.filename, index=False)
-
-# Loader for loading in the UI file
-# UiLoader from https://gist.github.com/cpbotha/1b42a20c8f3eb9bb7cb8
-class UiLoader(QUiLoader):
-    """
-    Subclass :class:`~PySide.QtUiTools.QUiLoader` to create the user interface
-    in a base instance.
-    Unlike :class:`~PySide.QtUiTools.QUiLoader` itself this class does not
-    create a new instance of the top-level widget, but creates the user
-    interface in an existing instance of the top-level class.
-    This mimics the behaviour of :func:`PyQt4.uic.loadUi`.
-    """
-
-    def __init__(self, baseinstance, customWidgets=None):
-        QUiLoader.__init__(self, baseinstance)
-        self.baseinstance = baseinstance
-        self.customWidgets = customWidgets
-
-    def createWidget(self, class_name, parent=None, name=''):
-        """
-        Function that is called for each widget defined in ui file,
-        overridden here to populate baseinstance instead.
-        """
-        if parent is None and self.baseinstance:
-            # supposed to create the top-level widget, return the base instance
-            # instead
-            return self.baseinstance
+        return self.remove_rows(range(position, position + rows))
 
+    # Remove any set of view rows. The view is told about each run of neighbouring rows, from the bottom
+    # up so the row numbers it was given stay right, and the rows themselves are removed in one pass
+    def remove_rows(self, view_rows):
+        view_rows = sorted(row for row in set(view_rows) if 0 <= row < self.loaded)
+        if not view_rows:
+            return False
+        runs = []
+        for row in view_rows:
+            if runs and runs[-1][1] == row - 1:
+                runs[-1][1] = row
+            else:
+                runs.append([row, row])
+        removed = sorted(self.order[row] for row in view_rows)
+        if len(runs) > 32:
+            # Telling the view about lots of scattered rows one run at a time costs more than a reset
+            self.beginResetModel()
+            gone = set(view_rows)
+            self.order = [row for view_row, row in enumerate(self.order) if view_row not in gone]
+            self.loaded -= len(view_rows)
+            self.endResetModel()
         else:
-            if class_name in self.availableWidgets():
-                # create a new widget for child widgets
-                widget = QUiLoader.createWidget(self, class_name, parent, name)
+            for first, last in reversed(runs):
+                self.beginRemoveRows(QModelIndex(), first, last)
+                del self.order[first:last + 1]
+                self.loaded -= last - first + 1
+                self.endRemoveRows()
+
+        self.push_undo(("remove", [(row, self.keys[row], self.rows[row]) for row in removed]))
+        self.drop_rows(removed)
+        return True
+
+    # Take rows out of self.rows by their position in it and renumber order to match
+    def drop_rows(self, removed):
+        keys = [self.keys[row] for row in removed]
+        gone = set(removed)
+        self.rows = [values for row, values in enumerate(self.rows) if row not in gone]
+        self.keys = [key for row, key in enumerate(self.keys) if row not in gone]
+        self.order = [row - bisect.bisect_left(removed, row) for row in self.order if row not in gone]
+        self.mark_dirty(*keys)
+
+    # Methods for undoing edits, an insert or delete that is undone puts the view back in sorted order
+    def push_undo(self, change):
+        self.undo_stack.append(change)
+        if len(self.undo_stack) > self.undo_limit:
+            del self.undo_stack[0]
+
+    def undo(self):
+        if not self.undo_stack:
+            return False
+        change = self.undo_stack.pop()
+        if change[0] == "edit":
+            kind, key, column, value = change
+            if key not in self.keys:
+                return False
+            row = self.keys.index(key)
+            self.rows[row][column] = value
+            self.mark_dirty(key, column=column)
+            if row in self.order[:self.loaded]:
+                index = self.index(self.order.index(row), column)
+                self.dataChanged.emit(index, index, [Qt.DisplayRole, Qt.EditRole])
+            return True
 
+        self.beginResetModel()
+        if change[0] == "insert":
+            keys = set(change[1])
+            self.drop_rows([row for row, key in enumerate(self.keys) if key in keys])
+        elif change[0] == "remove":
+            # Merge the removed rows back in at their old positions in one pass
+            restored = {row: (key, values) for row, key, values in change[1]}
+            remaining = zip(self.keys, self.rows)
+            merged = [restored[row] if row in restored else next(remaining)
+                      for row in range(len(self.rows) + len(restored))]
+            restored = [key for key, values in restored.values()]
+            self.keys = [key for key, values in merged]
+            self.rows = [values for key, values in merged]
+            self.mark_dirty(*restored)
+        self.order = self.ordered_rows()
+        self.loaded = min(max(self.loaded, self.chunk_size), len(self.order))
+        self.endResetModel()
+        return True
+
+    # Methods for keeping track of unsaved changes. The badge/ID indexes are brought up to date
+    # from the rows that changed right away, so a scan sees an edited badge before it is saved
+    def mark_dirty(self, *keys, column=None):
+        self.dirty_rows.update(keys)
+        if column is not None:
+            self.dirty_columns.add(column)
+        if self.registry is not None:
+            self.refresh_registry(keys)
+
+    def refresh_registry(self, keys):
+        positions = {key: row for row, key in enumerate(self.keys)} if len(keys) > 1 else None
+        for key in keys:
+            if positions is not None:
+                row = positions.get(key)
             else:
-                # if not in the list of availableWidgets, must be a custom widget
-                # this will raise KeyError if the user has not supplied the
-                # relevant class_name in the dictionary, or TypeError, if
-                # customWidgets is None
-                try:
-                    widget = self.customWidgets[class_name](parent)
-
-                except (TypeError, KeyError) as e:
-                    raise Exception('No custom widget ' + class_name + ' found in customWidgets param of UiLoader __init__.')
-
-            if self.baseinstance:
-                # set an attribute for the new child widget on the base
-                # instance, just like PyQt4.uic.loadUi does.
-                setattr(self.baseinstance, name, widget)
-
-                # this outputs the various widget names, e.g.
-                # sampleGraphicsView, dockWidget, samplesTableView etc.
-                #print(name)
-
-            return widget
-
-def loadUi(uifile, baseinstance=None, customWidgets=None, workingDirectory=None):
-    loader = UiLoader(baseinstance, customWidgets)
-
-    if workingDirectory is not None:
-        loader.setWorkingDirectory(workingDirectory)
-
-    widget = loader.load(uifile)
-    QMetaObject.connectSlotsByName(widget)
-    return widget
+                row = self.keys.index(key) if key in self.keys else None
+            if row is None:
+                self.registry.remove_row(key)
+            else:
+                self.registry.set_row(key, self.rows[row])
+
+    def is_dirty(self):
+        return bool(self.dirty_rows)
+
+    def clear_dirty(self):
+        self.dirty_rows = set()       # keys of the rows edited, added or removed since the last save
+        self.dirty_columns = set()
+
+    # A save that failed leaves its rows unsaved again, along with anything edited since
+    def restore_dirty(self, dirty):
+        self.dirty_rows.update(dirty[0])
+        self.dirty_columns.update(dirty[1])
+
+    # The rows are copied so the file can be written on the writer thread while editing goes on
+    def save_data(self, writer=None):
+        columns, rows = list(self.columns), [list(row) for row in self.rows]
+        message = ("People file saved: " + str(len(self.dirty_rows)) + " rows changed, " +
+                   str(len(rows)) + " rows total")
+        if writer is not None:
+            dirty = (set(self.dirty_rows), set(self.dirty_columns))
+            writer.replace(self.filename, lambda: roster_text(columns, rows), message=message,
+                           on_failed=lambda: self.save_failed.emit(dirty))
+        else:
+            write_atomic(self.filename, roster_text(columns, rows))
+        self.clear_dirty()
+
+# The Ui_Widget class from ui_form.py, made with "pyside2-uic form.ui -o ui_form.py". Outside of the exe a
+# ui_form.py older than form.ui is ignored so edits made in Qt Designer show up without recompiling
+def compiled_form(ui_path):
+    try:
+        from ui_form import Ui_Widget
+    except ImportError:
+        return None
+    if not getattr(sys, 'frozen', False):
+        try:
+            if os.path.getmtime(ui_path) > os.path.getmtime(sys.modules['ui_form'].__file__):
+                return None
+        except (OSError, TypeError):
+            pass
+    return Ui_Widget
 
 # A method allowing the program to find the bundled UI file when packaged as an exe
 def resource_path(relative_path):
@@ -1,13 +1,17 @@
 # -*- mode: python -*-
+import subprocess
 
 block_cipher = None
 
+# Compile form.ui so the exe builds its widgets directly instead of parsing the ui file at startup
+subprocess.check_call(['pyside2-uic', 'form.ui', '-o', 'ui_form.py'])
+
 
 a = Analysis(['main.py'],
              pathex=['C:\\Users\\Andy\\Dropbox\\Projects\\2021_FRC\\py36venv\\Lib\\site-packages\\shiboken2', 'C:\\Users\\Andy\\Dropbox\\Projects\\2021_FRC\\py36venv\\TimeClock2'],
              binaries=[],
              datas=[('form.ui', '.'), ('4418.png', '.')],
-             hiddenimports=['PySide2.QtXml'],
+             hiddenimports=['PySide2.QtXml', 'ui_form'],
              hookspath=[],
              runtime_hooks=[],
              excludes=[],
@@ -0,0 +1,64 @@
+# This Python file uses the following encoding: utf-8
+# Shared fixtures, the kiosk fixture needs a PySide2 that main.py can import and is skipped without it
+
+import os
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+
+# A headless engine on an attendance file in tmp_path, stopped at the end of the test
+@pytest.fixture
+def engine(tmp_path):
+    from timeclock.engine import TimeClockEngine
+    from timeclock.persistence import PersistenceWorker
+
+    writer = PersistenceWorker()
+    writer.start()
+    engine = TimeClockEngine(writer=writer)
+    engine.load_people(shutil.copy(ROOT / "Sample_CSV_Files" / "test_people.csv", tmp_path / "people.csv"))
+    engine.set_paths(tmp_path, "20261018_attendance.csv")
+    engine.load()
+    yield engine
+    engine.close()
+    writer.stop()
+
+
+# Makes main.Widget's with their settings in an ini file and the export folder in tmp_path
+@pytest.fixture
+def kiosk(tmp_path, monkeypatch):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    # Older PySide2 versions are missing some of what main.py imports, ie QRegularExpressionValidator in 5.13
+    try:
+        import main
+    except ImportError as e:
+        pytest.skip("main.py can't be imported: " + str(e))
+    from PySide2.QtCore import QSettings
+    from PySide2.QtWidgets import QApplication
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, "app", QApplication.instance() or QApplication([]), raising=False)
+    settings_path = str(tmp_path / "settings.ini")
+    monkeypatch.setattr(main, "QSettings", lambda organization, application: QSettings(settings_path,
+                                                                                      QSettings.IniFormat))
+    settings = QSettings(settings_path, QSettings.IniFormat)
+    settings.setValue("people_csv_filename",
+                      str(shutil.copy(ROOT / "Sample_CSV_Files" / "test_people.csv", tmp_path / "people.csv")))
+    settings.sync()
+
+    widgets = []
+
+    def make():
+        widget = main.Widget()
+        widget.finish_startup()
+        widgets.append(widget)
+        return widget
+    yield make
+    for widget in widgets:
+        widget.close()
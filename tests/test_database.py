@@ -0,0 +1,57 @@
+# This Python file uses the following encoding: utf-8
+# The SQLite copy of the attendance records
+
+from datetime import date
+
+from timeclock.database import AttendanceDatabase
+from timeclock.engine import FORCED_DESTINATION
+
+
+def test_sessions_after_midnight_stay_on_the_meeting_day(engine):
+    engine.set_paths(engine.savepath, "20261018_attendance.csv", date(2026, 10, 18))
+    engine.set_use_database(True)
+    engine.sign_in(engine.people.find_id("1"), "2026-10-19_00:30:00")
+    engine.force_signout("2026-10-19_01:00:00")
+
+    sessions = engine.journal.sessions("2026-10-18", "2026-10-18")
+    assert [(id, time_in, destination) for id, _, _, time_in, _, destination, _ in sessions] == \
+        [("1", "2026-10-19_00:30:00", FORCED_DESTINATION)]
+    assert engine.journal.sessions("2026-10-19", "2026-10-19") == []
+
+    # The next meeting is on the day of the cutoff
+    engine.roll_over("20261019_attendance.csv", time_out="2026-10-19_04:00:00")
+    assert engine.journal.day == "2026-10-19"
+
+
+def test_import_marks_forced_sign_outs(tmp_path):
+    database = AttendanceDatabase(tmp_path / "attendance.sqlite3", tmp_path / "20261018_attendance.csv",
+                                  day=date(2026, 10, 18))
+    records = [("1", "Andy", "Hegemann", "2026-10-18_18:00:00", "2026-10-19_00:10:00", FORCED_DESTINATION, "6.17"),
+               ("2", "Jane", "Hunter", "2026-10-18_18:00:00", "2026-10-18_20:00:00", "Home", "2.0")]
+    assert database.import_records(records) == 2
+
+    forced = database._connection.execute("SELECT id, day FROM sessions WHERE forced = 1").fetchall()
+    assert forced == [("1", "2026-10-18")]
+    database.close()
+
+
+def test_scans_are_written_on_the_writer_thread(tmp_path):
+    from timeclock.journal import SIGN_IN, SIGN_OUT
+    from timeclock.persistence import PersistenceWorker
+
+    writer = PersistenceWorker()
+    database = AttendanceDatabase(tmp_path / "attendance.sqlite3", tmp_path / "20261018_attendance.csv",
+                                  day=date(2026, 10, 18), writer=writer)
+    database.append(SIGN_IN, id="1", first_name="Andy", last_name="Hegemann", time_in="2026-10-18_18:00:00")
+    database.append(SIGN_OUT, id="1", time_in="2026-10-18_18:00:00", time_out="2026-10-18_20:00:00",
+                    destination="Home", hours=2.0)
+    assert database._connection.execute("SELECT COUNT(*) FROM sessions").fetchone() == (0,)
+
+    # Both scans were queued before the writer got to them, so they go in as one transaction
+    writer.start()
+    assert database.sessions("2026-10-18", "2026-10-18") == \
+        [("1", "Andy", "Hegemann", "2026-10-18_18:00:00", "2026-10-18_20:00:00", "Home", 2.0)]
+    assert writer.writes == 1
+    assert [event['type'] for event in database.replay()] == [SIGN_IN, SIGN_OUT]
+    database.close()
+    writer.stop()
@@ -0,0 +1,70 @@
+# This Python file uses the following encoding: utf-8
+# Getting back to where the program was from the csv files and the journal
+
+import shutil
+
+from conftest import ROOT
+from timeclock.engine import TimeClockEngine
+from timeclock.journal import AttendanceJournal, SIGN_IN, SIGN_OUT
+
+
+def load_engine(folder, writer):
+    engine = TimeClockEngine(writer=writer)
+    engine.load_people(ROOT / "Sample_CSV_Files" / "test_people.csv")
+    engine.set_paths(folder, "20261018_attendance.csv")
+    engine.load()
+    return engine
+
+
+def test_torn_last_line_is_skipped(tmp_path):
+    journal = AttendanceJournal(tmp_path / "20261018_attendance.journal")
+    journal.append(SIGN_IN, id="1", first_name="Andy", last_name="Hegemann", time_in="2026-10-18_18:00:00")
+    journal.append(SIGN_OUT, id="1", time_in="2026-10-18_18:00:00", time_out="2026-10-18_20:00:00",
+                   destination="Home", hours=2.0)
+    journal.close()
+    with open(journal.path, 'a', encoding='utf-8') as journal_file:
+        journal_file.write('{"type":"sign_in","id":"2","first_na')
+
+    assert [event['type'] for event in journal.replay()] == [SIGN_IN, SIGN_OUT]
+
+
+# A crash after the csv files were written but before the journal was emptied replays events that are
+# already in the csv files, they must not show up twice
+def test_replay_is_idempotent(engine, tmp_path):
+    engine.sign_in(engine.people.find_id("1"), "2026-10-18_18:00:00")
+    engine.sign_in(engine.people.find_id("2"), "2026-10-18_18:05:00")
+    engine.sign_out(engine.people.find_id("1"), "Work", "2026-10-18_20:00:00")
+    engine.writer.flush()
+    journal_text = engine.journal.path.read_text()
+    engine.compact_journal()
+    engine.writer.flush()
+    expected = engine.records.to_frame()
+
+    for _ in range(2):
+        engine.journal.path.write_text(journal_text + '{"type":"sign_out","id":"2","time_in":"2026-10-18_1')
+        replayed = load_engine(tmp_path, engine.writer)
+        engine.writer.flush()
+
+        assert replayed.records.to_frame().equals(expected)
+        assert list(replayed.active_users) == ["2"]
+        assert replayed.journal.path.read_text() == ""
+        replayed.close()
+
+
+def test_journal_alone_brings_back_the_day(tmp_path):
+    from timeclock.persistence import PersistenceWorker
+
+    writer = PersistenceWorker()
+    writer.start()
+    shutil.copy(ROOT / "Sample_CSV_Files" / "test_people.csv", tmp_path / "people.csv")
+    engine = load_engine(tmp_path, writer)
+    engine.sign_in(engine.people.find_id("1"), "2026-10-18_18:00:00")
+    engine.guest_sign_in("Jane", "Doe", "2026-10-18_18:01:00")
+    writer.flush()
+    # The program died before the csv files were ever written
+
+    replayed = load_engine(tmp_path, writer)
+    assert list(replayed.active_users) == ["1", "G20261018180100"]
+    assert list(replayed.guest_users) == ["G20261018180100"]
+    replayed.close()
+    writer.stop()
@@ -0,0 +1,25 @@
+# This Python file uses the following encoding: utf-8
+# Editing and saving the people file from the settings page
+
+
+def test_failed_save_leaves_the_edits_unsaved(kiosk, tmp_path):
+    from PySide2.QtCore import Qt
+    from PySide2.QtWidgets import QApplication
+
+    widget = kiosk()
+    model = widget.model_csv
+    model.setData(model.index(0, 1), "Andrew", Qt.EditRole)
+    model.filename = str(tmp_path / "missing" / "people.csv")
+
+    widget.save_file()
+    widget.writer.flush()
+    QApplication.processEvents()
+
+    assert model.is_dirty()
+    model.filename = str(tmp_path / "people.csv")
+    widget.save_file()
+    widget.writer.flush()
+    QApplication.processEvents()
+
+    assert not model.is_dirty()
+    assert "1,Andrew,Hegemann" in (tmp_path / "people.csv").read_text()
@@ -0,0 +1,66 @@
+# This Python file uses the following encoding: utf-8
+# The background writer
+
+from timeclock.persistence import PersistenceWorker
+
+
+def test_failed_replace_calls_back_for_every_merged_request(tmp_path):
+    failed = []
+    path = tmp_path / "missing" / "people.csv"
+    batch = [("replace", path, "old", None, (lambda: failed.append("old"),)),
+             ("replace", path, "new", None, (lambda: failed.append("new"),))]
+
+    writer = PersistenceWorker()
+    for request in writer.merge(batch):
+        writer.handle(request)
+
+    assert failed == ["old", "new"]
+
+
+def test_replace_only_calls_back_when_it_fails(tmp_path):
+    failed = []
+    writer = PersistenceWorker()
+    writer.start()
+    writer.replace(tmp_path / "people.csv", "ID\n", on_failed=lambda: failed.append("written"))
+    writer.replace(tmp_path / "missing" / "people.csv", "ID\n", on_failed=lambda: failed.append("missing"))
+    writer.stop()
+
+    assert failed == ["missing"]
+    assert (tmp_path / "people.csv").read_text() == "ID\n"
+
+
+def test_merged_appends_keep_their_order_and_stop_at_a_barrier(tmp_path):
+    journal, other = tmp_path / "a.journal", tmp_path / "b.journal"
+    batch = [("append", journal, "1\n", False), ("append", journal, "2\n", True), ("append", other, "x\n", False),
+             ("append", journal, "3\n", False), ("barrier", None), ("append", journal, "4\n", False)]
+
+    assert PersistenceWorker.merge(batch) == [("append", journal, "1\n2\n", True), ("append", other, "x\n", False),
+                                              ("append", journal, "3\n", False), ("barrier", None),
+                                              ("append", journal, "4\n", False)]
+
+
+def test_only_the_newest_snapshot_before_a_barrier_is_written(tmp_path):
+    path = tmp_path / "people.csv"
+    batch = [("replace", path, "old", None, ()), ("barrier", None), ("replace", path, "middle", None, ()),
+             ("replace", path, "new", None, ())]
+
+    assert PersistenceWorker.merge(batch) == [batch[0], batch[1], batch[3]]
+
+
+# Events journaled after a compaction was queued must stay in the journal, the ones before it are in the snapshot
+def test_compaction_empties_the_journal_in_order(tmp_path):
+    journal, attendance = tmp_path / "20261018_attendance.journal", tmp_path / "20261018_attendance.csv"
+    writer = PersistenceWorker()
+    writer.append(journal, "event 1\n")
+    writer.compact(journal, [(attendance, "snapshot 1")])
+    writer.append(journal, "event 2\n")
+    writer.compact(journal, [(attendance, lambda: "snapshot 2")])
+    writer.append(journal, "event 3\n")
+    writer.start()
+    writer.flush()
+
+    assert attendance.read_text() == "snapshot 2"
+    assert journal.read_text() == "event 3\n"
+    # The older compaction was merged into the newer one
+    assert writer.writes == 5
+    writer.stop()
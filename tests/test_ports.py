@@ -0,0 +1,32 @@
+# This Python file uses the following encoding: utf-8
+# Remembering the serial ports of the readers
+
+import json
+
+from timeclock.ports import PortInfo
+
+
+READER = PortInfo("/dev/ttyUSB1", "USB-SERIAL CH340", "1A86:7523", "", "1-1.2")
+OTHER = PortInfo("/dev/ttyUSB0", "FT232R USB UART", "0403:6001", "A50285BI", "1-1.3")
+
+
+def test_old_port_index_is_kept_as_the_port(kiosk, tmp_path):
+    from PySide2.QtCore import QSettings
+
+    settings = QSettings(str(tmp_path / "settings.ini"), QSettings.IniFormat)
+    settings.setValue("com_index", 2)
+    settings.sync()
+    widget = kiosk()
+
+    # Nothing to match the index against yet
+    widget.ports_changed([])
+    assert widget.settings.value("com_index") is not None
+
+    widget.ports_changed([OTHER, READER])
+    assert widget.id_reader_com_port == READER.device
+    assert json.loads(widget.settings.value("com_port"))["location"] == READER.location
+    assert not widget.settings.contains("com_index")
+
+    # From now on the port is found by what it is rather than where it is in the list
+    widget.ports_changed([READER._replace(device="/dev/ttyUSB3"), OTHER])
+    assert widget.id_reader_com_port == "/dev/ttyUSB3"
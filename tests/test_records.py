@@ -0,0 +1,45 @@
+# This Python file uses the following encoding: utf-8
+# The columnar store for the attendance records
+
+from timeclock.records import RecordStore, parse_time
+
+
+def test_growing_keeps_the_records():
+    store = RecordStore(capacity=2)
+    for number in range(5):
+        store.add(str(number), "First" + str(number), "Last", parse_time("2026-10-18_18:00:0" + str(number)))
+    store.close("1", parse_time("2026-10-18_19:00:01"), "Work")
+
+    assert len(store) == 5 and len(store._id) == 8
+    frame = store.to_frame()
+    assert frame["ID"].tolist() == ["0", "1", "2", "3", "4"]
+    assert frame["First_Name"].tolist() == ["First0", "First1", "First2", "First3", "First4"]
+    assert frame["Time_In"].tolist()[4] == "2026-10-18_18:00:04"
+    assert frame.loc[1, ["Time_Out", "Destination", "Hours"]].tolist() == ["2026-10-18_19:00:01", "Work", 1.0]
+    assert sorted(store.open_sessions) == ["0", "2", "3", "4"]
+
+
+def test_close_many_works_out_hours_like_close():
+    times_in = ["2026-10-18_18:00:00", "2026-10-18_18:17:13", "2026-10-18_21:59:59"]
+    one_by_one, all_at_once = RecordStore(), RecordStore()
+    for store in (one_by_one, all_at_once):
+        for number, time_in in enumerate(times_in):
+            store.add(str(number), "First", "Last", parse_time(time_in))
+    time_out = parse_time("2026-10-18_21:45:00")
+
+    closed = [one_by_one.close(str(number), time_out, "Forced Sign Out") for number in range(2)]
+    closed_many = all_at_once.close_many(["0", "1"], time_out, "Forced Sign Out")
+
+    assert [(time_in, hours) for _, time_in, _, hours in closed_many] == closed
+    assert all_at_once.to_frame().equals(one_by_one.to_frame())
+
+
+def test_close_many_never_closes_before_the_sign_in():
+    store = RecordStore()
+    store.add("1", "Andy", "Hegemann", parse_time("2026-10-18_18:00:00"))
+
+    closed = store.close_many(["1", "2"], parse_time("2026-10-18_17:00:00"), "Day Rollover")
+
+    assert closed == [("1", parse_time("2026-10-18_18:00:00"), parse_time("2026-10-18_18:00:00"), 0.0)]
+    assert store.to_frame().loc[0, ["Time_Out", "Hours"]].tolist() == ["2026-10-18_18:00:00", 0.0]
+    assert not store.open_sessions
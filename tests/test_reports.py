@@ -0,0 +1,42 @@
+# This Python file uses the following encoding: utf-8
+# Season totals and the cache of the parsed attendance files
+
+import json
+import pickle
+
+from timeclock.reports import CACHE_NAME, SeasonReport
+
+
+ATTENDANCE = ("ID,First_Name,Last_Name,Time_In,Time_Out,Destination,Hours\n"
+              "1,Andy,Hegemann,2026-10-17_18:00:00,2026-10-17_20:30:00,Home,2.5\n"
+              "2,Bob,Smith,2026-10-17_18:00:00,,,\n")
+
+
+def write_season(folder):
+    (folder / "20261017_attendance.csv").write_text(ATTENDANCE)
+    (folder / "20261018_attendance.csv").write_text(ATTENDANCE.replace("2026-10-17", "2026-10-18"))
+
+
+def test_cached_totals_match_the_files(tmp_path):
+    write_season(tmp_path)
+    expected = SeasonReport(tmp_path, use_cache=False).per_person()
+
+    first = SeasonReport(tmp_path)
+    assert first.per_person().equals(expected)
+    assert first.cache.parsed == 2
+    second = SeasonReport(tmp_path)
+    assert second.per_person().equals(expected)
+    assert second.cache.parsed == 0
+
+    cache = json.loads((tmp_path / CACHE_NAME).read_text())
+    assert cache["entries"]["20261017_attendance.csv"]["columns"]["Hours"] == [2.5, None]
+
+
+def test_cache_is_never_unpickled(tmp_path):
+    write_season(tmp_path)
+    (tmp_path / CACHE_NAME).write_bytes(pickle.dumps({"version": 2, "entries": {}}))
+
+    report = SeasonReport(tmp_path)
+
+    assert report.per_person()["Hours"].tolist() == [5.0, 0.0]
+    assert report.cache.parsed == 2
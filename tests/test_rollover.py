@@ -0,0 +1,60 @@
+# This Python file uses the following encoding: utf-8
+# Starting the next attendance file at the cutoff time
+
+from timeclock.engine import FORCED_DESTINATION
+
+
+def test_cutoff_edit_mid_meeting_does_not_roll_over(kiosk):
+    widget = kiosk()
+    widget.sign_inout(False, "2044677555")
+    export_file_name = widget.export_file_name
+
+    # Moving the cutoff past the current time used to put the meeting on the day before
+    widget.ui.timeEdit.setTime(widget.current_date_time.time().addSecs(3600))
+    widget.update_clock()
+
+    assert widget.export_file_name == export_file_name
+    assert list(widget.active_users) == ["1"]
+    assert (widget.records.to_frame()["Hours"].dropna() >= 0).all()
+
+
+def test_edited_cutoff_starts_with_the_next_meeting(kiosk):
+    from PySide2.QtCore import QDateTime, QTime
+
+    widget = kiosk()
+    widget.ui.timeEdit.setTime(QTime(4, 0))
+    widget.cutoff_time = QTime(4, 0)
+    widget.ui.timeEdit.setTime(QTime(6, 0))
+    start_date = widget.start_date.date()
+
+    widget.current_date_time = QDateTime(start_date.addDays(1), QTime(4, 0, 7))
+    assert widget.meeting_date(widget.current_date_time).date() > start_date
+    widget.roll_over()
+
+    assert widget.start_date.date() == start_date.addDays(1)
+    assert widget.cutoff_time == QTime(6, 0)
+    # 05:00 is before the new cutoff but the meeting that just started stays
+    widget.current_date_time = QDateTime(start_date.addDays(1), QTime(5, 0))
+    assert widget.meeting_date(widget.current_date_time).date() < widget.start_date.date()
+
+
+def test_roll_over_never_signs_out_before_the_sign_in(engine):
+    person = engine.people.find_id("1")
+    engine.sign_in(person, "2026-10-18_14:55:44")
+
+    signed_out, missing = engine.roll_over("20261017_attendance.csv", time_out="2026-10-17_15:55:44")
+    engine.writer.flush()
+
+    assert signed_out == [(person, 0.0)]
+    assert not missing
+    with open(engine.savepath / "20261018_attendance.csv") as attendance_file:
+        assert attendance_file.read().splitlines()[1] == ("1,Andy,Hegemann,2026-10-18_14:55:44,2026-10-18_14:55:44," +
+                                                          FORCED_DESTINATION + ",0.0")
+
+
+def test_carry_over_starts_when_the_person_signed_in(engine):
+    engine.sign_in(engine.people.find_id("1"), "2026-10-18_14:55:44")
+
+    engine.roll_over("20261019_attendance.csv", carry_over=True, time_out="2026-10-17_15:55:44")
+
+    assert engine.records.to_frame()["Time_In"].tolist() == ["2026-10-18_14:55:44"]
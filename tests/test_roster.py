@@ -0,0 +1,23 @@
+# This Python file uses the following encoding: utf-8
+# Loading the people file and looking people up
+
+from timeclock.people import PeopleRegistry
+from timeclock.roster import read_roster
+
+
+PEOPLE = ("ID,First_Name,Last_Name,Student?,Badge\n"
+          "1,Andy,Hegemann,No, 0012345678 \n"
+          "2,Bob,Smith,No,12345678\n"
+          "2,Bo,Smith,No,999\n")
+
+
+def test_badges_are_normalized_and_problems_reported(tmp_path):
+    path = tmp_path / "people.csv"
+    path.write_text(PEOPLE)
+    columns, rows = read_roster(path)
+    people = PeopleRegistry()
+    people.rebuild(columns, enumerate(rows))
+
+    assert people.find_badge("0000012345678\r").id == "1"
+    assert people.problems() == ["ID 2 is in the people file 2 times, Bob Smith, Bo Smith (the first one is used)",
+                                 "Badge 12345678 is given to Andy Hegemann, Bob Smith (the first one is used)"]
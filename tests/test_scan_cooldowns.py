@@ -0,0 +1,48 @@
+# This Python file uses the following encoding: utf-8
+# Repeat reads of a badge held on the reader
+
+def test_cooldowns_are_saved_off_the_scan_path(kiosk):
+    widget = kiosk()
+    widget.enable_id_reader_thread(1)
+    widget.read_id("2044677555")
+    widget.read_id("2044677555")
+
+    assert list(widget.active_users) == ["1"]
+    assert not widget.settings.contains("scan_cooldowns")
+
+    widget.save_scan_cooldowns()
+    assert list(widget.settings.value("scan_cooldowns")) == ["2044677555"]
+    assert not widget.scan_debouncer.changed
+
+
+def test_cooldowns_survive_a_restart(kiosk):
+    widget = kiosk()
+    widget.enable_id_reader_thread(1)
+    widget.read_id("2044677555")
+    widget.close()
+
+    widget = kiosk()
+    widget.enable_id_reader_thread(1)
+    widget.read_id("2044677555")
+    assert list(widget.active_users) == ["1"]
+
+
+def test_same_badge_with_leading_zeros_is_a_repeat():
+    from timeclock.debounce import ScanDebouncer
+
+    debouncer = ScanDebouncer(window=10.0)
+    assert debouncer.accept("0042", now=100.0)
+    assert not debouncer.accept(" 42\r", now=101.0)
+    assert debouncer.accept("420", now=102.0)
+
+
+def test_zero_window_passes_every_read_from_the_readers(kiosk):
+    widget = kiosk()
+    widget.enable_id_reader_thread(1)
+    widget.ui.doubleSpinBox_debounce.setValue(0)
+    widget.id_readers._badge("North Door", "2044677555")
+    widget.id_readers._badge("North Door", "2044677555")
+    widget.read_scans()
+
+    assert not widget.active_users
+    assert len(widget.records) == 1
@@ -0,0 +1,28 @@
+# This Python file uses the following encoding: utf-8
+# Signing in and out with a badge or the ID field
+
+def test_badge_toggles_the_person_in_and_out(engine):
+    person, signed_in, signed_out = engine.toggle_badge(" 02044677555", "Work", "2026-10-18_18:00:00")
+    assert (person.id, signed_in, signed_out) == ("1", True, None)
+
+    person, signed_in, signed_out = engine.toggle_badge("2044677555", "Work", "2026-10-18_19:30:00")
+    assert (person.id, signed_in, signed_out[1]) == ("1", False, 1.5)
+    assert engine.records.to_frame()["Destination"].tolist() == ["Work"]
+
+    assert engine.toggle_badge("999", "Work") == (None, None, None)
+
+
+def test_id_field_uses_the_destination_buttons(kiosk):
+    widget = kiosk()
+    widget.ui.lineEdit_id_enter.setText("1")
+    widget.sign_inout()
+    widget.ui.rbtn_other.setChecked(True)
+    widget.ui.lineEdit_destination_other.setText("Robot Shop")
+    widget.ui.lineEdit_id_enter.setText("1")
+    widget.sign_inout()
+
+    assert not widget.active_users
+    assert widget.records.to_frame()["Destination"].tolist() == ["Robot Shop"]
+    assert widget.ui.rbtn_home.isChecked()
+    widget.main_log.flush()
+    assert "Destination: Robot Shop" in widget.ui.textEdit.toPlainText().splitlines()[-1]
@@ -0,0 +1,145 @@
+# This Python file uses the following encoding: utf-8
+# Two kiosks and a sync server over loopback
+
+import asyncio
+import shutil
+import threading
+import time
+
+import pytest
+
+from conftest import ROOT
+from timeclock.engine import TimeClockEngine
+from timeclock.persistence import PersistenceWorker
+from timeclock.sync import SNAPSHOT, SyncClient, SyncServer
+
+
+FILE_NAME = "20261018_attendance.csv"
+
+
+class ServerThread(threading.Thread):
+    def __init__(self, server):
+        super().__init__(daemon=True)
+        self.server = server
+        self.port = None
+        self.ready = threading.Event()
+        self.loop = asyncio.new_event_loop()
+
+    def run(self):
+        async def serve():
+            self.port = await self.server.start("127.0.0.1", 0)
+            self.ready.set()
+            await self.server._server.serve_forever()
+        try:
+            self.loop.run_until_complete(serve())
+        except asyncio.CancelledError:
+            pass
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(lambda: [task.cancel() for task in asyncio.all_tasks(self.loop)])
+        self.join(2)
+        self.server.close()
+
+
+class Kiosk:
+    def __init__(self, folder, name, port):
+        folder.mkdir()
+        self.folder = folder
+        self.name = name
+        self.port = port
+        self.writer = PersistenceWorker()
+        self.writer.start()
+        self.engine = TimeClockEngine(writer=self.writer)
+        self.engine.load_people(shutil.copy(ROOT / "Sample_CSV_Files" / "test_people.csv", folder / "people.csv"))
+        self.engine.set_paths(folder, FILE_NAME)
+        self.engine.load()
+        self.client = None
+        self.offline = []
+        self.connect()
+
+    def connect(self):
+        self.client = SyncClient("127.0.0.1:" + str(self.port), self.name, self.folder, interval=0.05,
+                                 retry_delay=0.1)
+        self.engine.on_event = self.client.record
+        for event in self.offline:
+            self.client.record(event)
+        self.offline = []
+        self.client.start()
+
+    # Like losing the network, events from the engine wait until connect()
+    def disconnect(self):
+        self.client.stop()
+        self.client = None
+        self.engine.on_event = self.offline.append
+
+    def close(self):
+        if self.client is not None:
+            self.client.stop()
+        self.engine.close()
+        self.writer.stop()
+
+
+@pytest.fixture
+def kiosks(tmp_path):
+    server = ServerThread(SyncServer(history=3))
+    server.start()
+    server.ready.wait(5)
+    front = Kiosk(tmp_path / "front", "Front", server.port)
+    back = Kiosk(tmp_path / "back", "Back", server.port)
+    yield front, back
+    front.close()
+    back.close()
+    server.stop()
+
+
+# Apply what the kiosks get from the server until check() is true
+def settle(check, *kiosks, timeout=5.0):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        for kiosk in kiosks:
+            if kiosk.client is not None:
+                kiosk.engine.apply_remote_events(kiosk.client.drain())
+        if check():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_snapshot_signs_out_people_that_left_during_the_gap(kiosks):
+    front, back = kiosks
+    andy = front.engine.people.find_id("1")
+    front.engine.sign_in(andy)
+    assert settle(lambda: "1" in back.engine.active_users, front, back)
+
+    back.disconnect()
+    front.engine.sign_out(andy, "Work")
+    # More events than the server keeps, so the back kiosk gets a snapshot instead of the sign out
+    for id in ("2", "4"):
+        front.engine.sign_in(front.engine.people.find_id(id))
+        front.engine.sign_out(front.engine.people.find_id(id), "Home")
+    back.engine.sign_in(back.engine.people.find_id("13"))
+    assert settle(lambda: front.client.waiting == 0, front)
+    back.connect()
+
+    assert settle(lambda: "1" not in back.engine.active_users, back)
+    assert list(back.engine.active_users) == ["13"]
+    record = back.engine.records.to_frame().iloc[0]
+    assert (record["ID"], record["Destination"]) == ("1", "Work")
+    assert settle(lambda: "13" in front.engine.active_users, front)
+
+
+def test_snapshot_leaves_people_with_local_changes_alone(engine):
+    andy = engine.people.find_id("1")
+    engine.sign_in(andy, "2026-10-18_18:00:00")
+    sign_out = {'type': "sign_out", 'id': "1", 'time_in': "2026-10-18_17:00:00", 'time_out': "2026-10-18_17:30:00",
+                'destination': "Work", 'file': engine.export_file_name, 'kiosk': "Back"}
+    snapshot = {'type': SNAPSHOT, 'active': [], 'closed': [sign_out]}
+
+    assert engine.apply_remote_events([dict(snapshot, keep=["1"])]) == []
+    # The sign out elsewhere was before this sign in, so it isn't this session's
+    assert engine.apply_remote_events([snapshot]) == []
+    assert list(engine.active_users) == ["1"]
+
+    sign_out['time_out'] = "2026-10-18_19:00:00"
+    assert engine.apply_remote_events([snapshot]) == [(sign_out, andy, False)]
+    assert not engine.active_users
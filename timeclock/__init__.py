@@ -0,0 +1,2 @@
+# This Python file uses the following encoding: utf-8
+# Core pieces of the time clock that don't depend on the Qt widgets
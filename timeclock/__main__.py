@@ -0,0 +1,9 @@
+# This Python file uses the following encoding: utf-8
+# Lets the headless command line be run with "python -m timeclock"
+
+import sys
+
+from timeclock.cli import main
+
+
+sys.exit(main())
@@ -0,0 +1,313 @@
+# This Python file uses the following encoding: utf-8
+# Headless command line for running the time clock without the GUI, ie on a Raspberry Pi at the door
+#
+#   python -m timeclock serve --people people.csv --reader "North Door=/dev/ttyUSB0"
+#   python -m timeclock signout-all
+#   python -m timeclock export --output today.csv
+#   python -m timeclock report --by week
+#   python -m timeclock sync-server --port 8765
+#
+# Nothing here imports Qt, the files written are the same ones the GUI writes.
+
+import argparse
+import signal
+import socket
+import sys
+import threading
+import time as clock
+from datetime import datetime, time
+from pathlib import Path
+
+from timeclock.engine import TimeClockEngine, FORCED_DESTINATION, attendance_file_name, is_guest, meeting_day
+from timeclock.metrics import Metrics
+from timeclock.persistence import PersistenceWorker
+from timeclock.records import TIME_FORMAT
+
+
+def log(message):
+    print(message, flush=True)
+
+
+def clock_text():
+    return datetime.now().strftime("%H:%M:%S")
+
+
+def cutoff_time(text):
+    try:
+        return time.fromisoformat(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected a time like 04:00")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m timeclock", description="Headless FRC time clock")
+    parser.add_argument("--export-dir", default=str(Path.cwd()),
+                        help="folder with the attendance files (default: current folder)")
+    parser.add_argument("--prefix-format", default="%Y%m%d", help="strftime format of the file name prefix")
+    parser.add_argument("--suffix", default="_attendance", help="attendance file name suffix")
+    parser.add_argument("--sqlite", action="store_true", help="also keep attendance in attendance.sqlite3")
+    parser.add_argument("--cutoff", type=cutoff_time, default=time(4, 0),
+                        help="time a new attendance file is started, earlier times count as the day before")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="sign people in and out from badge readers")
+    serve.add_argument("--people", required=True, help="people csv file")
+    serve.add_argument("--reader", action="append", default=[], metavar="NAME=PORT",
+                       help="badge reader to open, can be given more than once")
+    serve.add_argument("--destination", default="Home", help="destination recorded on sign out")
+    serve.add_argument("--debounce", type=float, default=10.0, help="seconds repeat scans of a badge are ignored")
+    serve.add_argument("--metrics-interval", type=float, default=60.0,
+                       help="seconds between writing the scan timings to timeclock_metrics.json/.prom, 0 to turn off")
+    serve.add_argument("--carry-over", action="store_true",
+                       help="at the cutoff sign people back in on the new file instead of signing them out")
+    serve.add_argument("--sync", metavar="HOST:PORT", help="sync server to share sign ins/outs with the other kiosks")
+    serve.add_argument("--kiosk", default=socket.gethostname(), help="name of this kiosk on the sync server")
+
+    commands.add_parser("signout-all", help="sign out everyone that is still signed in")
+
+    export = commands.add_parser("export", help="write the attendance file, and a copy if --output is given")
+    export.add_argument("--output", help="file to write a copy of the attendance records to")
+
+    report = commands.add_parser("report", help="season hours from all of the attendance files")
+    report.add_argument("--by", choices=("person", "week", "destination"), default="person")
+    report.add_argument("--output", help="csv file to write the report to instead of printing it")
+
+    server = commands.add_parser("sync-server", help="keep the people signed in the same on every kiosk")
+    server.add_argument("--host", default="0.0.0.0", help="address to listen on")
+    server.add_argument("--port", type=int, default=8765)
+    server.add_argument("--log",
+                        help="file the server keeps its events in (default: sync_server.jsonl in --export-dir)")
+    return parser
+
+
+# Engine for today's attendance file with the journal replayed, the caller has to stop the writer
+def load_engine(args, people=None):
+    metrics = Metrics()
+    writer = PersistenceWorker(on_error=log, metrics=metrics)
+    writer.start()
+    engine = TimeClockEngine(writer=writer, use_database=args.sqlite, on_message=log, metrics=metrics)
+    if people:
+        log("Loaded " + str(engine.load_people(people)) + " people from: " + str(people))
+    now = datetime.now()
+    engine.set_paths(args.export_dir, day_file_name(args, now), meeting_day(now, args.cutoff))
+    log("Export file will be saved to: " + str(engine.savepath / engine.export_file_name))
+    engine.load()
+    return engine, writer
+
+
+def day_file_name(args, now):
+    return attendance_file_name(meeting_day(now, args.cutoff), args.prefix_format, args.suffix)
+
+
+# Start the next attendance file once the cutoff time has passed
+def roll_over_if_due(engine, args):
+    now = datetime.now()
+    export_file_name = day_file_name(args, now)
+    if export_file_name == engine.export_file_name:
+        return
+    time_out = datetime.combine(meeting_day(now, args.cutoff), args.cutoff)
+    old_file_name = engine.export_file_name
+    signed_out, missing = engine.roll_over(export_file_name, args.carry_over, time_out.strftime(TIME_FORMAT))
+    log("New day, " + old_file_name + " is finished and the export file will be saved to: " +
+        str(engine.savepath / export_file_name))
+    log(str(len(signed_out)) + " people " + ("carried over" if args.carry_over else "signed out") + " at " +
+        time_out.strftime("%H:%M:%S"))
+
+
+def close_engine(engine, writer):
+    engine.close()
+    writer.stop()
+
+
+def parse_readers(readers):
+    parsed = {}
+    for reader in readers:
+        name, _, port = reader.rpartition("=")
+        parsed[name or port] = port
+    return parsed
+
+
+def serve(args):
+    from timeclock.debounce import ScanDebouncer
+    from timeclock.id_reader import ReaderManager
+    from timeclock.ports import PortScanner
+
+    engine, writer = load_engine(args, args.people)
+    debouncer = ScanDebouncer(args.debounce)
+    scanned = threading.Event()
+    stopping = threading.Event()
+    manager = ReaderManager(on_scan=lambda event: scanned.set(), on_status=log, metrics=engine.metrics)
+    next_dump = clock.monotonic() + args.metrics_interval
+
+    # Readers that are unplugged and plugged back in on another path are followed to it
+    ports_changed = threading.Event()
+    reader_ports = {}
+
+    def port_change(ports):
+        ports_changed.set()
+        scanned.set()
+    scanner = PortScanner(on_change=port_change, on_status=log)
+
+    def stop(signum, frame):
+        stopping.set()
+        scanned.set()
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    sync = None
+    if args.sync:
+        from timeclock.sync import SyncClient
+
+        sync = SyncClient(args.sync, args.kiosk, engine.savepath, on_remote=scanned.set, on_status=log)
+        engine.on_event = sync.record
+        sync.start()
+
+    for name, port in parse_readers(args.reader).items():
+        manager.open(name, port)
+    if not manager.readers:
+        log("Warning: No badge readers given, use --reader NAME=PORT")
+    else:
+        scanner.start()
+    try:
+        while not stopping.is_set():
+            scanned.wait(1.0)
+            scanned.clear()
+            roll_over_if_due(engine, args)
+            if ports_changed.is_set():
+                ports_changed.clear()
+                follow_ports(manager, reader_ports, scanner.ports)
+            for event in manager.drain():
+                engine.metrics.observe("dispatch", clock.monotonic() - event.time)
+                with engine.metrics.span("scan"):
+                    handle_scan(engine, debouncer, event, args.destination)
+            if sync is not None:
+                apply_remote_events(engine, sync)
+            engine.tick()
+            if args.metrics_interval > 0 and clock.monotonic() >= next_dump:
+                next_dump = clock.monotonic() + args.metrics_interval
+                dump_metrics(engine, writer)
+    finally:
+        scanner.stop()
+        manager.close_all()
+        if sync is not None:
+            sync.stop()
+        if args.metrics_interval > 0:
+            dump_metrics(engine, writer)
+        close_engine(engine, writer)
+    return 0
+
+
+def dump_metrics(engine, writer):
+    if engine.metrics.changed:
+        engine.metrics.dump(engine.savepath / "timeclock_metrics.json", engine.savepath / "timeclock_metrics.prom",
+                            writer)
+
+
+def handle_scan(engine, debouncer, event, destination):
+    log("Badge ID Scanned at " + str(event.reader) + ": " + event.badge_id)
+    if not debouncer.accept(event.badge_id):
+        log("Repeat scan ignored")
+        return
+    person, signed_in, signed_out = engine.toggle_badge(event.badge_id, destination)
+    if person is None:
+        log("Error: Associated ID not found")
+        return
+    if signed_in:
+        log(str(person.first_name) + " " + str(person.last_name) + " signed in at: " + clock_text())
+        return
+    if signed_out is None:
+        log("Error: Can't find sign in record for user, removing from active user list")
+        return
+    log(("Guest: " if is_guest(person.id) else "") + str(person.first_name) + " " + str(person.last_name) +
+        " signed out at: " + clock_text() + ", worked: " + str(signed_out[1]) + "hours, Destination: " +
+        str(destination))
+
+
+def follow_ports(manager, reader_ports, ports):
+    from timeclock.ports import follow_readers
+
+    for name, device in follow_readers(manager.readers, reader_ports, ports).items():
+        log("[" + name + "] Found again on " + device + ", reconnecting")
+        manager.open(name, device)
+
+
+# Sign ins/outs from the other kiosks, they are only logged when they changed something here
+def apply_remote_events(engine, sync):
+    for event, person, signed_in in engine.apply_remote_events(sync.drain()):
+        name = ("Guest: " if is_guest(person.id) else "") + str(person.first_name) + " " + str(person.last_name)
+        if signed_in:
+            log("[" + str(event.get("kiosk")) + "] " + name + " signed in at: " + event['time_in'][11:])
+        else:
+            log("[" + str(event.get("kiosk")) + "] " + name + " signed out at: " + event['time_out'][11:] +
+                ", Destination: " + str(event['destination']))
+
+
+def signout_all(args):
+    engine, writer = load_engine(args)
+    try:
+        signed_out, missing = engine.force_signout()
+        for person in missing:
+            log("Error: Can't find sign in record for " + str(person.first_name) + " " + str(person.last_name) +
+                ", removing from active user list")
+        for person, worked in signed_out:
+            log(("Guest: " if is_guest(person.id) else "") + str(person.first_name) + " " + str(person.last_name) +
+                " signed out at: " + clock_text() + ", worked: " + str(worked) + "hours, Destination: " +
+                FORCED_DESTINATION)
+        log(str(len(signed_out)) + " people signed out")
+    finally:
+        close_engine(engine, writer)
+    return 0
+
+
+def export(args):
+    engine, writer = load_engine(args)
+    try:
+        if args.output:
+            records = engine.records.snapshot()
+            writer.replace(args.output, lambda: records.to_frame().to_csv(index=False))
+            log("Attendance file exported to: " + str(args.output))
+    finally:
+        close_engine(engine, writer)
+    return 0
+
+
+def report(args):
+    from timeclock.reports import SeasonReport
+
+    season = SeasonReport(args.export_dir, args.suffix)
+    totals = {"person": season.per_person, "week": season.per_week, "destination": season.per_destination}[args.by]()
+    if args.output:
+        totals.to_csv(args.output, index=False)
+        log("Season report saved to: " + str(args.output))
+    else:
+        sys.stdout.write(totals.to_csv(index=False))
+    return 0
+
+
+def sync_server(args):
+    import asyncio
+    from timeclock.sync import SyncServer
+
+    def interrupt(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, interrupt)
+
+    server = SyncServer(args.log or Path(args.export_dir) / "sync_server.jsonl", on_message=log)
+    server.load()
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    log("Sync server stopped")
+    return 0
+
+
+COMMANDS = {"serve": serve, "signout-all": signout_all, "export": export, "report": report,
+            "sync-server": sync_server}
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return COMMANDS[args.command](args)
@@ -0,0 +1,295 @@
+# This Python file uses the following encoding: utf-8
+# Optional SQLite storage for the attendance records
+#
+# Works like AttendanceJournal so the rest of the program doesn't care which one is used: the sign
+# ins/outs go into "attendance.sqlite3" in the export folder, and the csv files are still written from
+# the in memory state when the database is compacted. With a PersistenceWorker the inserts are done on its
+# thread, and the events that pile up while it is busy go in together as one transaction. The database
+# keeps every day, so it can also be used to look at attendance across days.
+#
+# Rows written since the last compaction are marked with a version number. Replaying turns those back
+# into journal events, and compaction clears the marks once the csv files are written. A row changed
+# while the csv files are being written gets a newer version and is left marked.
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from timeclock.fileio import write_atomic
+from timeclock.journal import SIGN_IN, SIGN_OUT, GUEST_SIGN_IN, FORCED_SIGN_OUT, FORCED_DESTINATION
+from timeclock.records import parse_time, format_time
+
+
+DATABASE_NAME = "attendance.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS people (
+    id TEXT NOT NULL,
+    first_name TEXT NOT NULL,
+    last_name TEXT NOT NULL,
+    badge TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS people_id ON people (id);
+
+CREATE TABLE IF NOT EXISTS sessions (
+    session INTEGER PRIMARY KEY,
+    file TEXT NOT NULL,
+    day TEXT NOT NULL,
+    id TEXT NOT NULL,
+    first_name TEXT NOT NULL,
+    last_name TEXT NOT NULL,
+    guest INTEGER NOT NULL DEFAULT 0,
+    time_in INTEGER NOT NULL,
+    time_out INTEGER,
+    destination TEXT NOT NULL DEFAULT '',
+    hours REAL,
+    forced INTEGER NOT NULL DEFAULT 0,
+    changed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS sessions_id ON sessions (id, time_in);
+CREATE INDEX IF NOT EXISTS sessions_day ON sessions (day);
+CREATE INDEX IF NOT EXISTS sessions_file_changed ON sessions (file, changed);
+
+CREATE TABLE IF NOT EXISTS open_sessions (
+    id TEXT PRIMARY KEY,
+    session INTEGER NOT NULL REFERENCES sessions (session)
+);
+"""
+
+
+def database_path_for(folder):
+    return Path(folder) / DATABASE_NAME
+
+
+def connect(path):
+    connection = sqlite3.connect(str(path), isolation_level=None, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    # In WAL mode NORMAL still can't corrupt the database, a power cut can only lose the last transactions,
+    # about what the journal can lose between its fsyncs
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class AttendanceDatabase:
+    def __init__(self, path, attendance_path, day=None, compact_every=500, compact_interval=60.0, writer=None):
+        self.path = Path(path)
+        self.file = Path(attendance_path).name     # sessions are tagged with the attendance file they belong to
+        # ...and the day its meeting started, so a sign in after midnight stays on the day of the meeting.
+        # Without a day each session goes on the day it started
+        self.day = day.isoformat() if day is not None else None
+        self.writer = writer
+        self.compact_every = compact_every          # write the csv files after this many events...
+        self.compact_interval = compact_interval    # ...or once this many seconds have passed with events waiting
+        self.events_since_compaction = 0
+        self._last_compaction = time.monotonic()
+        self._lock = threading.Lock()               # the connection is also used by the writer thread
+        self._connection = None
+        self._version = 0
+
+    def open(self):
+        if self._connection is None:
+            self._connection = connect(self.path)
+            row = self._connection.execute("SELECT MAX(changed) FROM sessions").fetchone()
+            self._version = row[0] or 0
+
+    # The inserts still queued on the writer go in first
+    def close(self):
+        if self.writer is not None and self._connection is not None:
+            self.writer.flush()
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    # Turn the rows changed since the last compaction back into journal events
+    def replay(self):
+        self.open()
+        events = []
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, first_name, last_name, guest, time_in, time_out, destination, hours, forced "
+                "FROM sessions WHERE file = ? AND changed > 0 ORDER BY session", (self.file,)).fetchall()
+        for id, first_name, last_name, guest, time_in, time_out, destination, hours, forced in rows:
+            events.append({'type': GUEST_SIGN_IN if guest else SIGN_IN, 'id': id, 'first_name': first_name,
+                           'last_name': last_name, 'time_in': format_time(time_in)})
+            if time_out is not None:
+                events.append({'type': FORCED_SIGN_OUT if forced else SIGN_OUT, 'id': id,
+                               'time_in': format_time(time_in), 'time_out': format_time(time_out),
+                               'destination': destination, 'hours': hours})
+        self.events_since_compaction = len(events)
+        return events
+
+    # Methods for writing events, each call is one transaction
+    def append(self, event_type, **fields):
+        self.append_many([dict(fields, type=event_type)])
+
+    # Each event is written with the version it was appended at, so compaction knows which rows it covers
+    def append_many(self, events):
+        if not events:
+            return
+        self.open()
+        self._version += 1
+        rows = [(self._version, event) for event in events]
+        if self.writer is not None:
+            self.writer.transaction(self.path, rows, self._commit)
+        else:
+            self._commit(rows)
+        self.events_since_compaction += len(events)
+
+    def _commit(self, rows):
+        with self._lock:
+            connection = self._connection
+            if connection is None:
+                raise RuntimeError("the database is closed")
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                for version, event in rows:
+                    if event['type'] in (SIGN_IN, GUEST_SIGN_IN):
+                        self._sign_in(event, version)
+                    else:
+                        self._sign_out(event, version)
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+
+    def _sign_in(self, event, version):
+        cursor = self._connection.execute(
+            "INSERT INTO sessions (file, day, id, first_name, last_name, guest, time_in, changed) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (self.file, self._day(event['time_in']), event['id'], event['first_name'], event['last_name'],
+             int(event['type'] == GUEST_SIGN_IN), parse_time(event['time_in']), version))
+        self._connection.execute("INSERT OR REPLACE INTO open_sessions (id, session) VALUES (?, ?)",
+                                 (event['id'], cursor.lastrowid))
+
+    def _sign_out(self, event, version):
+        time_in = parse_time(event['time_in'])
+        row = self._connection.execute(
+            "SELECT sessions.session FROM open_sessions JOIN sessions USING (session) "
+            "WHERE open_sessions.id = ? AND sessions.time_in = ?", (event['id'], time_in)).fetchone()
+        if row is None:
+            row = self._connection.execute(
+                "SELECT session FROM sessions WHERE id = ? AND time_in = ? ORDER BY session DESC LIMIT 1",
+                (event['id'], time_in)).fetchone()
+        if row is not None:
+            self._connection.execute(
+                "UPDATE sessions SET time_out = ?, destination = ?, hours = ?, forced = ?, changed = ? "
+                "WHERE session = ?",
+                (parse_time(event['time_out']), event['destination'], event['hours'],
+                 int(event['type'] == FORCED_SIGN_OUT), version, row[0]))
+        self._connection.execute("DELETE FROM open_sessions WHERE id = ?", (event['id'],))
+
+    # SQLite syncs the transactions itself
+    def sync(self):
+        pass
+
+    def sync_if_due(self):
+        pass
+
+    # Methods for compaction
+    def needs_compaction(self):
+        if self.events_since_compaction >= self.compact_every:
+            return True
+        return bool(self.events_since_compaction) and \
+            time.monotonic() - self._last_compaction >= self.compact_interval
+
+    # snapshots is a list of (path, text) like for AttendanceJournal.compact, the marks are only
+    # cleared once all of them are written
+    def compact(self, snapshots, message=None):
+        self.open()
+        version = self._version
+        if self.writer is not None:
+            self.writer.compact(self.path, snapshots, message, empty=lambda: self._clear_changed(version))
+        else:
+            for path, content in snapshots:
+                write_atomic(path, content() if callable(content) else content)
+            self._clear_changed(version)
+        self.events_since_compaction = 0
+        self._last_compaction = time.monotonic()
+
+    def _clear_changed(self, version):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.execute("UPDATE sessions SET changed = 0 WHERE file = ? AND changed > 0 "
+                                         "AND changed <= ?", (self.file, version))
+
+    # Methods for importing from the csv files
+    def import_people(self, people):
+        self.open()
+        with self._lock:
+            connection = self._connection
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.execute("DELETE FROM people")
+                connection.executemany("INSERT INTO people (id, first_name, last_name, badge) VALUES (?, ?, ?, ?)",
+                                       people)
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+
+    # Add the records of the attendance file that aren't in the database yet, records is an iterable of
+    # (ID, First_Name, Last_Name, Time_In, Time_Out, Destination, Hours) like the attendance files
+    def import_records(self, records, guests=()):
+        self.open()
+        guests = set(guests)
+        added = 0
+        with self._lock:
+            connection = self._connection
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                for id, first_name, last_name, time_in, time_out, destination, hours in records:
+                    try:
+                        seconds_in = parse_time(time_in)
+                    except ValueError:
+                        continue
+                    if connection.execute("SELECT 1 FROM sessions WHERE id = ? AND time_in = ?",
+                                          (id, seconds_in)).fetchone():
+                        continue
+                    try:
+                        seconds_out = parse_time(time_out) if time_out else None
+                    except ValueError:
+                        seconds_out = None
+                    cursor = connection.execute(
+                        "INSERT INTO sessions (file, day, id, first_name, last_name, guest, time_in, time_out, "
+                        "destination, hours, forced) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (self.file, self._day(time_in), id, first_name, last_name, int(id in guests), seconds_in,
+                         seconds_out, destination or "", self._hours(hours) if seconds_out is not None else None,
+                         int(destination == FORCED_DESTINATION)))
+                    if seconds_out is None:
+                        connection.execute("INSERT OR REPLACE INTO open_sessions (id, session) VALUES (?, ?)",
+                                           (id, cursor.lastrowid))
+                    added += 1
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        return added
+
+    def _day(self, time_in):
+        return self.day if self.day is not None else time_in[:10]
+
+    @staticmethod
+    def _hours(hours):
+        try:
+            hours = float(hours)
+        except (TypeError, ValueError):
+            return None
+        return None if hours != hours else hours
+
+    # Methods for looking things up
+    # Sessions from first_day to last_day ("yyyy-MM-dd") in the attendance file layout
+    def sessions(self, first_day, last_day):
+        self.open()
+        if self.writer is not None:
+            self.writer.flush()
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, first_name, last_name, time_in, time_out, destination, hours FROM sessions "
+                "WHERE day BETWEEN ? AND ? ORDER BY time_in, session", (first_day, last_day)).fetchall()
+        return [(id, first_name, last_name, format_time(time_in),
+                 format_time(time_out) if time_out is not None else "", destination,
+                 hours if hours is not None else float('nan'))
+                for id, first_name, last_name, time_in, time_out, destination, hours in rows]
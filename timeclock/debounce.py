@@ -0,0 +1,56 @@
+# This Python file uses the following encoding: utf-8
+# Cooldown for repeat reads of the same badge
+#
+# Holding a card on the antenna makes the reader send the UID over and over, which used to sign the
+# person in and then right back out. A badge that was read within the window is dropped before it
+# reaches the sign in logic. Every read of the badge starts the window over, so a card that is held
+# for a while still only counts once. Badges are compared the way the people file is searched, so
+# "0042" from one reader and "42" from another are the same badge. Times are wall clock times so the
+# cache can be saved in the settings and still be good after a restart.
+
+import time
+
+from timeclock.people import normalize_badge
+
+
+class ScanDebouncer:
+    def __init__(self, window=10.0):
+        self.window = window        # seconds a badge is ignored for after it was last read, 0 turns it off
+        self.last_seen = {}         # normalized badge ID -> time it was last read
+        self.changed = False        # set when a badge was read since the cache was last saved
+
+    def __len__(self):
+        return len(self.last_seen)
+
+    # True if the scan should be handled, False if it is a repeat inside the window
+    def accept(self, badge_id, now=None):
+        now = time.time() if now is None else now
+        badge_id = normalize_badge(badge_id)
+        last = self.last_seen.get(badge_id)
+        self.last_seen[badge_id] = now
+        self.changed = True
+        return last is None or not 0 <= now - last < self.window
+
+    # Forget the badges whose window has run out
+    def expire(self, now=None):
+        now = time.time() if now is None else now
+        self.last_seen = {badge_id: seen for badge_id, seen in self.last_seen.items()
+                          if 0 <= now - seen < self.window}
+
+    def clear(self):
+        self.last_seen = {}
+
+    # Methods for saving the cache in the settings
+    def state(self):
+        self.expire()
+        self.changed = False
+        return dict(self.last_seen)
+
+    def load_state(self, state):
+        self.last_seen = {}
+        for badge_id, seen in dict(state or {}).items():
+            try:
+                self.last_seen[str(badge_id)] = float(seen)
+            except (TypeError, ValueError):
+                continue
+        self.expire()
@@ -0,0 +1,475 @@
+# This Python file uses the following encoding: utf-8
+# The sign in/out core without any Qt
+#
+# Keeps the attendance records, the people signed in and the journal (or database) for one attendance
+# file. Both the GUI and the headless command line use it. Whatever shows the people signed in can
+# listen for changes through the on_user_added, on_user_removed and on_users_reset callbacks, and
+# messages for the log are passed to on_message. Local sign ins/outs are passed to on_event so the sync
+# client can send them to the other kiosks.
+
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from timeclock.database import AttendanceDatabase, database_path_for
+from timeclock.journal import AttendanceJournal, journal_path_for, SIGN_IN, SIGN_OUT, GUEST_SIGN_IN, FORCED_SIGN_OUT, \
+    FORCED_DESTINATION
+from timeclock.metrics import Metrics
+from timeclock.people import PeopleRegistry, Person
+from timeclock.records import RecordStore, TIME_FORMAT, parse_time, format_time
+from timeclock.recovery import ACTIVE_USERS_COLUMNS, recover_active_users, recovery_fixes, recovery_message
+from timeclock.roster import read_roster
+
+
+ACTIVE_USERS_NAME = "active_users.csv"
+ROLLOVER_DESTINATION = "Day Rollover"
+
+
+def now_text():
+    return datetime.now().strftime(TIME_FORMAT)
+
+
+# The day a meeting started, times before the cutoff (a datetime.time) still count as the day before so
+# people signing out after midnight end up on the same attendance file
+def meeting_day(now, cutoff):
+    day = now.date()
+    if now.time() < cutoff:
+        day -= timedelta(days=1)
+    return day
+
+
+# Attendance file name for a day with a strftime prefix format, ie 20210611_attendance.csv
+def attendance_file_name(day=None, prefix_format="%Y%m%d", suffix="_attendance"):
+    day = datetime.now() if day is None else day
+    return day.strftime(prefix_format) + suffix + ".csv"
+
+
+def is_guest(id):
+    return "G" in str(id)
+
+
+class TimeClockEngine:
+    def __init__(self, writer=None, use_database=False, on_message=None, on_user_added=None,
+                 on_user_removed=None, on_users_reset=None, metrics=None, on_event=None):
+        self.writer = writer
+        self.use_database = use_database
+        self.metrics = Metrics() if metrics is None else metrics
+        self.on_message = on_message
+        self.on_user_added = on_user_added          # called with (Person, guest)
+        self.on_user_removed = on_user_removed      # called with the ID
+        self.on_users_reset = on_users_reset        # called when the people signed in were replaced all at once
+        self.on_event = on_event                    # called with each local sign in/out event, for syncing
+        self.people = PeopleRegistry()
+        self.records = RecordStore()
+        self.active_users = {}      # ID -> Person, in the order they signed in
+        self.guest_users = {}       # ID -> Person for the guests among the active users
+        self.journal = None
+        self.savepath = None
+        self.export_file_name = None
+        self.day = None             # the day the meeting of the attendance file started, a datetime.date
+        self.journal_attendance_path = None
+        self.active_users_savepath = None
+
+    def message(self, text):
+        if self.on_message is not None:
+            self.on_message(text)
+
+    # Methods for loading
+    def load_people(self, path):
+        columns, rows = read_roster(path)
+        self.people.rebuild(columns, enumerate(rows))
+        for problem in self.people.problems():
+            self.message("Warning: " + problem)
+        return len(rows)
+
+    # day is the day the meeting started, it is kept when not given
+    def set_paths(self, savepath, export_file_name, day=None):
+        self.savepath = Path(savepath)
+        self.export_file_name = export_file_name
+        if day is not None:
+            self.day = day
+        self.active_users_savepath = str(self.savepath / ACTIVE_USERS_NAME)
+
+    # Load the csv files and replay anything that was journaled after they were last written
+    def load(self):
+        import pandas as pd
+
+        self.records.clear()
+        self.active_users.clear()
+        self.guest_users.clear()
+        temp_active_users = None
+        try:
+            temp_active_users = pd.read_csv(self.active_users_savepath, dtype=str, keep_default_na=False)
+        except:
+            self.message("Warning: No active_users file found or unable to open file")
+        attendance_path = self.savepath / self.export_file_name
+        open_people = []
+        try:
+            self.records.load_frame(pd.read_csv(attendance_path, keep_default_na=False, dtype=str))
+            open_people = self.records.open_people()
+        except:
+            if attendance_path.exists():
+                # Most likely open in another program, so there is nothing to check active_users against
+                self.message("Error: Unable to read the attendance file: " + str(attendance_path))
+                open_people = None
+            else:
+                self.message("Warning: No Data Records File found, must be a new day")
+
+        recovery = self.recover(temp_active_users, open_people)
+        self.open_journal()
+        replayed = self.replay_journal()
+        if recovery is not None and recovery_fixes(recovery) and not replayed:
+            # Write the repaired files now, replaying the journal already did if there was anything in it
+            self.compact_journal()
+
+    # Rebuild the people signed in from active_users.csv checked against the open sessions, returns the Recovery
+    def recover(self, active_users, open_people):
+        try:
+            recovery = recover_active_users(active_users, open_people)
+        except Exception as e:
+            self.message("Error: Unable to parse the active_users file: " + str(e))
+            self.users_reset()
+            return None
+        for person in recovery.users:
+            self.active_users[person.id] = person
+        for person in recovery.guests:
+            self.guest_users[person.id] = person
+        self.users_reset()
+        self.message(recovery_message(recovery))
+        return recovery
+
+    # Methods for the attendance journal
+    # The sign ins/outs go to the json journal, or to the SQLite database when that is turned on
+    def open_journal(self):
+        self.journal_attendance_path = self.savepath / self.export_file_name
+        if self.use_database:
+            try:
+                self.journal = AttendanceDatabase(database_path_for(self.savepath), self.journal_attendance_path,
+                                                  day=self.day, writer=self.writer)
+                self.journal.open()
+                self.import_people_to_database()
+                return
+            except Exception as e:
+                self.message("Error: Unable to open the database, using the journal instead: " + str(e))
+        self.journal = AttendanceJournal(journal_path_for(self.journal_attendance_path), writer=self.writer)
+        self.journal.open()
+
+    # Finish off the journal of the old attendance file before switching to the new one. With new_day the
+    # records of the old file are left behind and the new file is loaded if it is already there
+    def switch_attendance_file(self, savepath, export_file_name, new_day=False, day=None):
+        new_path = Path(savepath) / export_file_name
+        self.set_paths(savepath, export_file_name, day)
+        if self.journal is not None and self.journal_attendance_path != new_path:
+            self.compact_journal()
+            self.journal.close()
+            if new_day:
+                self.load_records()
+            self.open_journal()
+            if new_day:
+                self.replay_journal()
+
+    def load_records(self):
+        import pandas as pd
+
+        self.records.clear()
+        try:
+            self.records.load_frame(pd.read_csv(self.savepath / self.export_file_name, keep_default_na=False,
+                                                dtype=str))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            self.message("Error: Unable to read the attendance file: " + str(e))
+
+    # Seal the attendance file at the cutoff and start the one for the next day, so no file holds more than
+    # one day. Everyone still signed in is signed out at time_out, and with carry_over they are signed back
+    # in on the new file at the same time so their session is split between the two days.
+    # The new meeting starts on the day of time_out.
+    # Returns ([(Person, Hours)] signed out, [Person] that had no sign in record) like force_signout
+    def roll_over(self, export_file_name, carry_over=False, time_out=None):
+        time_out = now_text() if time_out is None else time_out
+        guests = set(self.guest_users)
+        # Anyone that signed in after the cutoff (the clock was off, or the cutoff was moved) is signed out
+        # when they signed in rather than before it, and carried over from then
+        cutoff = parse_time(time_out)
+        times_in = {id: max(cutoff, self.records.time_in(row)) for id, row in self.records.open_sessions.items()}
+        signed_out, missing = self.force_signout(time_out, ROLLOVER_DESTINATION if carry_over else FORCED_DESTINATION,
+                                                 share=False)
+        self.switch_attendance_file(self.savepath, export_file_name, new_day=True,
+                                    day=datetime.strptime(time_out, TIME_FORMAT).date())
+        if carry_over and signed_out:
+            events = []
+            for person, worked in signed_out:
+                guest = person.id in guests
+                time_in = format_time(times_in.get(person.id, cutoff))
+                self.add_sign_in_record(person.id, person.first_name, person.last_name, time_in, guest=guest)
+                events.append({'type': GUEST_SIGN_IN if guest else SIGN_IN, 'id': person.id,
+                               'first_name': person.first_name, 'last_name': person.last_name, 'time_in': time_in})
+            self.journal.append_many(events)
+            self.journal.sync()
+        return signed_out, missing
+
+    # Switching writes everything out through the old journal first, so nothing is left behind in it
+    def set_use_database(self, enabled):
+        self.use_database = enabled
+        if self.journal is None:
+            return
+        self.compact_journal()
+        self.journal.close()
+        self.open_journal()
+        if isinstance(self.journal, AttendanceDatabase):
+            try:
+                added = self.journal.import_records(self.records.to_frame().itertuples(index=False),
+                                                    guests=self.guest_users)
+                self.message("Attendance is also being kept in: " + str(self.journal.path) +
+                             " (" + str(added) + " records added)")
+            except Exception as e:
+                self.message("Error: Unable to add the attendance records to the database: " + str(e))
+
+    def import_people_to_database(self):
+        if not isinstance(self.journal, AttendanceDatabase):
+            return
+        try:
+            self.journal.import_people([(person.id, person.first_name, person.last_name, badge)
+                                        for person, badge in self.people.rows.values()])
+        except Exception as e:
+            self.message("Error: Unable to add the people file to the database: " + str(e))
+
+    # Returns how many events were replayed
+    def replay_journal(self):
+        events = self.journal.replay()
+        if not events:
+            return 0
+        try:
+            for event in events:
+                self.replay_journal_event(event)
+            self.compact_journal()
+            self.message("Recovered " + str(len(events)) + " events from the journal")
+        except:
+            self.message("Error: Unable to replay the journal: " + str(self.journal.path))
+        return len(events)
+
+    # Events that already made it into the csv files before a crash are skipped, so replaying is safe to repeat
+    def replay_journal_event(self, event):
+        if event['type'] in (SIGN_IN, GUEST_SIGN_IN):
+            row = self.records.find(event['id'], parse_time(event['time_in']))
+            if row is None:
+                self.add_sign_in_record(event['id'], event['first_name'], event['last_name'],
+                                        event['time_in'], guest=event['type'] == GUEST_SIGN_IN)
+            elif self.records.is_open(row) and event['id'] not in self.active_users:
+                self.add_active_user(Person(event['id'], event['first_name'], event['last_name']),
+                                     guest=event['type'] == GUEST_SIGN_IN)
+        else:
+            self.remove_active_user(event['id'])
+            row = self.records.open_sessions.get(event['id'])
+            if row is not None and self.records.time_in(row) == parse_time(event['time_in']):
+                self.records.close(event['id'], parse_time(event['time_out']), event['destination'])
+
+    # The full attendance and active users files used when compacting the journal, they are
+    # rendered from copies on the writer thread so the caller only pays for copying the arrays
+    def snapshot_files(self):
+        import pandas as pd
+
+        records = self.records.snapshot()
+        active_users = list(self.active_users.values())
+        return [(self.journal_attendance_path, lambda: records.to_frame().to_csv(index=False)),
+                (self.active_users_savepath,
+                 lambda: pd.DataFrame(active_users, columns=ACTIVE_USERS_COLUMNS).to_csv(index=False))]
+
+    def compact_journal(self, message=None):
+        try:
+            self.journal.compact(self.snapshot_files(), message)
+        except:
+            self.message("Error: Unable to save the attendance file: " + str(self.journal_attendance_path))
+
+    def compact_journal_if_due(self):
+        if self.journal.needs_compaction():
+            self.compact_journal()
+
+    # Called about once a second so the last few scans hit the disk and the journal is folded in now and then
+    def tick(self):
+        if self.journal is not None:
+            self.journal.sync_if_due()
+            self.compact_journal_if_due()
+
+    def close(self):
+        if self.journal is not None:
+            self.compact_journal()
+            self.journal.close()
+            self.journal = None
+
+    # Methods for keeping the active users in step with whatever shows them
+    def add_active_user(self, person, guest=False):
+        self.active_users[person.id] = person
+        if guest:
+            self.guest_users[person.id] = person
+        if self.on_user_added is not None:
+            self.on_user_added(person, guest)
+
+    def remove_active_user(self, id):
+        self.guest_users.pop(id, None)
+        if self.active_users.pop(id, None) is not None and self.on_user_removed is not None:
+            self.on_user_removed(id)
+
+    def users_reset(self):
+        if self.on_users_reset is not None:
+            self.on_users_reset()
+
+    def add_sign_in_record(self, id, first_name, last_name, time_in, guest=False):
+        self.add_active_user(Person(id, first_name, last_name), guest=guest)
+        self.records.add(id, first_name, last_name, parse_time(time_in))
+
+    # Methods for signing in and out, times are 'yyyy-MM-dd_hh:mm:ss' strings like in the attendance files
+    def sign_in(self, person, time_in=None):
+        time_in = now_text() if time_in is None else time_in
+        with self.metrics.span("mutation"):
+            self.add_sign_in_record(person.id, person.first_name, person.last_name, time_in)
+
+        # Journal the sign in so that the program can be closed and opened whenever
+        event = {'id': person.id, 'first_name': person.first_name, 'last_name': person.last_name, 'time_in': time_in}
+        with self.metrics.span("persistence"):
+            self.journal.append(SIGN_IN, **event)
+        self.share(dict(event, type=SIGN_IN))
+        self.compact_journal_if_due()
+        return time_in
+
+    # Guests get an ID made from the time so it is unique, returns the guest as a Person
+    def guest_sign_in(self, first_name, last_name, time_in=None):
+        time_in = now_text() if time_in is None else time_in
+        guest = Person("G" + datetime.strptime(time_in, TIME_FORMAT).strftime("%Y%m%d%H%M%S"), first_name, last_name)
+        with self.metrics.span("mutation"):
+            self.add_sign_in_record(guest.id, guest.first_name, guest.last_name, time_in, guest=True)
+
+        event = {'id': guest.id, 'first_name': guest.first_name, 'last_name': guest.last_name, 'time_in': time_in}
+        with self.metrics.span("persistence"):
+            self.journal.append(GUEST_SIGN_IN, **event)
+        self.share(dict(event, type=GUEST_SIGN_IN))
+        self.compact_journal_if_due()
+        return guest
+
+    # Returns (Time_In, Hours), or None if there was no sign in record and the person was only removed
+    def sign_out(self, person, destination, time_out=None, forced=False):
+        time_out = now_text() if time_out is None else time_out
+        if person.id not in self.records.open_sessions:
+            self.remove_active_user(person.id)
+            return None
+        if forced:
+            destination = FORCED_DESTINATION
+
+        # Add "Time_Out", "Destination", "Hours" to the records, the store works out the hours signed in
+        with self.metrics.span("mutation"):
+            self.remove_active_user(person.id)
+            time_in, hours = self.records.close(person.id, parse_time(time_out), destination)
+
+        # Journal the sign out so that the program can be closed and opened whenever
+        event = {'type': FORCED_SIGN_OUT if forced else SIGN_OUT, 'id': person.id, 'time_in': format_time(time_in),
+                 'time_out': time_out, 'destination': destination, 'hours': hours}
+        with self.metrics.span("persistence"):
+            self.journal.append_many([event])
+        self.share(dict(event, first_name=person.first_name, last_name=person.last_name))
+        self.compact_journal_if_due()
+        return time_in, hours
+
+    # Close every open session in one pass over the records and journal them with a single write.
+    # Returns ([(Person, Hours)] signed out, [Person] that had no sign in record)
+    def force_signout(self, time_out=None, destination=FORCED_DESTINATION, share=True):
+        time_out = now_text() if time_out is None else time_out
+        missing = [person for person in self.active_users.values() if person.id not in self.records.open_sessions]
+
+        closed = self.records.close_many(list(self.active_users), parse_time(time_out), destination)
+        signed_out = []
+        if closed:
+            events = []
+            for id, time_in, closed_at, worked in closed:
+                events.append({'type': FORCED_SIGN_OUT, 'id': id, 'time_in': format_time(time_in),
+                               'time_out': format_time(closed_at), 'destination': destination, 'hours': worked})
+                signed_out.append((self.active_users[id], worked))
+            self.journal.append_many(events)
+            self.journal.sync()
+            if share:
+                for event, (person, worked) in zip(events, signed_out):
+                    self.share(dict(event, first_name=person.first_name, last_name=person.last_name))
+
+        self.active_users.clear()
+        self.guest_users.clear()
+        self.users_reset()
+        self.compact_journal_if_due()
+        return signed_out, missing
+
+    # Methods for syncing with the other kiosks
+    def share(self, event):
+        if self.on_event is not None:
+            self.on_event(dict(event, file=self.export_file_name))
+
+    # Apply a sign in/out from another kiosk and journal it, without sharing it again. Events for another
+    # attendance file, sign ins of people already signed in and sign outs of people that aren't are skipped.
+    # Returns (Person, signed in), or (None, None) if it was skipped
+    def apply_remote_event(self, event):
+        if event.get('file') != self.export_file_name:
+            return None, None
+        id = str(event['id'])
+        if event['type'] in (SIGN_IN, GUEST_SIGN_IN):
+            if id in self.active_users or self.records.find(id, parse_time(event['time_in'])) is not None:
+                return None, None
+            person = Person(id, event['first_name'], event['last_name'])
+            with self.metrics.span("mutation"):
+                self.add_sign_in_record(id, person.first_name, person.last_name, event['time_in'],
+                                        guest=event['type'] == GUEST_SIGN_IN)
+            with self.metrics.span("persistence"):
+                self.journal.append(event['type'], id=id, first_name=person.first_name, last_name=person.last_name,
+                                    time_in=event['time_in'])
+            self.compact_journal_if_due()
+            return person, True
+
+        person = self.active_users.get(id)
+        row = self.records.open_sessions.get(id)
+        time_out = parse_time(event['time_out'])
+        if person is None or row is None or self.records.time_in(row) > time_out:
+            return None, None
+        with self.metrics.span("mutation"):
+            self.remove_active_user(id)
+            time_in, hours = self.records.close(id, time_out, event['destination'])
+        with self.metrics.span("persistence"):
+            self.journal.append(event['type'], id=id, time_in=format_time(time_in), time_out=event['time_out'],
+                                destination=event['destination'], hours=hours)
+        self.compact_journal_if_due()
+        return person, False
+
+    # Apply the events drained from the SyncClient, returns [(event, Person, signed in)] of the ones that changed
+    # something here
+    def apply_remote_events(self, events):
+        from timeclock.sync import SNAPSHOT
+
+        applied = []
+        for event in events:
+            for remote in (self.snapshot_events(event) if event['type'] == SNAPSHOT else (event,)):
+                person, signed_in = self.apply_remote_event(remote)
+                if person is not None:
+                    applied.append((remote, person, signed_in))
+        return applied
+
+    # The events that bring the people signed in here in line with a snapshot from the sync server: the sign ins
+    # that are missing here and the last sign out of the people that are signed in here but not on the server.
+    # People with sign ins/outs here that the server didn't have yet are left as they are
+    def snapshot_events(self, snapshot):
+        keep = set(snapshot.get('keep', ()))
+        active = [event for event in snapshot['active'] if str(event['id']) not in keep]
+        signed_in = set(str(event['id']) for event in snapshot['active'] if event.get('file') == self.export_file_name)
+        closed = [event for event in snapshot['closed'] if str(event['id']) in self.active_users and
+                  str(event['id']) not in keep and str(event['id']) not in signed_in]
+        return active + closed
+
+    # Sign the person in, or out if they are already in. Returns (signed in, sign out) where sign out is what
+    # sign_out returned, None for a sign in
+    def toggle(self, person, destination="Home", now=None, forced=False):
+        if person.id not in self.active_users:
+            self.sign_in(person, now)
+            return True, None
+        return False, self.sign_out(person, destination, now, forced=forced)
+
+    # Like toggle for the person with the badge. Returns (Person, signed in, sign out), or (None, None, None)
+    # if nobody has the badge
+    def toggle_badge(self, badge_id, destination="Home", now=None, forced=False):
+        with self.metrics.span("lookup"):
+            person = self.people.find_badge(badge_id)
+        if person is None:
+            return None, None, None
+        return (person,) + self.toggle(person, destination, now, forced)
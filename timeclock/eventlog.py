@@ -0,0 +1,90 @@
+# This Python file uses the following encoding: utf-8
+# Bounded log of the sign in and ID reader messages
+#
+# The log boxes used to get every message appended for as long as the program ran, so a kiosk left on for
+# weeks kept getting slower and using more memory. The messages now go into a ring buffer of the last few
+# thousand lines (for the boxes and the filtered view on the diagnostics page), and every line is also
+# written to a rotating log file on a background thread so nothing is lost.
+#
+# The level comes from the message when it isn't given: the messages already start with "Error:" or
+# "Warning:" (after the "[reader name]" tag for the reader messages).
+
+import logging
+import logging.handlers
+import queue
+import re
+import threading
+import time
+from collections import deque, namedtuple
+
+
+INFO = "info"
+WARNING = "warning"
+ERROR = "error"
+LEVELS = (INFO, WARNING, ERROR)
+LOGGING_LEVELS = {INFO: logging.INFO, WARNING: logging.WARNING, ERROR: logging.ERROR}
+LOG_NAME = "timeclock.log"
+
+LogLine = namedtuple('LogLine', ['time', 'level', 'source', 'text'])
+
+LEVEL_PATTERN = re.compile(r'^\s*(?:\[[^\]]*\]\s*)?(error|warning)\b', re.IGNORECASE)
+
+
+def message_level(text):
+    match = LEVEL_PATTERN.match(text)
+    return match.group(1).lower() if match else INFO
+
+
+class EventLog:
+    def __init__(self, capacity=5000):
+        self.lines = deque(maxlen=capacity)     # the last LogLines from every source, oldest first
+        self.count = 0                          # lines added so far, for telling if there is anything new
+        self.path = None
+        self._lock = threading.Lock()
+        self._queue = None
+        self._listener = None
+
+    def add(self, text, source="main", level=None):
+        line = LogLine(time.time(), level or message_level(text), source, str(text))
+        with self._lock:
+            self.lines.append(line)
+            self.count += 1
+            log_queue = self._queue
+        if log_queue is not None:
+            log_queue.put(logging.makeLogRecord({"name": source, "levelno": LOGGING_LEVELS[line.level],
+                                                 "levelname": line.level.upper(), "msg": line.text,
+                                                 "created": line.time}))
+        return line
+
+    # The lines at level or above from source (None for all of them) that contain text, oldest first
+    def filtered(self, level=INFO, text="", source=None):
+        lowest = LEVELS.index(level)
+        text = text.lower()
+        with self._lock:
+            lines = list(self.lines)
+        return [line for line in lines if LEVELS.index(line.level) >= lowest and
+                (source is None or line.source == source) and (not text or text in line.text.lower())]
+
+    # Methods for the log file
+    # Start writing the lines to path, rolling over to path.1, path.2, ... once it gets to max_bytes
+    def open_file(self, path, max_bytes=1000000, backups=5):
+        self.close_file()
+        handler = logging.handlers.RotatingFileHandler(str(path), maxBytes=max_bytes, backupCount=backups,
+                                                       encoding='utf-8', delay=True)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)-7s %(name)s: %(message)s"))
+        log_queue = queue.Queue()
+        self._listener = logging.handlers.QueueListener(log_queue, handler)
+        self._listener.start()
+        with self._lock:
+            self._queue = log_queue
+        self.path = path
+
+    def close_file(self):
+        with self._lock:
+            self._queue = None
+        if self._listener is not None:
+            self._listener.stop()
+            for handler in self._listener.handlers:
+                handler.close()
+            self._listener = None
+        self.path = None
@@ -0,0 +1,22 @@
+# This Python file uses the following encoding: utf-8
+# Small file helpers shared by the persistence code
+
+import os
+from pathlib import Path
+
+
+# Write the text to a temp file next to the target, fsync it and then rename it over the target,
+# so a crash or a yanked USB stick never leaves a half written attendance file behind. Bytes are
+# written as they are
+def write_atomic(path, text):
+    path = Path(path)
+    temp_path = path.with_name(path.name + ".tmp")
+    if isinstance(text, bytes):
+        temp_file = open(temp_path, 'wb')
+    else:
+        temp_file = open(temp_path, 'w', encoding='utf-8', newline='')
+    with temp_file:
+        temp_file.write(text)
+        temp_file.flush()
+        os.fsync(temp_file.fileno())
+    os.replace(temp_path, path)
@@ -0,0 +1,164 @@
+# This Python file uses the following encoding: utf-8
+# Event driven reader for the Arduino ID readers
+#
+# Each reader runs on its own thread and blocks on the serial port, so a badge is handed over as soon
+# as its bytes arrive instead of waiting for the next poll. The PN532 and RDM6300 sketches print the
+# UID without a line ending, so a badge is framed either by a line ending or by a short gap in the data.
+# If the port goes away (unplugged USB cable) the reader keeps trying to reopen it.
+#
+# A ReaderManager runs any number of readers at once (one per door or line) and merges their scans
+# into one ordered stream of ScanEvents. Every read is passed on, repeats of a held card are dropped by
+# the ScanDebouncer of whatever handles the stream.
+
+import queue
+import threading
+import time
+from collections import namedtuple
+from functools import partial
+
+import serial
+
+
+ScanEvent = namedtuple('ScanEvent', ['seq', 'time', 'reader', 'badge_id'])
+
+
+class SerialReader(threading.Thread):
+    def __init__(self, port, on_badge=None, on_status=None, baudrate=115200, gap=0.02, reconnect_delay=1.0,
+                 metrics=None):
+        super().__init__(name="SerialReader " + str(port), daemon=True)
+        self.port = port
+        self.on_badge = on_badge            # called with the badge ID string, from the reader thread
+        self.on_status = on_status          # called with status messages for the com log, from the reader thread
+        self.baudrate = baudrate
+        self.gap = gap                      # seconds of silence that end a badge ID without a line ending
+        self.reconnect_delay = reconnect_delay
+        self.metrics = metrics              # gets the time from the first byte of a badge until it is framed
+        self._stop_event = threading.Event()
+        self._serial = None
+        self._buffer = b""
+        self._first_byte = 0.0
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+        self._close()
+
+    def run(self):
+        reported_error = False
+        while not self._stop_event.is_set():
+            if self._serial is None:
+                try:
+                    self._serial = serial.Serial(port=self.port, baudrate=self.baudrate, timeout=self.gap)
+                    self.status("Port connected: " + str(self.port))
+                    reported_error = False
+                except (serial.SerialException, OSError, ValueError):
+                    if not reported_error:
+                        self.status("Error: Can't open Serial Port: " + str(self.port) + ", retrying")
+                        reported_error = True
+                    self._stop_event.wait(self.reconnect_delay)
+                    continue
+            try:
+                chunk = self._serial.read(self._serial.in_waiting or 1)
+            except (serial.SerialException, OSError, TypeError, AttributeError):
+                if self._stop_event.is_set():
+                    break
+                self.status("Lost connection to port: " + str(self.port) + ", reconnecting")
+                self._close()
+                reported_error = True
+                continue
+            self.frame(chunk)
+        self._close()
+
+    # Split the incoming bytes into badge ID's on line endings or on a gap in the data
+    def frame(self, chunk):
+        now = time.perf_counter()
+        if chunk:
+            if not self._buffer:
+                self._first_byte = now
+            self._buffer += chunk.replace(b"\r", b"\n")
+            *lines, self._buffer = self._buffer.split(b"\n")
+        else:
+            lines, self._buffer = [self._buffer], b""
+        for line in lines:
+            badge_id = line.decode('ascii', errors='ignore').strip()
+            if badge_id:
+                if self.metrics is not None:
+                    self.metrics.observe("serial_read", now - self._first_byte)
+                if self.on_badge is not None:
+                    self.on_badge(badge_id)
+        if self._buffer and lines:
+            self._first_byte = now
+
+    def status(self, message):
+        if self.on_status is not None:
+            self.on_status(message)
+
+    def _close(self):
+        if self._serial is not None:
+            try:
+                self._serial.close()
+            except Exception:
+                pass
+            self._serial = None
+
+
+class ReaderManager:
+    def __init__(self, on_scan=None, on_status=None, reader_factory=SerialReader, metrics=None):
+        self.on_scan = on_scan          # called with each ScanEvent after it is queued, from the reader thread
+        self.on_status = on_status      # called with status messages tagged with the reader name
+        self.reader_factory = reader_factory
+        self.metrics = metrics          # handed to the readers for timing the serial reads
+        self.readers = {}               # reader name -> reader
+        self.events = queue.Queue()     # ScanEvents from all of the readers in the order they came in
+        self._lock = threading.Lock()
+        self._seq = 0
+
+    def __len__(self):
+        return len(self.readers)
+
+    # Methods for opening and closing readers
+    def open(self, name, port, **kwargs):
+        self.close(name)
+        reader = self.reader_factory(port, on_badge=partial(self._badge, name),
+                                     on_status=partial(self._status, name), metrics=self.metrics, **kwargs)
+        self.readers[name] = reader
+        reader.start()
+        return reader
+
+    def close(self, name):
+        reader = self.readers.pop(name, None)
+        if reader is None:
+            return False
+        reader.stop()
+        return True
+
+    def close_all(self):
+        for name in list(self.readers):
+            self.close(name)
+
+    def names_for_port(self, port):
+        return [name for name, reader in self.readers.items() if reader.port == port]
+
+    # Hand back all of the scans waiting in the stream, oldest first
+    def drain(self):
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
+
+    # Called from the reader threads
+    def _badge(self, name, badge_id):
+        now = time.monotonic()
+        with self._lock:
+            self._seq += 1
+            event = ScanEvent(self._seq, now, name, badge_id)
+            self.events.put(event)
+        if self.on_scan is not None:
+            self.on_scan(event)
+
+    def _status(self, name, message):
+        if self.on_status is not None:
+            self.on_status("[" + str(name) + "] " + message)
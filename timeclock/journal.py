@@ -0,0 +1,154 @@
+# This Python file uses the following encoding: utf-8
+# Append-only event journal for the attendance records
+#
+# Every sign in/out is written as one json line to "<attendance file name>.journal" next to the
+# attendance csv, so a scan only costs a small append no matter how long the days log is. Every so
+# often the journal is compacted: the full attendance csv and active_users csv are written from the
+# in memory state and the journal is emptied. On startup the csv files are loaded and the journal is
+# replayed on top of them to get back to where the program was.
+#
+# When a PersistenceWorker is passed in, the writes are handed to it instead of being done inline.
+
+import json
+import os
+import time
+from pathlib import Path
+
+from timeclock.fileio import write_atomic
+
+
+# Event types stored in the journal
+SIGN_IN = "sign_in"
+SIGN_OUT = "sign_out"
+GUEST_SIGN_IN = "guest_sign_in"
+FORCED_SIGN_OUT = "forced_sign_out"
+EVENT_TYPES = (SIGN_IN, SIGN_OUT, GUEST_SIGN_IN, FORCED_SIGN_OUT)
+
+# Destination written for a forced sign out, the attendance files only have the destination to tell them apart
+FORCED_DESTINATION = "Forced Sign Out"
+
+
+# The journal that goes with an attendance file, ie 20210611_attendance.csv -> 20210611_attendance.journal
+def journal_path_for(attendance_path):
+    attendance_path = Path(attendance_path)
+    return attendance_path.with_suffix(".journal")
+
+
+class AttendanceJournal:
+    def __init__(self, path, sync_every=16, sync_interval=1.0, compact_every=500, compact_interval=60.0,
+                 writer=None):
+        self.path = Path(path)
+        self.writer = writer
+        self.sync_every = sync_every            # fsync after this many events...
+        self.sync_interval = sync_interval      # ...or once this many seconds have passed since the last fsync
+        self.compact_every = compact_every      # compact after this many events...
+        self.compact_interval = compact_interval    # ...or once this many seconds have passed with events waiting
+        self.events_since_compaction = 0
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._last_compaction = time.monotonic()
+        self._file = None
+
+    def open(self):
+        if self._file is None and self.writer is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+
+    def close(self):
+        self.sync()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    # Read back all of the events in the journal, a torn last line from a crash mid write is skipped
+    def replay(self):
+        events = []
+        try:
+            with open(self.path, 'r', encoding='utf-8') as journal_file:
+                for line in journal_file:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        continue
+                    if event.get("type") in EVENT_TYPES:
+                        events.append(event)
+        except FileNotFoundError:
+            pass
+        self.events_since_compaction = len(events)
+        return events
+
+    # Methods for writing events
+    def append(self, event_type, **fields):
+        self.append_many([dict(fields, type=event_type)])
+
+    def append_many(self, events):
+        if not events:
+            return
+        text = "".join(json.dumps(event, separators=(',', ':')) + "\n" for event in events)
+        self._unsynced += len(events)
+        self.events_since_compaction += len(events)
+        sync = self._unsynced >= self.sync_every or time.monotonic() - self._last_sync >= self.sync_interval
+        if self.writer is not None:
+            self.writer.append(self.path, text, sync=sync)
+            if sync:
+                self._unsynced = 0
+                self._last_sync = time.monotonic()
+            return
+        self.open()
+        self._file.write(text)
+        self._file.flush()
+        if sync:
+            self.sync()
+
+    # Force everything written so far onto the disk
+    def sync(self):
+        if self._unsynced:
+            if self.writer is not None:
+                self.writer.sync(self.path)
+            elif self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    # Called periodically so events that came in after the last batch don't sit unsynced for long
+    def sync_if_due(self):
+        if self._unsynced and time.monotonic() - self._last_sync >= self.sync_interval:
+            self.sync()
+
+    # Methods for compaction
+    def needs_compaction(self):
+        if self.events_since_compaction >= self.compact_every:
+            return True
+        return bool(self.events_since_compaction) and \
+            time.monotonic() - self._last_compaction >= self.compact_interval
+
+    # snapshots is a list of (path, text) with the full state (attendance and active users csv's), the
+    # text can also be a function that renders it. Only once they are all written is the journal emptied.
+    # Replaying must be idempotent since a crash between the two steps replays events that are already
+    # in the csv files
+    def compact(self, snapshots, message=None):
+        if self.writer is not None:
+            self.writer.compact(self.path, snapshots, message)
+            self._compacted()
+            return
+        self.sync()
+        for path, content in snapshots:
+            write_atomic(path, content() if callable(content) else content)
+        reopen = self._file is not None
+        if reopen:
+            self._file.close()
+            self._file = None
+        with open(self.path, 'w', encoding='utf-8') as journal_file:
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        if reopen:
+            self.open()
+        self._compacted()
+
+    def _compacted(self):
+        self.events_since_compaction = 0
+        self._unsynced = 0
+        self._last_compaction = time.monotonic()
@@ -0,0 +1,162 @@
+# This Python file uses the following encoding: utf-8
+# Timing of each stage a badge scan goes through
+#
+# Code wraps a stage in "with metrics.span('lookup'):" and the time goes into a histogram for that
+# stage. Each histogram keeps cumulative bucket counts (for the Prometheus text file) and the last few
+# thousand samples (for p50/p95/p99). The stages used are:
+#   serial_read   first byte of a badge on the serial port until the badge ID is framed (reader thread)
+#   dispatch      badge ID framed until the GUI or service loop picks it up
+#   lookup        finding the person for the badge or ID
+#   mutation      updating the records and the people signed in, including telling the views
+#   persistence   appending to the journal or database (handing it to the writer thread when there is one)
+#   journal_write writing and syncing the journal on the writer thread
+#   file_write    writing the attendance, active users and other csv files on the writer thread
+#   view          log lines and table updates in the GUI
+#   scan          the whole scan, from being picked up until the log line is shown
+
+import bisect
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+from timeclock.fileio import write_atomic
+
+
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+PERCENTILES = (50, 95, 99)
+
+
+class Histogram:
+    def __init__(self, window=2048):
+        self.bucket_counts = [0] * (len(BUCKETS) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, seconds):
+        self.bucket_counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    # p50/p95/p99 in seconds of the recent samples
+    def percentiles(self):
+        if not self.recent:
+            return [0.0] * len(PERCENTILES)
+        return np.percentile(np.fromiter(self.recent, dtype=np.float64, count=len(self.recent)),
+                             PERCENTILES).tolist()
+
+
+class Metrics:
+    def __init__(self, window=2048):
+        self.window = window
+        self.histograms = {}        # stage name -> Histogram
+        self.changed = False        # set when something was observed since the last dump
+        self._lock = threading.Lock()   # the serial readers observe from their own threads
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(self.window)
+            histogram.observe(seconds)
+            self.changed = True
+
+    @contextmanager
+    def span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.changed = True
+
+    # [(stage, count, p50, p95, p99, max)] with the times in milliseconds
+    def summary(self):
+        with self._lock:
+            histograms = [(name, histogram.count, histogram.percentiles(), histogram.max)
+                          for name, histogram in self.histograms.items()]
+        return [(name, count, *[value * 1000 for value in percentiles], maximum * 1000)
+                for name, count, percentiles, maximum in sorted(histograms)]
+
+    # Methods for the dump files
+    def to_json(self):
+        stages = {}
+        for name, count, p50, p95, p99, maximum in self.summary():
+            stages[name] = {"count": count, "p50_ms": round(p50, 3), "p95_ms": round(p95, 3),
+                            "p99_ms": round(p99, 3), "max_ms": round(maximum, 3)}
+        return json.dumps({"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "stages": stages}, indent=2)
+
+    def to_prometheus(self, prefix="timeclock"):
+        with self._lock:
+            histograms = sorted((name, list(histogram.bucket_counts), histogram.sum, histogram.count,
+                                 histogram.percentiles()) for name, histogram in self.histograms.items())
+        lines = ["# HELP " + prefix + "_stage_seconds Time spent in each stage of a badge scan",
+                 "# TYPE " + prefix + "_stage_seconds histogram"]
+        for name, bucket_counts, total, count, percentiles in histograms:
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS + ("+Inf",), bucket_counts):
+                cumulative += bucket_count
+                lines.append('{}_stage_seconds_bucket{{stage="{}",le="{}"}} {}'.format(prefix, name, bound, cumulative))
+            lines.append('{}_stage_seconds_sum{{stage="{}"}} {:.6f}'.format(prefix, name, total))
+            lines.append('{}_stage_seconds_count{{stage="{}"}} {}'.format(prefix, name, count))
+        lines += ["# HELP " + prefix + "_stage_recent_seconds Percentiles of the recent scans of each stage",
+                  "# TYPE " + prefix + "_stage_recent_seconds gauge"]
+        for name, bucket_counts, total, count, percentiles in histograms:
+            for percentile, value in zip(PERCENTILES, percentiles):
+                lines.append('{}_stage_recent_seconds{{stage="{}",quantile="{}"}} {:.6f}'.format(
+                    prefix, name, percentile / 100, value))
+        return "\n".join(lines) + "\n"
+
+    # Write the json and Prometheus files, through the writer thread when there is one
+    def dump(self, json_path, prometheus_path, writer=None):
+        self.changed = False
+        json_text = self.to_json()
+        prometheus_text = self.to_prometheus()
+        for path, text in ((json_path, json_text), (prometheus_path, prometheus_text)):
+            if writer is not None:
+                writer.replace(path, text)
+            else:
+                write_atomic(path, text)
+
+
+# cProfile of the thread that starts it, for catching what a burst of sign ins spends its time on
+class ScanProfiler:
+    def __init__(self):
+        self.profile = None
+
+    @property
+    def running(self):
+        return self.profile is not None
+
+    def start(self):
+        import cProfile
+
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    # Stops profiling and returns the top functions by cumulative time, the full profile is saved to path
+    # (open it with snakeviz or pstats) when one is given
+    def stop(self, path=None, limit=25):
+        import io
+        import pstats
+
+        profile, self.profile = self.profile, None
+        if profile is None:
+            return ""
+        profile.disable()
+        if path is not None:
+            profile.dump_stats(str(path))
+        text = io.StringIO()
+        pstats.Stats(profile, stream=text).strip_dirs().sort_stats("cumulative").print_stats(limit)
+        return text.getvalue()
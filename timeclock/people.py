@@ -0,0 +1,103 @@
+# This Python file uses the following encoding: utf-8
+# Registry of the people in the people csv file with hash indexes for looking up badges and ID's
+
+from collections import namedtuple
+
+
+Person = namedtuple('Person', ['id', 'first_name', 'last_name'])
+
+REQUIRED_COLUMNS = ('ID', 'First_Name', 'Last_Name', 'Badge')
+
+
+# Missing columns come back as None
+def cell_text(value):
+    if value is None:
+        return ""
+    return str(value)
+
+
+# Badges are matched without the spaces around them and without leading zeros, the readers and the people
+# file don't always agree on those (0012345678 vs 12345678)
+def normalize_badge(value):
+    text = cell_text(value).strip()
+    return text.lstrip("0") or text[:1]
+
+
+class PeopleRegistry:
+    def __init__(self):
+        self.columns = []
+        self.rows = {}          # row key -> (Person, badge)
+        self.by_id = {}         # ID -> [row keys], the first key wins like the first match in the file used to
+        self.by_badge = {}      # Badge -> [row keys]
+
+    def __len__(self):
+        return len(self.rows)
+
+    # Rebuild all of the indexes, rows is an iterable of (row key, row values) in file order
+    def rebuild(self, columns, rows):
+        self.columns = list(columns)
+        self.rows = {}
+        self.by_id = {}
+        self.by_badge = {}
+        for key, values in rows:
+            self.set_row(key, values)
+
+    # Methods for keeping the indexes up to date while the people file is edited
+    def set_row(self, key, values):
+        self.remove_row(key)
+        values = dict(zip(self.columns, values))
+        person = Person(cell_text(values.get('ID')), cell_text(values.get('First_Name')),
+                        cell_text(values.get('Last_Name')))
+        badge = normalize_badge(values.get('Badge'))
+        self.rows[key] = (person, badge)
+        if person.id:
+            self.by_id.setdefault(person.id, []).append(key)
+        if badge:
+            self.by_badge.setdefault(badge, []).append(key)
+
+    def remove_row(self, key):
+        if key not in self.rows:
+            return
+        person, badge = self.rows.pop(key)
+        self._unindex(self.by_id, person.id, key)
+        self._unindex(self.by_badge, badge, key)
+
+    @staticmethod
+    def _unindex(index, value, key):
+        keys = index.get(value)
+        if keys and key in keys:
+            keys.remove(key)
+            if not keys:
+                del index[value]
+
+    # Methods for looking people up, both return None when nobody matches
+    def find_id(self, id):
+        keys = self.by_id.get(str(id))
+        if keys:
+            return self.rows[keys[0]][0]
+        return None
+
+    def find_badge(self, badge):
+        keys = self.by_badge.get(normalize_badge(badge))
+        if keys:
+            return self.rows[keys[0]][0]
+        return None
+
+    # What is wrong with the people file, for warning about it when it is loaded. Missing columns, ID's that
+    # are in the file more than once and badges given to more than one person, at most limit of them
+    def problems(self, limit=10):
+        problems = ["The people file has no " + column + " column" for column in REQUIRED_COLUMNS
+                    if column not in self.columns]
+        for id, keys in self.by_id.items():
+            if len(keys) > 1:
+                problems.append("ID " + id + " is in the people file " + str(len(keys)) + " times, " +
+                                self._names(keys) + " (the first one is used)")
+        for badge, keys in self.by_badge.items():
+            if len(keys) > 1 and len(set(self.rows[key][0].id for key in keys)) > 1:
+                problems.append("Badge " + badge + " is given to " + self._names(keys) + " (the first one is used)")
+        if len(problems) > limit:
+            problems[limit:] = ["and " + str(len(problems) - limit) + " more problems with the people file"]
+        return problems
+
+    def _names(self, keys):
+        return ", ".join(self.rows[key][0].first_name + " " + self.rows[key][0].last_name for key in keys)
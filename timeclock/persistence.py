@@ -0,0 +1,170 @@
+# This Python file uses the following encoding: utf-8
+# Background writer so that disk I/O never runs on the GUI thread
+#
+# Writes are queued as small requests and handled in order by one worker thread. Requests that pile up
+# while a write is in progress are merged: back to back appends to the same file become one write, back
+# to back database events become one transaction, and only the newest snapshot of a file is written. Snapshots are written atomically with a temp file and
+# a rename. Completion messages and errors are passed to callbacks, which the GUI hooks up to signals.
+
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+
+from timeclock.fileio import write_atomic
+
+
+APPEND = "append"
+TRANSACTION = "transaction"
+SYNC = "sync"
+REPLACE = "replace"
+COMPACT = "compact"
+BARRIER = "barrier"
+STOP = "stop"
+
+
+# A snapshot can be passed as the finished text or as a function that renders it on the worker thread
+def render(content):
+    return content() if callable(content) else content
+
+
+class PersistenceWorker(threading.Thread):
+    def __init__(self, on_written=None, on_error=None, metrics=None):
+        super().__init__(name="PersistenceWorker", daemon=True)
+        self.on_written = on_written
+        self.on_error = on_error
+        self.metrics = metrics  # gets the time each journal write and file write takes
+        self.requests = queue.Queue()
+        self.writes = 0         # number of file writes done, merged requests count once
+        self.bytes_written = 0
+
+    # Methods for queueing requests, these all return right away
+    def append(self, path, text, sync=False):
+        self.requests.put((APPEND, Path(path), text, sync))
+
+    # rows are written by calling commit(rows) on the worker thread, rows queued back to back for the same
+    # database are passed in one call
+    def transaction(self, path, rows, commit):
+        self.requests.put((TRANSACTION, Path(path), list(rows), commit))
+
+    def sync(self, path):
+        self.requests.put((SYNC, Path(path)))
+
+    # on_failed is called on the worker thread if the file couldn't be written
+    def replace(self, path, content, message=None, on_failed=None):
+        self.requests.put((REPLACE, Path(path), content, message, (on_failed,) if on_failed is not None else ()))
+
+    # Write all of the snapshots and then empty the journal, the journal is left alone if a snapshot fails.
+    # A journal that isn't a plain file passes empty, which is called on the worker thread to empty it
+    def compact(self, journal_path, snapshots, message=None, empty=None):
+        self.requests.put((COMPACT, Path(journal_path), [(Path(path), content) for path, content in snapshots], message,
+                           empty))
+
+    # Block until everything queued so far is on the disk
+    def flush(self, timeout=None):
+        if not self.is_alive():
+            return True
+        done = threading.Event()
+        self.requests.put((BARRIER, done))
+        return done.wait(timeout)
+
+    def stop(self, timeout=None):
+        if self.is_alive():
+            self.requests.put((STOP,))
+            self.join(timeout)
+
+    # Methods for the worker thread
+    def run(self):
+        running = True
+        while running:
+            batch = [self.requests.get()]
+            while True:
+                try:
+                    batch.append(self.requests.get_nowait())
+                except queue.Empty:
+                    break
+            for request in self.merge(batch):
+                if request[0] == STOP:
+                    running = False
+                    continue
+                self.handle(request)
+
+    # Nothing is merged across a barrier, so flush() really waits for everything queued before it
+    @staticmethod
+    def merge(batch):
+        merged = []
+        fence = 0
+        for request in batch:
+            kind = request[0]
+            last = merged[-1] if len(merged) > fence else None
+            if kind == APPEND and last is not None and last[0] == APPEND and last[1] == request[1]:
+                merged[-1] = (APPEND, request[1], last[2] + request[2], last[3] or request[3])
+                continue
+            if kind == TRANSACTION and last is not None and last[0] == TRANSACTION and last[1] == request[1]:
+                merged[-1] = (TRANSACTION, request[1], last[2] + request[2], request[3])
+                continue
+            if kind in (REPLACE, COMPACT):
+                # A newer snapshot of the same file makes the older one pointless, the newer one
+                # already holds everything the older one did. If it fails the older one failed too
+                older = [other for other in merged[fence:] if other[0] == kind and other[1] == request[1]]
+                if kind == REPLACE and older:
+                    request = request[:4] + (sum((replaced[4] for replaced in older), ()) + request[4],)
+                merged[fence:] = [other for other in merged[fence:]
+                                  if not (other[0] == kind and other[1] == request[1])]
+            merged.append(request)
+            if kind == BARRIER:
+                fence = len(merged)
+        return merged
+
+    def handle(self, request):
+        kind = request[0]
+        if kind == BARRIER:
+            request[1].set()
+            return
+        started = time.perf_counter()
+        try:
+            if kind == APPEND:
+                with open(request[1], 'a', encoding='utf-8') as append_file:
+                    append_file.write(request[2])
+                    if request[3]:
+                        append_file.flush()
+                        os.fsync(append_file.fileno())
+                self.writes += 1
+                self.bytes_written += len(request[2])
+            elif kind == TRANSACTION:
+                request[3](request[2])
+                self.writes += 1
+            elif kind == SYNC:
+                if request[1].exists():
+                    with open(request[1], 'a', encoding='utf-8') as sync_file:
+                        os.fsync(sync_file.fileno())
+            elif kind == REPLACE:
+                self.write(request[1], render(request[2]))
+                self.report(request[3])
+            elif kind == COMPACT:
+                for path, content in request[2]:
+                    self.write(path, render(content))
+                if request[4] is not None:
+                    request[4]()
+                else:
+                    self.write(request[1], "")
+                self.report(request[3])
+        except Exception as e:
+            if self.on_error is not None:
+                self.on_error("Error: Unable to write " + str(request[1]) + ": " + str(e))
+            if kind == REPLACE:
+                for on_failed in request[4]:
+                    on_failed()
+        if self.metrics is not None:
+            self.metrics.observe("journal_write" if kind in (APPEND, TRANSACTION, SYNC) else "file_write",
+                                 time.perf_counter() - started)
+
+    def write(self, path, text):
+        write_atomic(path, text)
+        self.writes += 1
+        self.bytes_written += len(text)
+
+    def report(self, message):
+        if message and self.on_written is not None:
+            self.on_written(message)
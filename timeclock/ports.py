@@ -0,0 +1,148 @@
+# This Python file uses the following encoding: utf-8
+# Finding the serial ports in the background and following a reader when it is plugged back in
+#
+# Listing the ports can take a while on machines with a lot of virtual ports, so the PortScanner does it
+# on its own thread every few seconds and keeps the last list. When pyudev is installed (Linux) it also
+# looks right away when a tty is added or removed. A port is remembered by its identity, the USB serial
+# number, vendor/product ID and USB location as well as the device path, since the path (COM3, ttyUSB0)
+# can change when the reader is plugged into another socket or the ports come up in a different order.
+
+import threading
+from collections import namedtuple
+
+
+PortInfo = namedtuple('PortInfo', ['device', 'description', 'vid_pid', 'serial_number', 'location'])
+
+
+def port_info(port):
+    vid_pid = "{:04X}:{:04X}".format(port.vid, port.pid) if port.vid is not None and port.pid is not None else ""
+    return PortInfo(port.device, port.description or "", vid_pid, port.serial_number or "", port.location or "")
+
+
+def list_ports():
+    import serial.tools.list_ports
+
+    return [port_info(port) for port in serial.tools.list_ports.comports()]
+
+
+# Text for the port selector, ie "COM3 - USB-SERIAL CH340 (COM3)"
+def port_label(info):
+    if info.description and info.description not in ("n/a", info.device):
+        return info.device + " - " + info.description
+    return info.device
+
+
+# What a port is remembered by, a dict so it can be saved as json
+def port_identity(info):
+    return {"device": info.device, "vid_pid": info.vid_pid, "serial_number": info.serial_number,
+            "location": info.location}
+
+
+# The port that matches a saved identity best, or None. The serial number is the surest, then the socket
+# the same kind of adapter is plugged into, then the device path, then the only adapter of that kind
+def find_port(identity, ports):
+    if not identity:
+        return None
+    vid_pid = identity.get("vid_pid", "")
+    serial_number = identity.get("serial_number", "")
+    location = identity.get("location", "")
+    if vid_pid and serial_number:
+        for port in ports:
+            if port.vid_pid == vid_pid and port.serial_number == serial_number:
+                return port
+    if vid_pid and location:
+        for port in ports:
+            if port.vid_pid == vid_pid and port.location == location:
+                return port
+    for port in ports:
+        if port.device == identity.get("device") and (not vid_pid or port.vid_pid in ("", vid_pid)):
+            return port
+    if vid_pid:
+        same_kind = [port for port in ports if port.vid_pid == vid_pid]
+        if len(same_kind) == 1:
+            return same_kind[0]
+    return None
+
+
+# Work out where the readers' ports are now. identities (reader name -> identity) is filled in for readers
+# that don't have one yet and updated for the ones that moved. Returns {reader name: new device path}
+def follow_readers(readers, identities, ports):
+    moved = {}
+    for name, reader in readers.items():
+        identity = identities.get(name)
+        if not identity or set(identity) == {"device"}:
+            # Nothing but the path is known yet, learn the rest while the port is there
+            info = next((port for port in ports if port.device == reader.port), None)
+            if info is not None:
+                identities[name] = port_identity(info)
+            continue
+        info = find_port(identity, ports)
+        if info is not None and info.device != reader.port:
+            moved[name] = info.device
+            identities[name] = port_identity(info)
+    return moved
+
+
+class PortScanner(threading.Thread):
+    def __init__(self, on_change=None, on_status=None, interval=2.0, lister=list_ports):
+        super().__init__(name="PortScanner", daemon=True)
+        self.on_change = on_change      # called with the new list of PortInfo when it changed, from the scanner thread
+        self.on_status = on_status
+        self.interval = interval        # seconds between looks, a lot longer when udev says when to look
+        self.lister = lister
+        self.ports = None               # the last list of PortInfo, None until the first look is done
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._observer = None
+
+    # Look again now instead of waiting for the next time
+    def refresh(self):
+        self._wake.set()
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        self._wake.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer = None
+        if self.is_alive():
+            self.join(timeout)
+
+    def run(self):
+        interval = self.interval * 15 if self.watch_udev() else self.interval
+        reported_error = False
+        while not self._stop_event.is_set():
+            try:
+                ports = self.lister()
+                reported_error = False
+            except Exception as e:
+                if not reported_error:
+                    self.status("Error: Unable to list the serial ports: " + str(e))
+                    reported_error = True
+                ports = self.ports if self.ports is not None else []
+            if ports != self.ports:
+                self.ports = ports
+                if self.on_change is not None:
+                    self.on_change(ports)
+            self._wake.wait(interval)
+            self._wake.clear()
+
+    # Look whenever a tty comes or goes, returns False if pyudev isn't there
+    def watch_udev(self):
+        try:
+            import pyudev
+        except ImportError:
+            return False
+        try:
+            monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+            monitor.filter_by("tty")
+            self._observer = pyudev.MonitorObserver(monitor, callback=lambda device: self.refresh(), daemon=True)
+            self._observer.start()
+        except Exception:
+            self._observer = None
+            return False
+        return True
+
+    def status(self, message):
+        if self.on_status is not None:
+            self.on_status(message)
@@ -0,0 +1,217 @@
+# This Python file uses the following encoding: utf-8
+# Columnar store for the attendance records
+#
+# Rows are kept in numpy arrays that double in size when they fill up, so adding a record is O(1)
+# instead of copying the whole DataFrame like DataFrame.append did. Names, ID's and destinations are
+# interned and stored as integer codes, times are stored as int64 seconds. A DataFrame in the
+# attendance file layout is only built when the records are exported.
+
+import calendar
+from datetime import datetime, timedelta
+
+import numpy as np
+
+
+TIME_FORMAT = '%Y-%m-%d_%H:%M:%S'      # Same as the 'yyyy-MM-dd_hh:mm:ss' used in the attendance files
+NO_TIME = np.iinfo(np.int64).min        # Time_Out of an open session, or a Time_In that couldn't be read
+EPOCH = datetime(1970, 1, 1)
+
+RECORD_COLUMNS = ["ID", "First_Name", "Last_Name", "Time_In", "Time_Out", "Destination", "Hours"]
+
+
+# Times are wall clock times like in the attendance files, so they are counted from the epoch
+# as if they were UTC, that keeps them identical to what pandas does with naive times
+def parse_time(text):
+    return calendar.timegm(datetime.strptime(text, TIME_FORMAT).timetuple())
+
+
+def format_time(seconds):
+    if seconds == NO_TIME:
+        return ""
+    return (EPOCH + timedelta(seconds=int(seconds))).strftime(TIME_FORMAT)
+
+
+def hours_between(time_in, time_out):
+    return round((time_out - time_in) / 3600, 2)
+
+
+# Hands out one integer code per distinct string so every copy of a name is only stored once
+class StringPool:
+    def __init__(self):
+        self.strings = []
+        self.codes = {}
+
+    def __len__(self):
+        return len(self.strings)
+
+    def intern(self, text):
+        text = "" if text is None else str(text)
+        code = self.codes.get(text)
+        if code is None:
+            code = len(self.strings)
+            self.codes[text] = code
+            self.strings.append(text)
+        return code
+
+    def lookup(self, code):
+        return self.strings[code]
+
+
+class RecordStore:
+    def __init__(self, capacity=256):
+        self.strings = StringPool()
+        self.open_sessions = {}     # ID -> row of the open session, the latest one wins
+        self._size = 0
+        self._allocate(capacity)
+
+    def __len__(self):
+        return self._size
+
+    def _allocate(self, capacity):
+        self._id = np.zeros(capacity, dtype=np.int32)
+        self._first_name = np.zeros(capacity, dtype=np.int32)
+        self._last_name = np.zeros(capacity, dtype=np.int32)
+        self._time_in = np.full(capacity, NO_TIME, dtype=np.int64)
+        self._time_out = np.full(capacity, NO_TIME, dtype=np.int64)
+        self._destination = np.zeros(capacity, dtype=np.int32)
+        self._hours = np.full(capacity, np.nan, dtype=np.float64)
+
+    # Double the capacity when full, so growing to n rows copies O(n) values in total
+    def _reserve(self, needed):
+        capacity = len(self._id)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        size = self._size
+        old = (self._id, self._first_name, self._last_name, self._time_in, self._time_out,
+               self._destination, self._hours)
+        self._allocate(capacity)
+        for new_column, old_column in zip((self._id, self._first_name, self._last_name, self._time_in,
+                                           self._time_out, self._destination, self._hours), old):
+            new_column[:size] = old_column[:size]
+
+    # A copy that can be exported on another thread while this store keeps taking scans
+    def snapshot(self):
+        copy = RecordStore.__new__(RecordStore)
+        copy.strings = StringPool()
+        copy.strings.strings = list(self.strings.strings)
+        copy.open_sessions = dict(self.open_sessions)
+        copy._size = self._size
+        for name in ('_id', '_first_name', '_last_name', '_time_in', '_time_out', '_destination', '_hours'):
+            setattr(copy, name, getattr(self, name)[:self._size].copy())
+        return copy
+
+    def clear(self):
+        self.strings = StringPool()
+        self.open_sessions = {}
+        self._size = 0
+        self._allocate(256)
+
+    # Methods for adding and closing sessions
+    def add(self, id, first_name, last_name, time_in):
+        self._reserve(self._size + 1)
+        row = self._size
+        self._id[row] = self.strings.intern(id)
+        self._first_name[row] = self.strings.intern(first_name)
+        self._last_name[row] = self.strings.intern(last_name)
+        self._time_in[row] = time_in
+        self._destination[row] = self.strings.intern("")
+        self._size += 1
+        self.open_sessions[str(id)] = row
+        return row
+
+    # Fill in "Time_Out", "Destination", "Hours" of the open session, returns (Time_In, Hours)
+    def close(self, id, time_out, destination):
+        row = self.open_sessions.pop(str(id))
+        time_in = int(self._time_in[row])
+        hours = hours_between(time_in, time_out) if time_in != NO_TIME else 0.0
+        self._time_out[row] = time_out
+        self._destination[row] = self.strings.intern(destination)
+        self._hours[row] = hours
+        return time_in, hours
+
+    # Close the open sessions of all of the ID's in one vectorized pass, returns [(ID, Time_In, Time_Out, Hours)].
+    # A session is never closed before it started, those get a Time_Out of their Time_In instead
+    def close_many(self, ids, time_out, destination):
+        ids = [str(id) for id in ids if str(id) in self.open_sessions]
+        if not ids:
+            return []
+        rows = np.fromiter((self.open_sessions.pop(id) for id in ids), dtype=np.int64, count=len(ids))
+        times_in = self._time_in[rows]
+        times_out = np.maximum(times_in, time_out)
+        hours = np.where(times_in != NO_TIME, np.round((times_out - times_in) / 3600, 2), 0.0)
+        self._time_out[rows] = times_out
+        self._destination[rows] = self.strings.intern(destination)
+        self._hours[rows] = hours
+        return list(zip(ids, times_in.tolist(), times_out.tolist(), hours.tolist()))
+
+    # Methods for reading records back
+    def time_in(self, row):
+        return int(self._time_in[row])
+
+    def is_open(self, row):
+        return self._time_out[row] == NO_TIME
+
+    # (ID, First_Name, Last_Name) of everyone with an open session, in the order they signed in
+    def open_people(self):
+        rows = np.array(sorted(self.open_sessions.values()), dtype=np.int64)
+        strings = np.array(self.strings.strings, dtype=object)
+        return list(zip(strings[self._id[rows]].tolist(), strings[self._first_name[rows]].tolist(),
+                        strings[self._last_name[rows]].tolist()))
+
+    # Row of the session with this ID and Time_In, or None. Only used while replaying the journal and for
+    # sign ins from the other kiosks
+    def find(self, id, time_in):
+        code = self.strings.codes.get(str(id))
+        if code is None:
+            return None
+        rows = np.flatnonzero((self._id[:self._size] == code) & (self._time_in[:self._size] == time_in))
+        return int(rows[-1]) if len(rows) else None
+
+    # Methods for moving to and from the attendance file layout
+    def load_frame(self, frame):
+        import pandas as pd
+
+        self.clear()
+        count = frame.shape[0]
+        self._reserve(count)
+        lookup = np.vectorize(self.strings.intern, otypes=[np.int32]) if count else None
+        for column, name in ((self._id, 'ID'), (self._first_name, 'First_Name'),
+                             (self._last_name, 'Last_Name'), (self._destination, 'Destination')):
+            if count:
+                column[:count] = lookup(frame[name].fillna("").astype(str).to_numpy())
+        for column, name in ((self._time_in, 'Time_In'), (self._time_out, 'Time_Out')):
+            times = pd.to_datetime(frame[name].fillna(""), format=TIME_FORMAT, errors='coerce')
+            column[:count] = np.where(times.isna(), NO_TIME, times.to_numpy(dtype='datetime64[s]').astype(np.int64))
+        self._hours[:count] = pd.to_numeric(frame['Hours'], errors='coerce').to_numpy(dtype=np.float64)
+        self._size = count
+
+        # Everyone without a Time_Out still has an open session
+        open_rows = np.flatnonzero(self._time_out[:count] == NO_TIME)
+        self.open_sessions = {self.strings.lookup(code): int(row)
+                              for code, row in zip(self._id[open_rows].tolist(), open_rows.tolist())}
+
+    def to_frame(self):
+        import pandas as pd
+
+        size = self._size
+        strings = np.array(self.strings.strings, dtype=object)
+        frame = pd.DataFrame({
+            'ID': strings[self._id[:size]],
+            'First_Name': strings[self._first_name[:size]],
+            'Last_Name': strings[self._last_name[:size]],
+            'Time_In': self._format_times(self._time_in[:size]),
+            'Time_Out': self._format_times(self._time_out[:size]),
+            'Destination': strings[self._destination[:size]],
+            'Hours': self._hours[:size],
+        }, columns=RECORD_COLUMNS)
+        return frame
+
+    @staticmethod
+    def _format_times(seconds):
+        import pandas as pd
+
+        missing = seconds == NO_TIME
+        text = pd.Series(pd.to_datetime(np.where(missing, 0, seconds), unit='s')).dt.strftime(TIME_FORMAT)
+        return np.where(missing, "", text.to_numpy(dtype=object))
@@ -0,0 +1,69 @@
+# This Python file uses the following encoding: utf-8
+# Works out who is signed in when the program starts
+#
+# active_users.csv and the open sessions (no Time_Out) of the day's attendance file should agree, but
+# a crash between writing one and the other leaves them out of step. The attendance file wins: people
+# in active_users.csv without an open session are dropped, people with an open session that are
+# missing from active_users.csv are added back, and repeated rows are removed. It is all done with
+# whole column operations so it takes about the same time for 5 people or 5000.
+
+import time
+from collections import namedtuple
+
+from timeclock.people import Person
+
+
+ACTIVE_USERS_COLUMNS = ["ID", "First_Name", "Last_Name"]
+
+Recovery = namedtuple('Recovery', ['users', 'guests', 'duplicates', 'no_session', 'missing', 'seconds'])
+
+
+def guest_mask(ids):
+    return ids.str.contains("G", regex=False)
+
+
+# active_users is the DataFrame read from active_users.csv (None if there wasn't one), open_people is
+# RecordStore.open_people(), or None if the attendance file couldn't be read and nothing can be checked
+def recover_active_users(active_users, open_people):
+    import pandas as pd
+
+    started = time.perf_counter()
+    if active_users is None:
+        active_users = pd.DataFrame(columns=ACTIVE_USERS_COLUMNS)
+    active = active_users[ACTIVE_USERS_COLUMNS].fillna("").astype(str)
+    unique = active.drop_duplicates("ID", keep="first")
+    duplicates = len(active) - len(unique)
+
+    if open_people is None:
+        users = unique
+        no_session = missing = 0
+    else:
+        open_frame = pd.DataFrame(open_people, columns=ACTIVE_USERS_COLUMNS, dtype=str)
+        has_session = unique["ID"].isin(open_frame["ID"])
+        missing_users = open_frame[~open_frame["ID"].isin(unique["ID"])]
+        users = pd.concat([unique[has_session], missing_users], ignore_index=True)
+        no_session = int((~has_session).sum())
+        missing = len(missing_users)
+
+    people = [Person(*row) for row in users.itertuples(index=False, name=None)]
+    guests = [person for person, guest in zip(people, guest_mask(users["ID"]).tolist()) if guest]
+    return Recovery(people, guests, duplicates, no_session, missing, time.perf_counter() - started)
+
+
+def recovery_fixes(recovery):
+    return recovery.duplicates + recovery.no_session + recovery.missing
+
+
+def recovery_message(recovery):
+    message = "Recovered " + str(len(recovery.users)) + " signed in (" + str(len(recovery.guests)) + \
+        " guests) in " + str(round(recovery.seconds * 1000, 1)) + " ms"
+    fixes = []
+    if recovery.no_session:
+        fixes.append(str(recovery.no_session) + " without a sign in record removed")
+    if recovery.missing:
+        fixes.append(str(recovery.missing) + " signed in on the attendance file added")
+    if recovery.duplicates:
+        fixes.append(str(recovery.duplicates) + " repeated removed")
+    if fixes:
+        message += ", " + str(recovery_fixes(recovery)) + " fixed: " + ", ".join(fixes)
+    return message
@@ -0,0 +1,178 @@
+# This Python file uses the following encoding: utf-8
+# Season totals from all of the daily attendance files in the export folder
+#
+# Every attendance file is parsed into typed numpy columns (times as int64 seconds, hours as float64)
+# and the columns are kept in a small cache file in the export folder keyed by the modification time
+# and size of each attendance file, so only the days that are new or changed are parsed again. The
+# totals are worked out with pandas group by's on the combined columns.
+#
+# The export folder is often a shared drive, so the cache is plain json and only ever read as data.
+
+import json
+from pathlib import Path
+
+import numpy as np
+
+from timeclock.fileio import write_atomic
+from timeclock.records import TIME_FORMAT, NO_TIME
+
+
+CACHE_NAME = ".attendance_cache.json"
+CACHE_VERSION = 2
+STRING_COLUMNS = ("ID", "First_Name", "Last_Name", "Destination")
+TIME_COLUMNS = ("Time_In", "Time_Out")
+
+
+def find_attendance_files(folder, suffix="_attendance"):
+    return sorted(path for path in Path(folder).glob("*" + suffix + ".csv") if path.is_file())
+
+
+# Read one attendance file into a dict of numpy columns
+def parse_attendance_file(path):
+    import pandas as pd
+
+    frame = pd.read_csv(path, dtype=str, keep_default_na=False)
+    columns = {}
+    for name in STRING_COLUMNS:
+        values = frame[name] if name in frame else pd.Series([""] * len(frame))
+        columns[name] = values.fillna("").astype(str).to_numpy(dtype=object)
+    for name in TIME_COLUMNS:
+        values = frame[name] if name in frame else pd.Series([""] * len(frame))
+        times = pd.to_datetime(values.fillna(""), format=TIME_FORMAT, errors='coerce')
+        columns[name] = np.where(times.isna(), NO_TIME, times.to_numpy(dtype='datetime64[s]').astype(np.int64))
+    hours = frame["Hours"] if "Hours" in frame else pd.Series([""] * len(frame))
+    columns["Hours"] = pd.to_numeric(hours, errors='coerce').to_numpy(dtype=np.float64)
+    return columns
+
+
+# Methods for turning the columns of a file into json and back, a missing Hours is written as null
+def columns_to_json(columns):
+    data = {name: columns[name].tolist() for name in STRING_COLUMNS + TIME_COLUMNS}
+    data["Hours"] = [None if hours != hours else hours for hours in columns["Hours"].tolist()]
+    return data
+
+
+def columns_from_json(data):
+    columns = {name: np.array([str(value) for value in data[name]], dtype=object) for name in STRING_COLUMNS}
+    for name in TIME_COLUMNS:
+        columns[name] = np.array(data[name], dtype=np.int64)
+    columns["Hours"] = np.array(data["Hours"], dtype=np.float64)
+    if len(set(len(values) for values in columns.values())) > 1:
+        raise ValueError("columns of different lengths")
+    return columns
+
+
+class AttendanceCache:
+    def __init__(self, folder, suffix="_attendance"):
+        self.folder = Path(folder)
+        self.suffix = suffix
+        self.path = self.folder / CACHE_NAME
+        self.entries = {}       # file name -> (mtime_ns, size, columns)
+        self.parsed = 0         # files parsed by the last refresh, the rest came from the cache
+
+    # Anything wrong with the cache just means the files are parsed again
+    def load(self):
+        self.entries = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as cache_file:
+                cache = json.load(cache_file)
+            if cache.get("version") != CACHE_VERSION:
+                return
+            for name, entry in cache["entries"].items():
+                self.entries[name] = (int(entry["mtime_ns"]), int(entry["size"]), columns_from_json(entry["columns"]))
+        except (OSError, ValueError, AttributeError, KeyError, TypeError):
+            self.entries = {}
+
+    def save(self):
+        entries = {name: {"mtime_ns": mtime_ns, "size": size, "columns": columns_to_json(columns)}
+                   for name, (mtime_ns, size, columns) in self.entries.items()}
+        write_atomic(self.path, json.dumps({"version": CACHE_VERSION, "entries": entries}, separators=(',', ':')))
+
+    # Bring the cache up to date with the folder, returns the columns of every file in date order
+    def refresh(self):
+        self.load()
+        files = find_attendance_files(self.folder, self.suffix)
+        entries = {}
+        self.parsed = 0
+        for path in files:
+            stat = path.stat()
+            cached = self.entries.get(path.name)
+            if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+                entries[path.name] = cached
+                continue
+            try:
+                entries[path.name] = (stat.st_mtime_ns, stat.st_size, parse_attendance_file(path))
+                self.parsed += 1
+            except Exception:
+                continue
+        changed = self.parsed or set(entries) != set(self.entries)
+        self.entries = entries
+        if changed:
+            try:
+                self.save()
+            except OSError:
+                pass
+        return [(name, entries[name][2]) for name in sorted(entries)]
+
+
+class SeasonReport:
+    def __init__(self, folder, suffix="_attendance", use_cache=True):
+        self.cache = AttendanceCache(folder, suffix)
+        self.use_cache = use_cache
+        self.frame = None
+
+    # All of the records of the season in one DataFrame with typed columns
+    def load(self):
+        import pandas as pd
+
+        if self.use_cache:
+            files = self.cache.refresh()
+        else:
+            files = [(path.name, parse_attendance_file(path))
+                     for path in find_attendance_files(self.cache.folder, self.cache.suffix)]
+        columns = {}
+        for name in STRING_COLUMNS + TIME_COLUMNS + ("Hours",):
+            parts = [file_columns[name] for file_name, file_columns in files]
+            if parts:
+                columns[name] = np.concatenate(parts)
+            else:
+                columns[name] = np.array([], dtype=np.float64 if name == "Hours" else
+                                         (np.int64 if name.startswith("Time") else object))
+        columns["File"] = np.repeat([file_name for file_name, file_columns in files],
+                                    [len(file_columns["Hours"]) for file_name, file_columns in files]) \
+            if files else np.array([], dtype=object)
+        frame = pd.DataFrame(columns)
+        for name in ("Time_In", "Time_Out"):
+            # NO_TIME is the same value as numpy's NaT, so missing times come out as NaT
+            frame[name] = pd.to_datetime(frame[name].to_numpy().astype('datetime64[s]'))
+        frame["Day"] = frame["Time_In"].dt.normalize()
+        frame["Week"] = frame["Day"] - pd.to_timedelta(frame["Day"].dt.weekday, unit='D')
+        self.frame = frame
+        return frame
+
+    def _frame(self):
+        return self.frame if self.frame is not None else self.load()
+
+    # Methods for the totals, sessions that were never closed count as sessions but not as hours
+    def per_person(self):
+        frame = self._frame()
+        totals = frame.groupby("ID", sort=False).agg(
+            First_Name=("First_Name", "last"), Last_Name=("Last_Name", "last"), Days=("Day", "nunique"),
+            Sessions=("Hours", "size"), Hours=("Hours", "sum"))
+        totals["Hours"] = totals["Hours"].round(2)
+        return totals.sort_values(["Hours", "Last_Name"], ascending=[False, True]).reset_index()
+
+    def per_week(self):
+        frame = self._frame()
+        totals = frame.groupby("Week").agg(People=("ID", "nunique"), Sessions=("Hours", "size"),
+                                           Hours=("Hours", "sum"))
+        totals["Hours"] = totals["Hours"].round(2)
+        totals = totals.reset_index()
+        totals["Week"] = totals["Week"].dt.strftime("%Y-%m-%d")
+        return totals
+
+    def per_destination(self):
+        frame = self._frame()
+        totals = frame.groupby("Destination").agg(Sessions=("Hours", "size"), Hours=("Hours", "sum"))
+        totals["Hours"] = totals["Hours"].round(2)
+        return totals.sort_values("Sessions", ascending=False).reset_index()
@@ -0,0 +1,60 @@
+# This Python file uses the following encoding: utf-8
+# Reading, writing and filtering the people csv file
+#
+# Every cell is kept as the string that is in the file, so the table never has to convert a value
+# to show it and the file is written back the way it was read. Empty cells are empty strings.
+
+import csv
+import io
+import os
+
+
+# Returns (columns, rows) where rows is a list of lists of cell strings, every row as long as the header
+def read_roster(path):
+    with open(path, 'r', encoding='utf-8-sig', newline='') as roster_file:
+        return parse_roster(roster_file)
+
+
+def parse_roster(lines):
+    reader = csv.reader(lines)
+    columns = next(reader, [])
+    width = len(columns)
+    rows = []
+    for row in reader:
+        if not row:
+            continue
+        if len(row) < width:
+            row = row + [""] * (width - len(row))
+        elif len(row) > width:
+            row = row[:width]
+        rows.append(row)
+    return columns, rows
+
+
+# Written with the line endings of the system like pandas did
+def roster_text(columns, rows):
+    text = io.StringIO()
+    writer = csv.writer(text, lineterminator=os.linesep)
+    writer.writerow(columns)
+    writer.writerows(rows)
+    return text.getvalue()
+
+
+# A filter is either plain text that is looked for in every column, or "<column>: text" to only look
+# in the column with that header. Returns (column number or None, lowercase text)
+def parse_filter(text, columns):
+    text = text.strip()
+    if ":" in text:
+        name, needle = text.split(":", 1)
+        lowered = [str(column).strip().lower() for column in columns]
+        if name.strip().lower() in lowered:
+            return lowered.index(name.strip().lower()), needle.strip().lower()
+    return None, text.lower()
+
+
+def row_matches(row, column, needle):
+    if not needle:
+        return True
+    if column is not None:
+        return needle in row[column].lower()
+    return any(needle in cell.lower() for cell in row)
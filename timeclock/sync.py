@@ -0,0 +1,421 @@
+# This Python file uses the following encoding: utf-8
+# Keeps the people signed in the same on every kiosk, so someone can sign in at one door and out at another
+#
+# One computer runs the sync server (python -m timeclock sync-server) and each kiosk runs a SyncClient.
+# A kiosk pushes its sign ins/outs as they happen and pulls the ones from the other kiosks. It is one json
+# object per line over TCP, each request gets one reply:
+#   {"op": "hello", "kiosk": name}              -> {"op": "hello", "server": id, "seq": n}
+#   {"op": "push", "events": [...]}             -> {"op": "ack", "uids": [...], "seq": n}
+#   {"op": "pull", "since": n, "limit": m}      -> {"op": "delta", "server": id, "seq": n, "events": [...], "more": ...}
+# The server numbers the events in the order they come in and a kiosk only asks for the ones after the last
+# number it has. When the server doesn't have those any more (or it is a different server, ie it was started
+# over with a fresh log) the reply is {"op": "snapshot", ..., "active": [...], "closed": [...]} with the sign ins
+# that are still open and the last sign out of everyone else instead. The kiosk signs in the people that are
+# missing and signs out the ones that signed out somewhere else while it wasn't getting the events.
+#
+# Events are the journal events plus a "uid" so a push repeated after a dropped connection only counts once,
+# the "kiosk" they came from, the attendance "file" they belong to and the person's name. While the server
+# can't be reached they wait in sync_outbox.jsonl in the export folder and are pushed once it is back.
+
+import asyncio
+import itertools
+import json
+import queue
+import threading
+import uuid
+from collections import OrderedDict, deque
+from pathlib import Path
+
+from timeclock.fileio import write_atomic
+from timeclock.journal import SIGN_IN, GUEST_SIGN_IN
+
+
+SNAPSHOT = "snapshot"
+DEFAULT_PORT = 8765
+MAX_LINE = 4 * 1024 * 1024
+OUTBOX_NAME = "sync_outbox.jsonl"
+STATE_NAME = "sync_state.json"
+
+
+# "host:port" or just "host" -> (host, port)
+def parse_address(address):
+    host, _, port = str(address).strip().rpartition(":")
+    if not host:
+        return port, DEFAULT_PORT
+    return host, int(port)
+
+
+def encode(message):
+    return (json.dumps(message, separators=(',', ':')) + "\n").encode('utf-8')
+
+
+def read_lines(path):
+    lines = []
+    try:
+        with open(path, 'r', encoding='utf-8') as lines_file:
+            for line in lines_file:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    lines.append(json.loads(line))
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return lines
+
+
+class SyncServer:
+    def __init__(self, log_path=None, history=10000, on_message=None):
+        self.log_path = Path(log_path) if log_path is not None else None
+        self.history = history
+        self.on_message = on_message
+        self.server_id = uuid.uuid4().hex
+        self.seq = 0
+        self.events = deque(maxlen=history)     # the latest events, each with its "seq"
+        self.uids = OrderedDict()               # uid -> seq of the events seen, for ignoring repeated pushes
+        self.active = {}                        # ID -> sign in event of everyone signed in at any kiosk
+        self.closed = {}                        # ID -> last sign out event of everyone that isn't
+        self._log = None
+        self._server = None
+
+    def message(self, text):
+        if self.on_message is not None:
+            self.on_message(text)
+
+    # Pick up where the server left off, the log is written back with only what is still needed
+    def load(self):
+        if self.log_path is None:
+            return
+        lines = read_lines(self.log_path)
+        if lines and "server" in lines[0]:
+            self.server_id = lines[0]["server"]
+        for event in lines:
+            if "seq" in event and event["seq"] > self.seq:
+                self.record(event)
+        older = [event for event in itertools.chain(self.active.values(), self.closed.values())
+                 if not self.events or event["seq"] < self.events[0]["seq"]]
+        kept = sorted(itertools.chain(self.events, older), key=lambda event: event["seq"])
+        write_atomic(self.log_path, "".join(encode(line).decode('utf-8')
+                                            for line in [{"server": self.server_id}] + kept))
+        self._log = open(self.log_path, 'a', encoding='utf-8')
+        if self.seq:
+            self.message("Loaded " + str(self.seq) + " events from: " + str(self.log_path))
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    # Methods for the event stream
+    def record(self, event):
+        if self.events and event["seq"] != self.events[-1]["seq"] + 1:
+            # Only the sign ins still open were kept from before the gap, pulls from before it get a snapshot
+            self.events.clear()
+        self.seq = event["seq"]
+        self.events.append(event)
+        self.uids[event["uid"]] = event["seq"]
+        while len(self.uids) > self.history * 4:
+            self.uids.popitem(last=False)
+        id = str(event["id"])
+        if event["type"] in (SIGN_IN, GUEST_SIGN_IN):
+            self.active.setdefault(id, event)
+            self.closed.pop(id, None)
+        else:
+            self.active.pop(id, None)
+            self.closed[id] = event
+
+    # Number and keep the events from a kiosk, returns the uids taken care of (including ones already seen)
+    def push(self, kiosk, events):
+        uids = []
+        added = []
+        for event in events:
+            uid = event.get("uid")
+            if uid is None or "id" not in event or "type" not in event:
+                continue
+            uids.append(uid)
+            if uid in self.uids:
+                continue
+            event = dict(event, seq=self.seq + 1, kiosk=kiosk)
+            self.record(event)
+            added.append(event)
+        if added and self._log is not None:
+            self._log.write("".join(encode(event).decode('utf-8') for event in added))
+            self._log.flush()
+        return uids
+
+    def pull(self, since, limit=500):
+        oldest = self.events[0]["seq"] if self.events else self.seq + 1
+        if since > self.seq or since < oldest - 1:
+            return {"op": "snapshot", "server": self.server_id, "seq": self.seq,
+                    "active": sorted(self.active.values(), key=lambda event: event["seq"]),
+                    "closed": sorted(self.closed.values(), key=lambda event: event["seq"])}
+        start = since - oldest + 1
+        events = list(itertools.islice(self.events, start, start + limit))
+        return {"op": "delta", "server": self.server_id, "seq": self.seq, "events": events,
+                "more": start + len(events) < len(self.events)}
+
+    # The reply to one request, kiosk is the name given in the hello on this connection
+    def answer(self, request, kiosk=None):
+        op = request.get("op")
+        if op == "hello":
+            return {"op": "hello", "server": self.server_id, "seq": self.seq}
+        if op == "push":
+            return {"op": "ack", "uids": self.push(kiosk, request.get("events", [])), "seq": self.seq}
+        if op == "pull":
+            return self.pull(int(request.get("since", 0)), int(request.get("limit", 500)))
+        return {"op": "error", "message": "Unknown request: " + str(op)}
+
+    # Methods for the network side
+    async def handle(self, reader, writer):
+        kiosk = None
+        address = writer.get_extra_info("peername")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if request.get("op") == "hello":
+                        kiosk = str(request.get("kiosk"))
+                        self.message("Kiosk connected: " + kiosk + " " + str(address))
+                    reply = self.answer(request, kiosk)
+                except (ValueError, TypeError, AttributeError) as e:
+                    reply = {"op": "error", "message": "Bad request: " + str(e)}
+                writer.write(encode(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+            if kiosk is not None:
+                self.message("Kiosk disconnected: " + kiosk)
+
+    # Returns the port it is listening on, port 0 picks a free one
+    async def start(self, host="0.0.0.0", port=DEFAULT_PORT):
+        self._server = await asyncio.start_server(self.handle, host, port, limit=MAX_LINE)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def serve(self, host="0.0.0.0", port=DEFAULT_PORT):
+        port = await self.start(host, port)
+        self.message("Sync server listening on " + str(host) + ":" + str(port))
+        async with self._server:
+            await self._server.serve_forever()
+
+
+class SyncClient(threading.Thread):
+    def __init__(self, address, kiosk, folder, on_remote=None, on_status=None, interval=1.0, batch=200,
+                 timeout=5.0, retry_delay=2.0):
+        super().__init__(name="SyncClient " + str(address), daemon=True)
+        self.address = address
+        self.host, self.port = parse_address(address)
+        self.kiosk = kiosk
+        self.outbox_path = Path(folder) / OUTBOX_NAME
+        self.state_path = Path(folder) / STATE_NAME
+        self.on_remote = on_remote      # called when events from the other kiosks are waiting, from the sync thread
+        self.on_status = on_status      # called with status messages for the log, from the sync thread
+        self.interval = interval        # seconds between pulls when nothing is pushed
+        self.batch = batch              # events per push or pull
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        self.online = False
+        self.incoming = queue.Queue()   # events from the other kiosks, drained by whoever owns the engine
+        self._new = queue.Queue()       # events recorded on the engine's thread for the sync thread
+        self._outbox = []               # events the server hasn't acknowledged yet, oldest first
+        self._server_id = None
+        self._seq = 0
+        self._recorded = 0              # local events recorded so far, counted on the engine's thread
+        self._last_local = {}           # ID -> number of the last local event of that person, engine's thread
+        self._taken = 0                 # local events moved to the outbox so far, counted on the sync thread
+        self._stop_event = threading.Event()
+        self._loop = None
+        self._wake = None
+
+    # Called on the engine's thread with each local sign in/out (TimeClockEngine.on_event)
+    def record(self, event):
+        self._recorded += 1
+        self._last_local[str(event["id"])] = self._recorded
+        self._new.put(dict(event, uid=uuid.uuid4().hex, kiosk=self.kiosk))
+        self.wake()
+
+    # Hand back the events from the other kiosks waiting to be applied, oldest first. A snapshot gets the ID's
+    # of the people with local sign ins/outs the server didn't have yet when it was made, those are left alone
+    def drain(self):
+        events = []
+        while True:
+            try:
+                event = self.incoming.get_nowait()
+            except queue.Empty:
+                return events
+            if event.get("type") == SNAPSHOT:
+                event = dict(event, keep=[id for id, number in self._last_local.items() if number > event["covered"]])
+            events.append(event)
+
+    @property
+    def waiting(self):
+        return len(self._outbox) + self._new.qsize()
+
+    def wake(self):
+        loop = self._loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self._wake.set)
+            except RuntimeError:
+                pass
+
+    def stop(self, timeout=2.0):
+        self._stop_event.set()
+        self.wake()
+        if self.is_alive():
+            self.join(timeout)
+
+    def status(self, message):
+        if self.on_status is not None:
+            self.on_status(message)
+
+    # Methods for the outbox and the last event number, kept in the export folder so they survive a restart
+    def load_state(self):
+        self._outbox = read_lines(self.outbox_path)
+        state = read_lines(self.state_path)
+        if state:
+            self._server_id = state[0].get("server")
+            self._seq = int(state[0].get("seq", 0))
+        if self._outbox:
+            self.status(str(len(self._outbox)) + " events waiting to be sent to the sync server")
+
+    def save_state(self):
+        try:
+            write_atomic(self.state_path, json.dumps({"server": self._server_id, "seq": self._seq}))
+        except OSError as e:
+            self.status("Error: Unable to save the sync state: " + str(e))
+
+    def take_new(self):
+        events = []
+        while True:
+            try:
+                events.append(self._new.get_nowait())
+            except queue.Empty:
+                break
+        if not events:
+            return
+        self._taken += len(events)
+        self._outbox += events
+        try:
+            with open(self.outbox_path, 'a', encoding='utf-8') as outbox_file:
+                outbox_file.write("".join(encode(event).decode('utf-8') for event in events))
+        except OSError as e:
+            self.status("Error: Unable to save the sync outbox: " + str(e))
+
+    def save_outbox(self):
+        try:
+            write_atomic(self.outbox_path, "".join(encode(event).decode('utf-8') for event in self._outbox))
+        except OSError as e:
+            self.status("Error: Unable to save the sync outbox: " + str(e))
+
+    # Methods for the sync thread
+    def run(self):
+        asyncio.run(self.main())
+
+    async def main(self):
+        self._wake = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        try:
+            self.load_state()
+        except (OSError, ValueError) as e:
+            self.status("Error: Unable to read the sync outbox: " + str(e))
+        reported_error = False
+        delay = self.retry_delay
+        while not self._stop_event.is_set():
+            self.take_new()
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port, limit=MAX_LINE), self.timeout)
+            except (OSError, asyncio.TimeoutError):
+                if not reported_error:
+                    self.status("Can't reach the sync server " + str(self.address) + ", working offline")
+                    reported_error = True
+                await self.wait(delay)
+                delay = min(delay * 2, 30.0)
+                continue
+            try:
+                delay = self.retry_delay
+                reported_error = False
+                await self.session(reader, writer)
+            except (OSError, asyncio.TimeoutError, ValueError, KeyError, TypeError) as e:
+                self.status("Lost the sync server, working offline (" + str(self.waiting) + " events waiting): " +
+                            str(e))
+                reported_error = True
+            finally:
+                self.online = False
+                writer.close()
+            if not self._stop_event.is_set():
+                await self.wait(delay)
+        self._loop = None
+
+    async def session(self, reader, writer):
+        hello = await self.request(reader, writer, {"op": "hello", "kiosk": self.kiosk})
+        if hello["server"] != self._server_id:
+            # A different server, or the same one started over, so start from its beginning
+            self._server_id = hello["server"]
+            self._seq = 0
+        self.online = True
+        self.status("Connected to the sync server " + str(self.address) + " as " + str(self.kiosk))
+        while not self._stop_event.is_set():
+            self.take_new()
+            while self._outbox:
+                batch = self._outbox[:self.batch]
+                reply = await self.request(reader, writer, {"op": "push", "events": batch})
+                acked = set(reply["uids"])
+                self._outbox = [event for event in self._outbox if event["uid"] not in acked]
+                self.save_outbox()
+                if not acked:
+                    raise ValueError("the server took none of the events")
+            more = True
+            while more:
+                reply = await self.request(reader, writer, {"op": "pull", "since": self._seq, "limit": self.batch})
+                more = self.receive(reply)
+            await self.wait(self.interval)
+
+    async def request(self, reader, writer, message):
+        writer.write(encode(message))
+        await writer.drain()
+        line = await asyncio.wait_for(reader.readline(), self.timeout)
+        if not line:
+            raise ConnectionError("the server closed the connection")
+        reply = json.loads(line)
+        if reply.get("op") == "error":
+            raise ValueError(reply.get("message"))
+        return reply
+
+    # Queue the events from the other kiosks, returns True if there are more to pull. A snapshot is queued as
+    # a whole, along with how many local events it takes in: everything taken before the pull was pushed
+    def receive(self, reply):
+        if reply["op"] == "snapshot":
+            self._seq = reply["seq"]
+            self.save_state()
+            self.incoming.put({"type": SNAPSHOT, "active": reply["active"], "closed": reply.get("closed", []),
+                               "covered": self._taken})
+            if self.on_remote is not None:
+                self.on_remote()
+            return False
+        events, more = reply["events"], reply["more"]
+        self._seq = events[-1]["seq"] if events else reply["seq"]
+        remote = [event for event in events if event.get("kiosk") != self.kiosk]
+        for event in remote:
+            self.incoming.put(event)
+        if events:
+            self.save_state()
+        if remote and self.on_remote is not None:
+            self.on_remote()
+        return more
+
+    async def wait(self, seconds):
+        try:
+            await asyncio.wait_for(self._wake.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        self._wake.clear()
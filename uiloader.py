@@ -0,0 +1,71 @@
+# This Python file uses the following encoding: utf-8
+# Builds the widgets from form.ui at runtime, only used when there is no ui_form.py compiled with
+# pyside2-uic (or it is older than form.ui) since parsing the xml is slow
+
+from PySide2.QtCore import QMetaObject
+from PySide2.QtUiTools import QUiLoader
+
+
+# Loader for loading in the UI file
+# UiLoader from https://gist.github.com/cpbotha/1b42a20c8f3eb9bb7cb8
+class UiLoader(QUiLoader):
+    """
+    Subclass :class:`~PySide.QtUiTools.QUiLoader` to create the user interface
+    in a base instance.
+    Unlike :class:`~PySide.QtUiTools.QUiLoader` itself this class does not
+    create a new instance of the top-level widget, but creates the user
+    interface in an existing instance of the top-level class.
+    This mimics the behaviour of :func:`PyQt4.uic.loadUi`.
+    """
+
+    def __init__(self, baseinstance, customWidgets=None):
+        QUiLoader.__init__(self, baseinstance)
+        self.baseinstance = baseinstance
+        self.customWidgets = customWidgets
+
+    def createWidget(self, class_name, parent=None, name=''):
+        """
+        Function that is called for each widget defined in ui file,
+        overridden here to populate baseinstance instead.
+        """
+        if parent is None and self.baseinstance:
+            # supposed to create the top-level widget, return the base instance
+            # instead
+            return self.baseinstance
+
+        else:
+            if class_name in self.availableWidgets():
+                # create a new widget for child widgets
+                widget = QUiLoader.createWidget(self, class_name, parent, name)
+
+            else:
+                # if not in the list of availableWidgets, must be a custom widget
+                # this will raise KeyError if the user has not supplied the
+                # relevant class_name in the dictionary, or TypeError, if
+                # customWidgets is None
+                try:
+                    widget = self.customWidgets[class_name](parent)
+
+                except (TypeError, KeyError) as e:
+                    raise Exception('No custom widget ' + class_name + ' found in customWidgets param of UiLoader __init__.')
+
+            if self.baseinstance:
+                # set an attribute for the new child widget on the base
+                # instance, just like PyQt4.uic.loadUi does.
+                setattr(self.baseinstance, name, widget)
+
+                # this outputs the various widget names, e.g.
+                # sampleGraphicsView, dockWidget, samplesTableView etc.
+                #print(name)
+
+            return widget
+
+def loadUi(uifile, baseinstance=None, customWidgets=None, workingDirectory=None):
+    loader = UiLoader(baseinstance, customWidgets)
+
+    if workingDirectory is not None:
+        loader.setWorkingDirectory(workingDirectory)
+
+    widget = loader.load(uifile)
+    QMetaObject.connectSlotsByName(widget)
+    return widget